@@ -0,0 +1,190 @@
+import time
+import asyncio
+import argparse
+import logging
+import contextlib
+import tracemalloc
+
+from sqlalchemy import event, text
+from fake_telethon import FakeChannel, FakeTelegramClient
+from bench_parser import generate_corpus
+import worker
+
+# ==============================
+# 1. أدوات القياس
+# ==============================
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "after_cursor_execute", self._count)
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+class Phase:
+    """قياس مرحلة واحدة: الزمن، عدد الاستعلامات، وذروة الذاكرة."""
+    def __init__(self, name, counter, trace_memory):
+        self.name = name
+        self.counter = counter
+        self.trace_memory = trace_memory
+
+    def __enter__(self):
+        self.statements_before = self.counter.count
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.statements = self.counter.count - self.statements_before
+        self.peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+
+    def report(self, messages):
+        rate = messages / self.elapsed if self.elapsed else 0
+        per_message = self.statements / messages if messages else 0
+        peak = f"{self.peak / 1024 / 1024:.1f} MiB" if self.peak is not None else "غير مقاسة"
+        print(
+            f"   {self.name:<14} {messages:>8} رسالة  {self.elapsed:>8.2f} ث  "
+            f"{rate:>10,.0f} رسالة/ث  {per_message:>6.2f} استعلام/رسالة  ذروة {peak}"
+        )
+
+@contextlib.contextmanager
+def quiet_logs(level=logging.ERROR):
+    root = logging.getLogger()
+    previous = root.level
+    root.setLevel(level)
+    try:
+        yield
+    finally:
+        root.setLevel(previous)
+
+# ==============================
+# 2. المراحل
+# ==============================
+async def bench_import(client, channel, counter, trace_memory):
+    with Phase("import", counter, trace_memory) as phase:
+        await worker.import_channel_history(client, channel)
+    return phase, len(client.channels[channel.id]["messages"])
+
+async def bench_live(client, channel, captions, counter, trace_memory):
+    """تشغيل monitor_channels الحقيقي على العميل الوهمي وتوزيع الرسائل كأحداث NewMessage."""
+    worker.CHANNEL_LIST = [f"@{channel.username}"]
+    worker.IMPORT_HISTORY = False
+    worker.CHECK_DELETED_MESSAGES = False
+    # نسخة وحيدة تملك كل القنوات: بدون ذلك قد تأخذ نسخة أخرى على نفس القاعدة القيادة فتُتجاهل الرسائل
+    worker.LEADER_ELECTION = False
+    worker.CHANNEL_SHARDING = False
+    worker.InstrumentedTelegramClient = lambda *args, **kwargs: client
+
+    monitor_task = asyncio.create_task(worker.monitor_channels())
+    while not client.handlers:
+        if monitor_task.done():
+            # فشل monitor_channels قبل تسجيل المعالجات؛ نعيد الاستثناء
+            await monitor_task
+            raise RuntimeError("انتهت monitor_channels قبل تسجيل معالجات الأحداث.")
+        await asyncio.sleep(0.01)
+
+    messages = [client.post_message(channel, caption) for caption in captions]
+    with Phase("live", counter, trace_memory) as phase:
+        for message in messages:
+            await client.dispatch_new_message(message)
+
+    await client.disconnect()
+    await monitor_task
+    stored = count_stored_messages(f"@{channel.username}")
+    if stored != len(messages):
+        raise RuntimeError(f"خُزنت {stored} من {len(messages)} رسالة مباشرة فقط، قياس live غير صالح.")
+    return phase, len(messages)
+
+async def bench_reconcile(client, channel, delete_fraction, counter, trace_memory):
+    stored = sorted(client.channels[channel.id]["messages"])[-1000:]
+    step = max(1, int(1 / delete_fraction)) if delete_fraction else 0
+    deleted = stored[::step] if step else []
+    client.delete_messages(channel, deleted)
+    with Phase("reconcile", counter, trace_memory) as phase:
+        await worker.check_deleted_messages(client, channel)
+    return phase, len(stored)
+
+def count_stored_messages(channel_key):
+    """عدد رسائل القناة المخزنة كحلقات أو كرسائل غير محللة (كل رسالة تنتهي في أحدهما)."""
+    with worker.engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT (SELECT COUNT(*) FROM episodes WHERE telegram_channel_id = :channel)
+                 + (SELECT COUNT(*) FROM unparsed_messages WHERE telegram_channel_id = :channel)
+        """), {"channel": channel_key}).scalar()
+
+def cleanup(channel_keys, channel_ids):
+    """حذف كل ما أضافه القياس: الحلقات وإشعاراتها، والمحتويات التي لم يعد لها حلقات، ونقاط التقدم،
+    والرسائل غير المحللة (حتى لا يعالجها أمر reparse لاحقاً)، وذاكرة كيانات القنوات."""
+    with worker.engine.begin() as conn:
+        series_ids = [row[0] for row in conn.execute(text("""
+            SELECT DISTINCT series_id FROM episodes WHERE telegram_channel_id = ANY(:channels)
+        """), {"channels": channel_keys})]
+        conn.execute(text("""
+            DELETE FROM notification_outbox
+            WHERE episode_id IN (SELECT id FROM episodes WHERE telegram_channel_id = ANY(:channels))
+        """), {"channels": channel_keys})
+        conn.execute(text("DELETE FROM episodes WHERE telegram_channel_id = ANY(:channels)"), {"channels": channel_keys})
+        conn.execute(text("DELETE FROM channel_checkpoints WHERE telegram_channel_id = ANY(:channels)"), {"channels": channel_keys})
+        conn.execute(text("DELETE FROM unparsed_messages WHERE telegram_channel_id = ANY(:channels)"), {"channels": channel_keys})
+        conn.execute(text("DELETE FROM channel_entities WHERE channel_id = ANY(:ids)"), {"ids": channel_ids})
+        if series_ids:
+            conn.execute(text("""
+                DELETE FROM series
+                WHERE id = ANY(:ids) AND NOT EXISTS (SELECT 1 FROM episodes WHERE series_id = series.id)
+            """), {"ids": series_ids})
+    print("🧹 تم حذف بيانات القياس.")
+
+async def run(args):
+    run_id = int(time.time())
+    client = FakeTelegramClient()
+    history_channel = client.add_channel(
+        FakeChannel(9_000_001, "Bench History", f"bench_history_{run_id}"),
+        generate_corpus(args.messages, args.seed)
+    )
+    live_channel = client.add_channel(FakeChannel(9_000_002, "Bench Live", f"bench_live_{run_id}"), [])
+    worker.init_database()
+    counter = StatementCounter(worker.engine)
+
+    print(f"📊 قياس الاستيراد ({args.messages:,} رسالة في القناة الاصطناعية)...")
+    if args.memory:
+        tracemalloc.start()
+    try:
+        # سجلات الـ Worker لكل دفعة تُرفع لمستوى ERROR حتى لا تطغى على القياس
+        with quiet_logs():
+            results = [
+                await bench_import(client, history_channel, counter, args.memory),
+                await bench_live(client, live_channel, generate_corpus(args.live_messages, args.seed + 1),
+                                 counter, args.memory),
+                await bench_reconcile(client, history_channel, args.delete_fraction, counter, args.memory),
+            ]
+    finally:
+        if args.memory:
+            tracemalloc.stop()
+        if args.cleanup:
+            cleanup([f"@{history_channel.username}", f"@{live_channel.username}"],
+                    [history_channel.id, live_channel.id])
+
+    print("=" * 100)
+    for phase, messages in results:
+        phase.report(messages)
+    print(f"📡 استدعاءات العميل الوهمي: {client.calls}")
+
+# ==============================
+# 3. نقطة دخول البرنامج
+# ==============================
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء الاستيراد والمراقبة والتحقق من المحذوفات بعميل Telethon وهمي")
+    parser.add_argument("--messages", type=int, default=5000, help="حجم قناة التاريخ الاصطناعية")
+    parser.add_argument("--live-messages", type=int, default=2000, help="عدد الرسائل الموزعة كأحداث مباشرة")
+    parser.add_argument("--delete-fraction", type=float, default=0.05, help="نسبة الرسائل المحذوفة قبل التحقق")
+    parser.add_argument("--memory", action=argparse.BooleanOptionalAction, default=True,
+                        help="قياس ذروة الذاكرة عبر tracemalloc (يبطئ التنفيذ)")
+    parser.add_argument("--cleanup", action=argparse.BooleanOptionalAction, default=True,
+                        help="حذف بيانات القياس بعد الانتهاء")
+    parser.add_argument("--seed", type=int, default=1234)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import re
+import gc
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from caption_parser import clean_name, parse_content_info
+
+# ==============================
+# 1. توليد نصوص واقعية (عربية ومختلطة)
+# ==============================
+ARABIC_WORDS = [
+    "التفاح", "الحرام", "قيامة", "أرطغرل", "الهيبة", "باب", "الحارة", "وادي", "الذئاب",
+    "العشق", "الممنوع", "حريم", "السلطان", "ليالي", "الحلمية", "المؤسس", "عثمان",
+    "الأسطورة", "نسل", "الأغراب", "يوم", "جعفر", "العمدة", "الاختيار", "الكبير", "أوي",
+]
+LATIN_WORDS = [
+    "Breaking", "Bad", "Dark", "Money", "Heist", "Avatar", "Joker", "Vikings", "Ozark",
+    "Lost", "Dune", "The", "Crown", "Squid", "Game",
+]
+NOISE_WORDS = ["🔥", "HD", "1080p", "مترجم", "مدبلج", "حصرياً", "|", "#جديد", "كامل", "بجودة"]
+SEPARATORS = [" ", "  ", "-", "_", "\t", " - "]
+
+def random_name(rng):
+    pool = ARABIC_WORDS if rng.random() < 0.75 else ARABIC_WORDS + LATIN_WORDS
+    return " ".join(rng.choices(pool, k=rng.randint(1, 4)))
+
+def random_caption(rng):
+    """نص رسالة يشبه ما يُنشر في القنوات (حوالي 90% منها أنماط معروفة)."""
+    roll = rng.random()
+    name = random_name(rng)
+    if roll < 0.25:
+        caption = f"مسلسل {name} الموسم {rng.randint(1, 12)} الحلقة {rng.randint(1, 250)}"
+    elif roll < 0.40:
+        caption = f"{name} الموسم {rng.randint(1, 12)} الحلقة {rng.randint(1, 250)}"
+    elif roll < 0.55:
+        caption = f"{name} الحلقة {rng.randint(1, 250)}"
+    elif roll < 0.62:
+        caption = f"مسلسل {name} الحلقة {rng.randint(1, 250)}"
+    elif roll < 0.70:
+        caption = f"فيلم {name} {rng.randint(1, 5)}"
+    elif roll < 0.76:
+        caption = f"فيلم {name}{rng.choice('-_')}{rng.randint(1, 5)}"
+    elif roll < 0.82:
+        caption = f"فيلم {name}"
+    elif roll < 0.90:
+        caption = f"{name} {rng.randint(1, 300)}"
+    else:
+        caption = " ".join(rng.choices(ARABIC_WORDS + NOISE_WORDS, k=rng.randint(2, 8)))
+    if rng.random() < 0.1:
+        caption = f"  {caption}\n"
+    return caption
+
+def generate_corpus(count, seed):
+    rng = random.Random(seed)
+    return [random_caption(rng) for _ in range(count)]
+
+# ==============================
+# 2. قياس الأداء
+# ==============================
+def bench_throughput(func, count, chunk_size, seed):
+    """قياس عدد النصوص في الثانية على دفعات (توليد الدفعة خارج التوقيت لتبقى الذاكرة محدودة)."""
+    total_elapsed = 0.0
+    processed = 0
+    chunk_seed = seed
+    while processed < count:
+        chunk = generate_corpus(min(chunk_size, count - processed), chunk_seed)
+        chunk_seed += 1
+        start = time.perf_counter()
+        for caption in chunk:
+            func(caption)
+        total_elapsed += time.perf_counter() - start
+        processed += len(chunk)
+    return processed / total_elapsed if total_elapsed else 0.0, total_elapsed
+
+def bench_allocations(func, sample_size, seed):
+    """عدد الكتل المحجوزة وذروة الذاكرة لكل نص على عينة (tracemalloc بطيء لذا نستخدم عينة صغيرة)."""
+    corpus = generate_corpus(sample_size, seed)
+    gc.collect()
+    collections_before = sum(stat["collections"] for stat in gc.get_stats())
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    results = [func(caption) for caption in corpus]
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - collections_before
+
+    stats = snapshot_after.compare_to(snapshot_before, "filename")
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    del results
+    return {
+        "live_blocks_per_caption": blocks / sample_size,
+        "peak_bytes_per_caption": peak / sample_size,
+        "gc_collections": collections,
+    }
+
+def run_benchmark(count, chunk_size, sample_size, seed):
+    print(f"📊 قياس أداء المحلل على {count:,} نص (دفعات من {chunk_size:,})...")
+    parse_rate, parse_elapsed = bench_throughput(parse_content_info, count, chunk_size, seed)
+    print(f"   parse_content_info: {parse_rate:,.0f} نص/ثانية ({parse_elapsed:.2f} ثانية)")
+
+    name_rate, name_elapsed = bench_throughput(clean_name, count, chunk_size, seed)
+    print(f"   clean_name:         {name_rate:,.0f} نص/ثانية ({name_elapsed:.2f} ثانية)")
+
+    for label, func in (("parse_content_info", parse_content_info), ("clean_name", clean_name)):
+        allocations = bench_allocations(func, sample_size, seed)
+        print(
+            f"   {label}: {allocations['live_blocks_per_caption']:.2f} كتلة حية/نص، "
+            f"ذروة {allocations['peak_bytes_per_caption']:.0f} بايت/نص، "
+            f"{allocations['gc_collections']} دورة gc (عينة {sample_size:,})"
+        )
+
+# ==============================
+# 3. اختبار عشوائي يثبت سلوك التصنيف الحالي
+# ==============================
+# نسخة مجمدة من المحلل كما هو حالياً: أي تحسين لأداء caption_parser يجب أن يعطي نفس النتائج تماماً.
+# عند تغيير السلوك عمداً، حدّث هذه النسخة في نفس التعديل.
+def _reference_clean_name(name):
+    if not name:
+        return name
+    name = re.sub(r'^(مسلسل\s+|فيلم\s+)', '', name, flags=re.IGNORECASE)
+    name = re.sub(r'\s+(مسلسل|فيلم)\s+', ' ', name, flags=re.IGNORECASE)
+    return re.sub(r'\s+', ' ', name).strip()
+
+def _reference_extract_number(name):
+    match = re.search(r'[-_]?(\d+)$', name)
+    return int(match.group(1)) if match else None
+
+def _reference_movie_without_number(raw_name):
+    extracted_num = _reference_extract_number(raw_name)
+    if extracted_num:
+        raw_name = re.sub(r'[-_]?\d+$', '', raw_name).strip()
+        season_num = extracted_num
+    else:
+        season_num = 1
+    return _reference_clean_name(raw_name), 'movie', season_num, 1
+
+def _reference_parse_content_info(message_text):
+    if not message_text:
+        return None, None, None, None
+    text_cleaned = message_text.strip()
+
+    for pattern in (r'^فيلم\s+(.+?)[-_](\d+)$', r'^فيلم\s+(.+?)\s+(\d+)$'):
+        match = re.search(pattern, text_cleaned, re.IGNORECASE)
+        if match:
+            return _reference_clean_name(match.group(1).strip()), 'movie', int(match.group(2)), 1
+
+    match = re.search(r'^فيلم\s+(.+)$', text_cleaned, re.IGNORECASE)
+    if match:
+        return _reference_movie_without_number(match.group(1).strip())
+
+    match = re.search(r'^(.*?)\s+الموسم\s+(\d+)\s+الحلقة\s+(\d+)$', text_cleaned)
+    if match:
+        return _reference_clean_name(match.group(1).strip()), 'series', int(match.group(2)), int(match.group(3))
+
+    match = re.search(r'^(.*?)\s+الحلقة\s+(\d+)$', text_cleaned)
+    if match:
+        return _reference_clean_name(match.group(1).strip()), 'series', 1, int(match.group(2))
+
+    match = re.search(r'^(.*?[^\d\s])\s+(\d+)$', text_cleaned)
+    if match:
+        raw_name = match.group(1).strip()
+        if 'فيلم' in raw_name.lower():
+            return _reference_clean_name(raw_name), 'movie', int(match.group(2)), 1
+        return _reference_clean_name(raw_name), 'series', 1, int(match.group(2))
+
+    match = re.search(r'^مسلسل\s+(.*?)\s+الموسم\s+(\d+)\s+الحلقة\s+(\d+)$', text_cleaned, re.IGNORECASE)
+    if match:
+        return _reference_clean_name(match.group(1).strip()), 'series', int(match.group(2)), int(match.group(3))
+
+    match = re.search(r'^مسلسل\s+(.*?)\s+الحلقة\s+(\d+)$', text_cleaned, re.IGNORECASE)
+    if match:
+        return _reference_clean_name(match.group(1).strip()), 'series', 1, int(match.group(2))
+
+    if text_cleaned.lower().startswith('فيلم'):
+        return _reference_movie_without_number(text_cleaned[4:].strip())
+
+    return None, None, None, None
+
+FUZZ_TOKENS = [
+    "مسلسل", "فيلم", "الموسم", "الحلقة", "فيلمي", "المسلسل", "Film", "FILM",
+    "ـ", "َ", "‏", "٣", "١٢", "0", "007", "12", "-", "_", "--", "__",
+] + ARABIC_WORDS[:8] + LATIN_WORDS[:5] + NOISE_WORDS[:4]
+FUZZ_ALPHABET = "مسلفيمحقةو ابتـ-_0123456789٠١٢٣ \t\nABCxyz🔥"
+
+def random_fuzz_caption(rng):
+    """نص عشوائي: إما نص واقعي، أو خليط من الكلمات المفتاحية والأرقام والفواصل، أو أحرف عشوائية."""
+    roll = rng.random()
+    if roll < 0.3:
+        return random_caption(rng)
+    if roll < 0.85:
+        tokens = rng.choices(FUZZ_TOKENS, k=rng.randint(0, 7))
+        return "".join(token + rng.choice(SEPARATORS) for token in tokens).rstrip(rng.choice(["", " "]))
+    return "".join(rng.choices(FUZZ_ALPHABET, k=rng.randint(0, 40)))
+
+def check_case(caption):
+    """التحقق من خصائص النتيجة ومطابقتها للنسخة المجمدة؛ يعيد وصف الخطأ أو None."""
+    result = parse_content_info(caption)
+    if not isinstance(result, tuple) or len(result) != 4:
+        return f"نتيجة غير صالحة: {result!r}"
+    name, content_type, season_num, episode_num = result
+    if content_type is not None:
+        if content_type not in ('series', 'movie'):
+            return f"نوع غير معروف: {content_type!r}"
+        if not isinstance(season_num, int) or not isinstance(episode_num, int):
+            return f"أرقام غير صحيحة: {result!r}"
+        if content_type == 'movie' and episode_num != 1:
+            return f"فيلم برقم حلقة {episode_num}"
+    expected = _reference_parse_content_info(caption)
+    if result != expected:
+        return f"تغير التصنيف: {result!r} بدلاً من {expected!r}"
+
+    cleaned = clean_name(caption)
+    if cleaned != _reference_clean_name(caption):
+        return f"تغير clean_name: {cleaned!r}"
+    if cleaned and (cleaned != cleaned.strip() or "  " in cleaned):
+        return f"clean_name ترك مسافات زائدة: {cleaned!r}"
+    return None
+
+def run_fuzz(cases, seed):
+    print(f"🧪 اختبار عشوائي لـ {cases:,} نص (seed={seed})...")
+    rng = random.Random(seed)
+    failures = 0
+    for index in range(cases):
+        caption = random_fuzz_caption(rng)
+        error = check_case(caption)
+        if error:
+            failures += 1
+            if failures <= 10:
+                print(f"   ❌ الحالة {index}: {caption!r}: {error}", file=sys.stderr)
+    if failures:
+        print(f"❌ فشلت {failures} حالة من {cases:,}.")
+        return False
+    print("✅ جميع الحالات مطابقة للسلوك الحالي.")
+    return True
+
+# ==============================
+# 4. نقطة دخول البرنامج
+# ==============================
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء واختبار عشوائي لمحلل نصوص القنوات")
+    parser.add_argument("--count", type=int, default=1_000_000, help="عدد النصوص في قياس السرعة")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="حجم الدفعة المولدة في الذاكرة")
+    parser.add_argument("--alloc-sample", type=int, default=20_000, help="حجم عينة قياس الذاكرة")
+    parser.add_argument("--fuzz", type=int, default=200_000, help="عدد حالات الاختبار العشوائي (0 للتعطيل)")
+    parser.add_argument("--fuzz-only", action="store_true", help="تشغيل الاختبار العشوائي فقط")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    ok = True
+    if args.fuzz:
+        ok = run_fuzz(args.fuzz, args.seed)
+    if not args.fuzz_only:
+        run_benchmark(args.count, args.chunk_size, args.alloc_sample, args.seed)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
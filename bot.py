@@ -1,28 +1,55 @@
 import os
+import time
 import logging
 import asyncio
+import threading
+from urllib.parse import quote
+from contextlib import contextmanager
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
     ContextTypes
 )
+from telegram.request import HTTPXRequest
+from telegram.error import BadRequest, TelegramError
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from config import Config
+from sql_monitor import (
+    flush_stats, handler_scope, load_summary, reset_stats, tag_handler,
+    instrument_engine as instrument_sql
+)
+from metrics import (
+    HANDLER_LATENCY, TELEGRAM_API_LATENCY,
+    instrument_engine, route_label, start_metrics_server, track_latency
+)
+from profiling import PROFILER, profiled
+from coalescing import coalesced, tap_debouncer
+from notifications import NotificationSender
+from latest_feed import LatestFeed
 
 # ==============================
 # 1. الإعدادات والتكوين
 # ==============================
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
 DATABASE_URL = os.environ.get("DATABASE_URL", "")
-
-if not BOT_TOKEN:
-    print("❌ خطأ: BOT_TOKEN غير موجود في متغيرات البيئة!")
-    exit(1)
-
-if not DATABASE_URL:
-    print("⚠️ تحذير: DATABASE_URL غير موجود. قد لا تعرض المحتويات.")
+# نسخة قراءة اختيارية (Read Replica) لاستعلامات التصفح والبحث
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL", "")
+# نافذة (بالثواني) تُوجَّه فيها القراءات للقاعدة الرئيسية بعد إضافة حلقة جديدة لم تصل لنسخة القراءة بعد (0 = معطلة)
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "0"))
+# منفذ نقطة /metrics لـ Prometheus (0 = معطلة)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# الفاصل الزمني لحفظ إحصائيات الاستعلامات في قاعدة البيانات
+SQL_STATS_FLUSH_SECONDS = int(os.environ.get("SQL_STATS_FLUSH_SECONDS", "60"))
+# الفاصل الزمني لتحديث لقطة إحصائيات قاعدة البيانات (أمر /test وزر الاختبار)
+DB_STATS_REFRESH_SECONDS = int(os.environ.get("DB_STATS_REFRESH_SECONDS", "300"))
+# أقصى عدد من التحديثات التي تُعالج بالتوازي (تحديثات المحادثة الواحدة تبقى بالترتيب)
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", "64"))
 
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+if DATABASE_READ_URL.startswith("postgres://"):
+    DATABASE_READ_URL = DATABASE_READ_URL.replace("postgres://", "postgresql://", 1)
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -30,40 +57,182 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# المحركات تُنشأ عند التشغيل عبر init_database() وليس عند الاستيراد
 engine = None
-if DATABASE_URL:
+read_engine = None
+# يصبح True بعد تهيئة التطبيق وتشغيل المهام الخلفية (نقطة /ready)
+app_ready = False
+
+def init_database():
+    """إنشاء محركات قاعدة البيانات بدون فتح اتصال؛ الاتصال الأول يحدث عند أول استعلام
+    (pool_pre_ping يعيد الاتصال تلقائياً إذا كانت القاعدة غير متاحة عند التشغيل)."""
+    global engine, read_engine
+    if engine is not None or not DATABASE_URL:
+        return engine
+    engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=300)
+    instrument_engine(engine, "primary")
+    instrument_sql(engine)
+    if DATABASE_READ_URL:
+        read_engine = create_engine(DATABASE_READ_URL, pool_pre_ping=True, pool_recycle=300)
+        instrument_engine(read_engine, "replica")
+        instrument_sql(read_engine)
+    return engine
+
+def check_database():
+    """فحص الاتصال بالقاعدة الرئيسية: (نجاح، وصف)."""
+    if engine is None:
+        return False, "DATABASE_URL غير موجود"
     try:
-        engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=300)
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
-        print("✅ تم الاتصال بقاعدة البيانات بنجاح.")
-
-        with engine.connect() as conn:
-            series_count = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'series'")).scalar()
-            movies_count = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'movie'")).scalar()
-            print(f"📊 في الاختبار المبدئي:")
-            print(f"   - عدد المسلسلات: {series_count}")
-            print(f"   - عدد الأفلام: {movies_count}")
-
-        try:
-            with engine.begin() as conn:
-                conn.execute(text("CREATE INDEX IF NOT EXISTS idx_episodes_series_season ON episodes(series_id, season, episode_number)"))
-                print("✅ تم إنشاء/التحقق من فهرس idx_episodes_series_season.")
-        except Exception as e:
-            print(f"⚠️ ملاحظة حول إنشاء الفهرس: {e}")
-
+        return True, "ok"
     except Exception as e:
-        print(f"❌ فشل الاتصال بقاعدة البيانات: {e}")
-        engine = None
+        return False, f"قاعدة البيانات غير متاحة: {e}"
+
+def readiness():
+    """جاهزية البوت لنقطة /ready: التطبيق يعمل والقاعدة متاحة (إن وُجدت)."""
+    if not app_ready:
+        return False, "البوت قيد التهيئة"
+    if engine is None:
+        return True, "ok (بدون قاعدة بيانات)"
+    return check_database()
 
 # ==============================
 # 2. دوال المساعدة
 # ==============================
-async def get_all_content(content_type=None):
+class InstrumentedRequest(HTTPXRequest):
+    """طبقة HTTP للبوت تقيس زمن كل استدعاء لـ Telegram API."""
+    async def do_request(self, url, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            TELEGRAM_API_LATENCY.labels(url.rsplit('/', 1)[-1]).observe(time.perf_counter() - start)
+
+# حالة تأخر نسخة القراءة (تُحدَّث من خيوط to_thread، لذا يحميها قفل)
+_replica_lag_lock = threading.Lock()
+_replica_lag_checked_at = 0.0
+_replica_is_behind = False
+
+def check_replica_behind():
+    """هل تنقص نسخة القراءة حلقة أُضيفت للقاعدة الرئيسية خلال نافذة القراءة بعد الكتابة؟
+    تُقارن آخر معرف حلقة في القاعدتين، فالإضافات التي وصلت للنسخة لا توجه القراءات للرئيسية."""
+    try:
+        with engine.connect() as conn:
+            newest = conn.execute(text("""
+                SELECT id, EXTRACT(EPOCH FROM (LOCALTIMESTAMP - added_at))
+                FROM episodes ORDER BY id DESC LIMIT 1
+            """)).first()
+        if newest is None or newest[1] is None or newest[1] >= READ_YOUR_WRITES_SECONDS:
+            return False
+        with read_engine.connect() as conn:
+            replica_max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM episodes")).scalar()
+        return replica_max_id < newest[0]
+    except Exception as e:
+        logger.warning(f"تعذر فحص تأخر نسخة القراءة: {e}")
+        return True
+
+def replica_is_behind():
+    """حالة تأخر نسخة القراءة المخزنة مؤقتاً (تُفحص مرة كل ثانيتين على الأكثر، بخيط واحد في كل مرة)."""
+    global _replica_lag_checked_at, _replica_is_behind
+    now = time.monotonic()
+    with _replica_lag_lock:
+        if now - _replica_lag_checked_at < 2:
+            return _replica_is_behind
+        _replica_lag_checked_at = now
+    behind = check_replica_behind()
+    with _replica_lag_lock:
+        _replica_is_behind = behind
+    return behind
+
+def get_read_engine():
+    """اختيار محرك القراءة: نسخة القراءة إن وجدت، إلا إذا كانت متأخرة عن إضافة حديثة في القاعدة الرئيسية."""
+    if read_engine is None:
+        return engine
+    if READ_YOUR_WRITES_SECONDS > 0 and replica_is_behind():
+        return engine
+    return read_engine
+
+def deep_link(context: ContextTypes.DEFAULT_TYPE, payload):
+    """رابط t.me يفتح البوت مباشرة على المحتوى أو الحلقة: s_<id> أو e_<id> أو m_<القناة>_<msg_id>"""
+    return f"https://t.me/{context.bot.username}?start={payload}"
+
+def channel_post_link(channel_id, msg_id):
+    """رابط المنشور في القناة: t.me/<username> للعامة، و t.me/c/<id> للخاصة بالمعرف الداخلي (بدون البادئة -100)."""
+    if channel_id.startswith('@'):
+        return f"https://t.me/{channel_id[1:]}/{msg_id}"
+    internal_id = channel_id[4:] if channel_id.startswith('-100') else channel_id.lstrip('-')
+    return f"https://t.me/c/{internal_id}/{msg_id}"
+
+def channel_chat_id(channel_id):
+    """معرف القناة بصيغة Bot API (@username أو -100<id>) من المعرف المخزن في قاعدة البيانات."""
+    if channel_id.startswith('@') or channel_id.startswith('-'):
+        return channel_id
+    return f"-100{channel_id}"
+
+def share_button(context: ContextTypes.DEFAULT_TYPE, payload, title):
+    link = deep_link(context, payload)
+    return InlineKeyboardButton("🔗 مشاركة", url=f"https://t.me/share/url?url={quote(link)}&text={quote(title)}")
+
+async def open_deep_link(update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+    """فتح العرض المطلوب مباشرة بدلاً من المرور بالقوائم. يُرجع False إذا لم يكن الرابط معروفاً."""
+    kind, _, value = payload.partition('_')
+    if kind == 's' and value.isdigit():
+        await show_content_details(update, context, int(value), 1)
+        return True
+    if kind == 'e' and value.isdigit():
+        await show_episode_details(update, context, int(value))
+        return True
+    if kind == 'm':
+        channel_key, _, msg_id = value.rpartition('_')
+        if channel_key and msg_id.isdigit():
+            episode_id = await find_episode_by_channel_message(channel_key, int(msg_id))
+            if episode_id:
+                await show_episode_details(update, context, episode_id)
+            else:
+                await update.message.reply_text("❌ هذه الحلقة غير موجودة في الفهرس بعد.")
+            return True
+    return False
+
+async def reply_or_edit(update: Update, message_text, **kwargs):
+    """تعديل الرسالة عند الضغط على زر، أو إرسال رسالة جديدة عند الوصول برابط مباشر (/start)."""
+    if update.callback_query:
+        return await update.callback_query.edit_message_text(message_text, **kwargs)
+    return await update.effective_message.reply_text(message_text, **kwargs)
+
+def is_not_modified(error):
+    """خطأ Telegram عند تعديل رسالة بنفس محتواها الحالي (ضغط مزدوج أو طلبات متزامنة)."""
+    return isinstance(error, BadRequest) and "not modified" in str(error).lower()
+
+@contextmanager
+def read_connection():
+    """اتصال للاستعلامات القرائية مع الرجوع للقاعدة الرئيسية إذا تعذر الوصول لنسخة القراءة."""
+    target = get_read_engine()
+    try:
+        conn = target.connect()
+    except OperationalError as e:
+        if target is engine:
+            raise
+        logger.warning(f"نسخة القراءة غير متاحة، استخدام القاعدة الرئيسية: {e}")
+        conn = engine.connect()
+    with conn:
+        yield conn
+
+def fetch_one_fresh(query, params):
+    """جلب صف واحد للقراءة، وإعادة المحاولة على القاعدة الرئيسية إذا لم يصل الصف لنسخة القراءة بعد."""
+    with read_connection() as conn:
+        row = conn.execute(text(query), params).fetchone()
+    if row is None and read_engine is not None:
+        with engine.connect() as conn:
+            row = conn.execute(text(query), params).fetchone()
+    return row
+
+@coalesced
+def get_all_content(content_type=None):
     if not engine:
         return []
     try:
-        with engine.connect() as conn:
+        with read_connection() as conn:
             query = """
                 SELECT s.id, s.name, s.type,
                        COUNT(e.id) as episode_count,
@@ -83,11 +252,12 @@ async def get_all_content(content_type=None):
         logger.error(f"خطأ في جلب المحتويات: {e}")
         return []
 
-async def get_content_episodes(series_id, page=1, per_page=50):
+@coalesced
+def get_content_episodes(series_id, page=1, per_page=50):
     if not engine:
         return [], 0, 0
     try:
-        with engine.connect() as conn:
+        with read_connection() as conn:
             count_result = conn.execute(text("""
                 SELECT COUNT(*) FROM episodes WHERE series_id = :series_id
             """), {"series_id": series_id})
@@ -113,25 +283,25 @@ async def get_content_episodes(series_id, page=1, per_page=50):
         logger.error(f"خطأ في جلب حلقات المحتوى {series_id}: {e}")
         return [], 0, 0
 
-async def get_content_info(series_id):
+@coalesced
+def get_content_info(series_id):
     if not engine:
         return None
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT id, name, type FROM series WHERE id = :series_id
-            """), {"series_id": series_id})
-            return result.fetchone()
+        return fetch_one_fresh("""
+            SELECT id, name, type FROM series WHERE id = :series_id
+        """, {"series_id": series_id})
     except Exception as e:
         logger.error(f"خطأ في جلب معلومات المحتوى {series_id}: {e}")
         return None
 
-async def get_seasons_stats(series_id):
+@coalesced
+def get_seasons_stats(series_id):
     """جلب إحصائيات المواسم لمسلسل معين: رقم الموسم وعدد حلقاته"""
     if not engine:
         return []
     try:
-        with engine.connect() as conn:
+        with read_connection() as conn:
             result = conn.execute(text("""
                 SELECT season, COUNT(*) as episode_count
                 FROM episodes
@@ -144,12 +314,13 @@ async def get_seasons_stats(series_id):
         logger.error(f"خطأ في جلب إحصائيات المواسم: {e}")
         return []
 
-async def get_episode_numbers_for_season(series_id, season):
+@coalesced
+def get_episode_numbers_for_season(series_id, season):
     """جلب أرقام الحلقات لموسم معين (مرتبة)"""
     if not engine:
         return []
     try:
-        with engine.connect() as conn:
+        with read_connection() as conn:
             result = conn.execute(text("""
                 SELECT episode_number
                 FROM episodes
@@ -161,12 +332,13 @@ async def get_episode_numbers_for_season(series_id, season):
         logger.error(f"خطأ في جلب أرقام الحلقات: {e}")
         return []
 
-async def find_series_by_name(name_pattern):
+@coalesced
+def find_series_by_name(name_pattern):
     """البحث عن مسلسلات بأسماء تحتوي على النمط"""
     if not engine:
         return []
     try:
-        with engine.connect() as conn:
+        with read_connection() as conn:
             result = conn.execute(text("""
                 SELECT id, name, type,
                        (SELECT COUNT(*) FROM episodes WHERE series_id = series.id) as episode_count
@@ -179,32 +351,193 @@ async def find_series_by_name(name_pattern):
         logger.error(f"خطأ في البحث عن مسلسلات: {e}")
         return []
 
-async def find_episode_by_msg_id(msg_id):
+@coalesced
+def find_episode_by_msg_id(msg_id):
     """البحث عن حلقة باستخدام معرف الرسالة"""
     if not engine:
         return None
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT e.id, e.series_id, s.name, e.season, e.episode_number,
-                       e.telegram_channel_id, e.telegram_message_id
-                FROM episodes e
-                JOIN series s ON e.series_id = s.id
-                WHERE e.telegram_message_id = :msg_id
-            """), {"msg_id": msg_id})
-            return result.fetchone()
+        return fetch_one_fresh("""
+            SELECT e.id, e.series_id, s.name, e.season, e.episode_number,
+                   e.telegram_channel_id, e.telegram_message_id
+            FROM episodes e
+            JOIN series s ON e.series_id = s.id
+            WHERE e.telegram_message_id = :msg_id
+        """, {"msg_id": msg_id})
     except Exception as e:
         logger.error(f"خطأ في البحث عن الحلقة: {e}")
         return None
 
+@coalesced
+def get_content_channels(series_id):
+    """القنوات التي تحتوي على حلقات المحتوى"""
+    if not engine:
+        return []
+    with read_connection() as conn:
+        result = conn.execute(text("""
+            SELECT DISTINCT telegram_channel_id FROM episodes WHERE series_id = :series_id
+        """), {"series_id": series_id}).fetchall()
+        return [row[0] for row in result]
+
+@coalesced
+def get_season_episodes(series_id, season, page=1, per_page=50):
+    """صفحة من حلقات موسم معين: (الحلقات، العدد الإجمالي، عدد الصفحات، الصفحة الفعلية)"""
+    with read_connection() as conn:
+        count_result = conn.execute(text("""
+            SELECT COUNT(*) FROM episodes WHERE series_id = :series_id AND season = :season
+        """), {"series_id": series_id, "season": season})
+        total_episodes = count_result.scalar()
+        total_pages = (total_episodes + per_page - 1) // per_page
+        page = max(1, min(page, total_pages)) if total_pages > 0 else 1
+        offset = (page - 1) * per_page
+
+        result = conn.execute(text("""
+            SELECT e.id, e.episode_number, e.telegram_message_id, e.telegram_channel_id
+            FROM episodes e
+            WHERE e.series_id = :series_id AND e.season = :season
+            ORDER BY e.episode_number
+            LIMIT :limit OFFSET :offset
+        """), {
+            "series_id": series_id,
+            "season": season,
+            "limit": per_page,
+            "offset": offset
+        })
+        return result.fetchall(), total_episodes, total_pages, page
+
+@coalesced
+def find_episode_by_channel_message(channel_key, msg_id):
+    """معرف الحلقة من رابط منشور في القناة (القناة بدون @ كما في رابط t.me)"""
+    if not engine:
+        return None
+    row = fetch_one_fresh("""
+        SELECT id FROM episodes
+        WHERE telegram_channel_id IN (:channel, :username) AND telegram_message_id = :msg_id
+        LIMIT 1
+    """, {"channel": channel_key, "username": f"@{channel_key}", "msg_id": msg_id})
+    return row[0] if row else None
+
+@coalesced
+def get_episode_details(episode_id):
+    return fetch_one_fresh("""
+        SELECT e.season, e.episode_number, e.telegram_message_id,
+               e.telegram_channel_id,
+               s.name as series_name, s.type as series_type, s.id as series_id
+        FROM episodes e
+        JOIN series s ON e.series_id = s.id
+        WHERE e.id = :episode_id
+    """, {"episode_id": episode_id})
+
+def is_favorite(user_id, series_id):
+    """هل يتابع المستخدم المحتوى؟ (من القاعدة الرئيسية ليظهر التغيير فور الضغط على الزر).
+    غير مدمج: الاستعلام الجاري قد يسبق ضغطة المتابعة فيُرجع الحالة القديمة."""
+    if not engine:
+        return False
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT EXISTS (SELECT 1 FROM user_favorites WHERE series_id = :series_id AND user_id = :user_id)
+        """), {"series_id": series_id, "user_id": user_id}).scalar()
+
+def set_favorite(user_id, series_id, favorite):
+    with engine.begin() as conn:
+        if favorite:
+            conn.execute(text("""
+                INSERT INTO user_favorites (user_id, series_id) VALUES (:user_id, :series_id)
+                ON CONFLICT (series_id, user_id) DO NOTHING
+            """), {"user_id": user_id, "series_id": series_id})
+        else:
+            conn.execute(text("""
+                DELETE FROM user_favorites WHERE series_id = :series_id AND user_id = :user_id
+            """), {"user_id": user_id, "series_id": series_id})
+
+@coalesced
+def get_user_favorites(user_id):
+    if not engine:
+        return []
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT s.id, s.name, s.type
+            FROM user_favorites f JOIN series s ON s.id = f.series_id
+            WHERE f.user_id = :user_id
+            ORDER BY f.added_at DESC
+            LIMIT 50
+        """), {"user_id": user_id}).fetchall()
+
+# آخر الإضافات في الذاكرة (تُعبأ عند التشغيل ويغذيها الـ Worker عبر pg_notify)
+latest_feed = LatestFeed()
+
+# لقطة إحصائيات قاعدة البيانات (تُحدّث في الخلفية حتى لا يفحص كل ضغط الجداول بالكامل)
+db_stats = None
+
+@coalesced
+def refresh_db_stats():
+    global db_stats
+    with read_connection() as conn:
+        # عدد الصفوف التقديري من إحصائيات Postgres (يُحدّثه ANALYZE/autovacuum)
+        tables = conn.execute(text("""
+            SELECT c.relname,
+                   CASE WHEN c.reltuples < 0 THEN COALESCE(s.n_live_tup, 0) ELSE c.reltuples END::bigint
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE n.nspname = 'public' AND c.relkind = 'r'
+            ORDER BY c.relname
+        """)).fetchall()
+        type_counts = dict(conn.execute(text("SELECT type, COUNT(*) FROM series GROUP BY type")).fetchall())
+        series_sample = conn.execute(text("SELECT id, name, type FROM series ORDER BY id LIMIT 5")).fetchall()
+        episodes_sample = conn.execute(text("SELECT id, series_id, season, episode_number, telegram_channel_id FROM episodes ORDER BY id LIMIT 5")).fetchall()
+        series_ex = conn.execute(text("SELECT name FROM series WHERE type = 'series' ORDER BY id LIMIT 3")).fetchall()
+        movies_ex = conn.execute(text("SELECT name FROM series WHERE type = 'movie' ORDER BY id LIMIT 3")).fetchall()
+        # جدول نقاط التقدم يحتوي على صف لكل قناة (بدلاً من DISTINCT على كل الحلقات)
+        # وهو آخر استعلام لأنه قد لا يكون موجوداً قبل أول تشغيل للـ Worker
+        try:
+            channels = conn.execute(text("SELECT telegram_channel_id FROM channel_checkpoints ORDER BY telegram_channel_id")).fetchall()
+        except Exception as e:
+            logger.warning(f"تعذر قراءة القنوات من channel_checkpoints: {e}")
+            channels = []
+
+    db_stats = {
+        "refreshed_at": time.monotonic(),
+        "tables": [(row[0], row[1]) for row in tables],
+        "series_count": type_counts.get('series', 0),
+        "movies_count": type_counts.get('movie', 0),
+        "series_sample": series_sample,
+        "episodes_sample": episodes_sample,
+        "series_names": [row[0] for row in series_ex],
+        "movies_names": [row[0] for row in movies_ex],
+        "channels": [row[0] for row in channels],
+    }
+    return db_stats
+
+async def get_db_stats():
+    """اللقطة الحالية، أو تحميلها مرة واحدة إذا لم تُحمّل بعد."""
+    return db_stats or await refresh_db_stats()
+
+async def refresh_db_stats_periodically():
+    while True:
+        try:
+            await refresh_db_stats()
+        except Exception as e:
+            logger.warning(f"تعذر تحديث إحصائيات قاعدة البيانات: {e}")
+        await asyncio.sleep(DB_STATS_REFRESH_SECONDS)
+
+def stats_age_text(stats):
+    return f"🕒 آخر تحديث منذ {int(time.monotonic() - stats['refreshed_at'])} ثانية"
+
 # ==============================
 # 3. دوال البوت الرئيسية
 # ==============================
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
+        # رابط مباشر: /start s_<id> أو e_<id> أو m_<القناة>_<msg_id>
+        if update.message and context.args and await open_deep_link(update, context, context.args[0]):
+            return
+
         keyboard = [
             [InlineKeyboardButton("📺 المسلسلات", callback_data='series_list'),
              InlineKeyboardButton("🎬 الأفلام", callback_data='movies_list')],
+            [InlineKeyboardButton("🆕 آخر الإضافات", callback_data='latest'),
+             InlineKeyboardButton("⭐ المفضلة", callback_data='favorites')],
             [InlineKeyboardButton("📁 جميع المحتويات", callback_data='all_content')],
             [InlineKeyboardButton("🔄 اختبار قاعدة البيانات", callback_data='test_db')],
         ]
@@ -223,6 +556,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /series - عرض المسلسلات
 /movies - عرض الأفلام
 /all - عرض كل المحتويات
+/latest - آخر الحلقات والأفلام المضافة
+/favorites - المحتويات التي تتابعها (تصلك إشعارات بحلقاتها الجديدة)
 /test - اختبار قاعدة البيانات
 /debug_series <id> [season] - فحص تفاصيل مسلسل (للمطور)
 /find_series <كلمة> - البحث عن مسلسلات باسم مشابه
@@ -312,38 +647,23 @@ async def test_db_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not engine:
             await update.message.reply_text("❌ قاعدة البيانات غير متصلة.")
             return
-        with engine.connect() as conn:
-            tables = conn.execute(text("""
-                SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'
-            """)).fetchall()
-            tables_info = "📋 *الجداول الموجودة:*\n"
-            for table in tables:
-                count = conn.execute(text(f"SELECT COUNT(*) FROM {table[0]}")).scalar()
-                tables_info += f"• `{table[0]}`: {count} صف\n"
-
-            series_sample = conn.execute(text("SELECT id, name, type FROM series ORDER BY id LIMIT 5")).fetchall()
-            episodes_sample = conn.execute(text("SELECT id, series_id, season, episode_number, telegram_channel_id FROM episodes ORDER BY id LIMIT 5")).fetchall()
-
-            series_text = "🎬 *عينة من المسلسلات والأفلام:*\n"
-            for row in series_sample:
-                series_text += f"• ID:{row[0]} - {row[1]} ({row[2]})\n"
-
-            episodes_text = "📺 *عينة من الحلقات:*\n"
-            for row in episodes_sample:
-                episodes_text += f"• ID:{row[0]} - مسلسل:{row[1]} - م{row[2]} ح{row[3]} - قناة:{row[4]}\n"
-
-            # إحصائيات المسلسل 60 (التفاح الحرام) للمساعدة في التشخيص
-            debug_info = ""
-            try:
-                seasons_60 = await get_seasons_stats(60)
-                if seasons_60:
-                    debug_info = "\n\n📊 *تفاصيل المسلسل 60 (التفاح الحرام):*\n"
-                    for s, cnt in seasons_60:
-                        debug_info += f"   الموسم {s}: {cnt} حلقة\n"
-            except:
-                pass
-
-        await update.message.reply_text(f"{tables_info}\n{series_text}\n{episodes_text}{debug_info}", parse_mode='Markdown')
+        stats = await get_db_stats()
+
+        tables_info = "📋 *الجداول الموجودة:*\n"
+        for table_name, count in stats["tables"]:
+            tables_info += f"• `{table_name}`: ≈{count} صف\n"
+
+        series_text = "🎬 *عينة من المسلسلات والأفلام:*\n"
+        for row in stats["series_sample"]:
+            series_text += f"• ID:{row[0]} - {row[1]} ({row[2]})\n"
+
+        episodes_text = "📺 *عينة من الحلقات:*\n"
+        for row in stats["episodes_sample"]:
+            episodes_text += f"• ID:{row[0]} - مسلسل:{row[1]} - م{row[2]} ح{row[3]} - قناة:{row[4]}\n"
+
+        await update.message.reply_text(
+            f"{tables_info}\n{series_text}\n{episodes_text}\n{stats_age_text(stats)}", parse_mode='Markdown'
+        )
     except Exception as e:
         await update.message.reply_text(f"❌ خطأ في اختبار قاعدة البيانات:\n`{str(e)[:300]}`")
 
@@ -498,23 +818,16 @@ async def find_episode_command(update: Update, context: ContextTypes.DEFAULT_TYP
 # 5. دوال عرض المحتوى التفاعلي
 # ==============================
 async def show_content_details(update: Update, context: ContextTypes.DEFAULT_TYPE, content_id, page=1):
-    query = update.callback_query
     try:
         content_info = await get_content_info(content_id)
         if not content_info:
-            await query.edit_message_text("❌ المحتوى غير موجود.")
+            await reply_or_edit(update, "❌ المحتوى غير موجود.")
             return
 
         content_id, name, content_type = content_info
 
         # جلب القنوات
-        channels = []
-        if engine:
-            with engine.connect() as conn:
-                result = conn.execute(text("""
-                    SELECT DISTINCT telegram_channel_id FROM episodes WHERE series_id = :series_id
-                """), {"series_id": content_id}).fetchall()
-                channels = [row[0] for row in result]
+        channels = await get_content_channels(content_id)
 
         message_text = f"*{name}*\n\n"
         if channels:
@@ -582,57 +895,41 @@ async def show_content_details(update: Update, context: ContextTypes.DEFAULT_TYP
                         nav_buttons.append(InlineKeyboardButton("التالية ➡️", callback_data=f"content_page_{content_id}_{page+1}"))
                     keyboard.append(nav_buttons)
 
+        if await asyncio.to_thread(is_favorite, update.effective_user.id, content_id):
+            favorite_button = InlineKeyboardButton("💔 إلغاء المتابعة", callback_data=f"unfav_{content_id}")
+        else:
+            favorite_button = InlineKeyboardButton("⭐ متابعة", callback_data=f"fav_{content_id}")
+        keyboard.append([favorite_button, share_button(context, f"s_{content_id}", name)])
         keyboard.append([
             InlineKeyboardButton("⬅️ رجوع", callback_data=f"{content_type}_list"),
             InlineKeyboardButton("🏠 الرئيسية", callback_data="home")
         ])
 
-        await query.edit_message_text(
+        await reply_or_edit(update, 
             message_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
         )
     except Exception as e:
+        if is_not_modified(e):
+            return
         logger.error(f"خطأ في show_content_details: {e}")
-        await query.edit_message_text("⚠️ حدث خطأ أثناء جلب البيانات.")
+        await reply_or_edit(update, "⚠️ حدث خطأ أثناء جلب البيانات.")
 
 async def show_season_episodes(update: Update, context: ContextTypes.DEFAULT_TYPE, content_id, season_num, page=1):
-    query = update.callback_query
     try:
         content_info = await get_content_info(content_id)
         if not content_info:
-            await query.edit_message_text("❌ المحتوى غير موجود.")
+            await reply_or_edit(update, "❌ المحتوى غير موجود.")
             return
 
         content_id, name, content_type = content_info
         if content_type != 'series':
-            await query.edit_message_text("❌ هذه الدالة للمسلسلات فقط.")
+            await reply_or_edit(update, "❌ هذه الدالة للمسلسلات فقط.")
             return
 
-        with engine.connect() as conn:
-            count_result = conn.execute(text("""
-                SELECT COUNT(*) FROM episodes WHERE series_id = :series_id AND season = :season
-            """), {"series_id": content_id, "season": season_num})
-            total_episodes = count_result.scalar()
-            per_page = 50
-            total_pages = (total_episodes + per_page - 1) // per_page
-            page = max(1, min(page, total_pages)) if total_pages > 0 else 1
-            offset = (page - 1) * per_page
-
-            result = conn.execute(text("""
-                SELECT e.id, e.episode_number, e.telegram_message_id, e.telegram_channel_id
-                FROM episodes e
-                WHERE e.series_id = :series_id AND e.season = :season
-                ORDER BY e.episode_number
-                LIMIT :limit OFFSET :offset
-            """), {
-                "series_id": content_id,
-                "season": season_num,
-                "limit": per_page,
-                "offset": offset
-            })
-            episodes = result.fetchall()
+        episodes, total_episodes, total_pages, page = await get_season_episodes(content_id, season_num, page)
 
         if not episodes:
-            await query.edit_message_text(f"❌ لا توجد حلقات للموسم {season_num}.")
+            await reply_or_edit(update, f"❌ لا توجد حلقات للموسم {season_num}.")
             return
 
         message_text = f"*{name}*\nالموسم {season_num}\n\n"
@@ -666,37 +963,27 @@ async def show_season_episodes(update: Update, context: ContextTypes.DEFAULT_TYP
             InlineKeyboardButton("🏠 الرئيسية", callback_data="home")
         ])
 
-        await query.edit_message_text(
+        await reply_or_edit(update, 
             message_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
         )
     except Exception as e:
+        if is_not_modified(e):
+            return
         logger.error(f"خطأ في show_season_episodes: {e}")
-        await query.edit_message_text("⚠️ حدث خطأ أثناء جلب البيانات.")
+        await reply_or_edit(update, "⚠️ حدث خطأ أثناء جلب البيانات.")
 
 async def show_episode_details(update: Update, context: ContextTypes.DEFAULT_TYPE, episode_id):
-    query = update.callback_query
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT e.season, e.episode_number, e.telegram_message_id,
-                       e.telegram_channel_id,
-                       s.name as series_name, s.type as series_type, s.id as series_id
-                FROM episodes e
-                JOIN series s ON e.series_id = s.id
-                WHERE e.id = :episode_id
-            """), {"episode_id": episode_id}).fetchone()
+        result = await get_episode_details(episode_id)
 
         if not result:
-            await query.edit_message_text("❌ الحلقة/الجزء غير موجود.")
+            await reply_or_edit(update, "❌ الحلقة/الجزء غير موجود.")
             return
 
         season, episode_num, msg_id, channel_id, series_name, series_type, series_id = result
 
         if msg_id and channel_id:
-            if channel_id.startswith('@'):
-                episode_link = f"https://t.me/{channel_id[1:]}/{msg_id}"
-            else:
-                episode_link = f"https://t.me/c/{channel_id}/{msg_id}"
+            episode_link = channel_post_link(channel_id, msg_id)
 
             if series_type == 'series':
                 title = f"*{series_name}*\nالموسم {season} - الحلقة {episode_num}"
@@ -715,17 +1002,101 @@ async def show_episode_details(update: Update, context: ContextTypes.DEFAULT_TYP
         keyboard = []
         if msg_id and channel_id:
             keyboard.append([InlineKeyboardButton(button_text, url=episode_link)])
+            keyboard.append([InlineKeyboardButton("📥 إرسال هنا", callback_data=f"send_{episode_id}")])
+        keyboard.append([share_button(context, f"e_{episode_id}", title.replace('*', ''))])
         keyboard.append([
             InlineKeyboardButton("⬅️ رجوع للمحتوى", callback_data=f"content_{series_id}"),
             InlineKeyboardButton("🏠 الرئيسية", callback_data="home")
         ])
 
-        await query.edit_message_text(
+        await reply_or_edit(update, 
             message_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
         )
     except Exception as e:
+        if is_not_modified(e):
+            return
         logger.error(f"خطأ في show_episode_details: {e}")
-        await query.edit_message_text("⚠️ حدث خطأ.")
+        await reply_or_edit(update, "⚠️ حدث خطأ.")
+
+async def send_episode(update: Update, context: ContextTypes.DEFAULT_TYPE, episode_id):
+    """إرسال الحلقة في محادثة المستخدم بنسخ المنشور من القناة (copy_message)، وإلا الرابط.
+    لا يُخزن مرجع ملف: معرفات جلسة العامل لا يقبلها Bot API، و copyMessage لا يعيد file_id."""
+    chat_id = update.effective_chat.id
+    try:
+        result = await get_episode_details(episode_id)
+        if not result or not result[2] or not result[3]:
+            await context.bot.send_message(chat_id, "❌ الحلقة/الجزء غير موجود.")
+            return
+
+        msg_id, channel_id = result[2], result[3]
+        try:
+            await context.bot.copy_message(chat_id, channel_chat_id(channel_id), msg_id)
+        except TelegramError as e:
+            # البوت ليس عضواً في القناة الخاصة أو حُذف المنشور
+            logger.warning(f"⚠️ تعذر نسخ الحلقة {episode_id} من {channel_id}: {e}")
+            await context.bot.send_message(
+                chat_id, "⚠️ تعذر إرسال الحلقة هنا، افتحها من القناة:",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("مشاهدة", url=channel_post_link(channel_id, msg_id))]])
+            )
+    except Exception as e:
+        logger.error(f"خطأ في send_episode: {e}")
+
+async def show_latest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """آخر الإضافات من الذاكرة مباشرة (بدون أي استعلام)."""
+    try:
+        items = latest_feed.latest(20)
+        keyboard = []
+        if items:
+            message_text = "🆕 *آخر الإضافات:*"
+            for item in items:
+                if item["type"] == 'series':
+                    label = f"📺 {item['name']} - م{item['season']} ح{item['episode_number']}"
+                else:
+                    label = f"🎬 {item['name']} - الجزء {item['season']}"
+                keyboard.append([InlineKeyboardButton(label[:64], callback_data=f"ep_{item['episode_id']}")])
+        else:
+            message_text = "🆕 لا توجد إضافات حديثة بعد."
+        keyboard.append([InlineKeyboardButton("🏠 الرئيسية", callback_data="home")])
+        await reply_or_edit(update, message_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+    except Exception as e:
+        if is_not_modified(e):
+            return
+        logger.error(f"خطأ في show_latest: {e}")
+
+async def toggle_favorite(update: Update, context: ContextTypes.DEFAULT_TYPE, content_id, favorite):
+    query = update.callback_query
+    if not engine:
+        await query.edit_message_text("❌ قاعدة البيانات غير متصلة.")
+        return
+    await asyncio.to_thread(set_favorite, query.from_user.id, content_id, favorite)
+    await show_content_details(update, context, content_id, 1)
+
+async def show_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        favorites = await get_user_favorites(update.effective_user.id)
+        if favorites:
+            message_text = "⭐ *المحتويات التي تتابعها:*\n\nستصلك رسالة عند إضافة حلقات أو أجزاء جديدة."
+            keyboard = [
+                [InlineKeyboardButton(f"{'📺' if content_type == 'series' else '🎬'} {name}", callback_data=f"content_{content_id}")]
+                for content_id, name, content_type in favorites
+            ]
+        else:
+            message_text = "⭐ لا تتابع أي محتوى بعد.\n\nافتح مسلسلاً أو فيلماً واضغط ⭐ متابعة لتصلك إشعارات الجديد."
+            keyboard = []
+        keyboard.append([InlineKeyboardButton("🏠 الرئيسية", callback_data="home")])
+
+        if update.callback_query:
+            await update.callback_query.edit_message_text(
+                message_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        else:
+            await update.message.reply_text(
+                message_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+    except Exception as e:
+        if is_not_modified(e):
+            return
+        logger.error(f"خطأ في show_favorites: {e}")
 
 # ==============================
 # 6. معالج الأزرار
@@ -744,58 +1115,80 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
 
     data = query.data
-    try:
-        if data == 'home':
-            await start(update, context)
-        elif data == 'test_db':
-            await test_db_button(update, context)
-        elif data == 'all_content':
-            await show_content(update, context)
-        elif data == 'series_list':
-            await show_content(update, context, 'series')
-        elif data == 'movies_list':
-            await show_content(update, context, 'movie')
-        elif data == 'page_info' or data == 'page':
-            return
-
-        elif data.startswith('content_page_'):
-            parts = data.split('_')
-            if len(parts) >= 4:
-                content_id = int(parts[2])
-                page = int(parts[3])
-                await show_content_details(update, context, content_id, page)
-            else:
-                logger.warning(f"تنسيق غير متوقع لـ content_page_: {data}")
-
-        elif data.startswith('content_'):
-            content_id = int(data.split('_')[1])
-            await show_content_details(update, context, content_id, 1)
-
-        elif data.startswith('ep_'):
-            episode_id = int(data.split('_')[1])
-            await show_episode_details(update, context, episode_id)
-
-        elif data.startswith('season_page_'):
-            parts = data.split('_')
-            if len(parts) >= 5:
-                content_id = int(parts[2])
-                season_num = int(parts[3])
-                page = int(parts[4])
-                await show_season_episodes(update, context, content_id, season_num, page)
-            else:
-                logger.warning(f"تنسيق غير متوقع لـ season_page_: {data}")
+    # تجاهل الضغط المزدوج على نفس الزر (الاستجابة الأولى ما زالت قيد التنفيذ)
+    if tap_debouncer.is_duplicate(query.from_user.id, data):
+        return
+    started_at = time.perf_counter()
+    with handler_scope(route_label(data)):
+        try:
+            if data == 'home':
+                await start(update, context)
+            elif data == 'test_db':
+                await test_db_button(update, context)
+            elif data == 'all_content':
+                await show_content(update, context)
+            elif data == 'series_list':
+                await show_content(update, context, 'series')
+            elif data == 'movies_list':
+                await show_content(update, context, 'movie')
+            elif data == 'latest':
+                await show_latest(update, context)
+            elif data == 'favorites':
+                await show_favorites(update, context)
+            elif data == 'page_info' or data == 'page':
+                return
 
-        elif data.startswith('season_'):
-            parts = data.split('_')
-            content_id = int(parts[1])
-            season_num = int(parts[2])
-            await show_season_episodes(update, context, content_id, season_num, 1)
+            elif data.startswith('fav_'):
+                await toggle_favorite(update, context, int(data.split('_')[1]), True)
 
-        else:
-            logger.warning(f"زر غير معروف: {data}")
-    except Exception as e:
-        logger.error(f"خطأ في button_handler: {e}")
-        await query.edit_message_text("⚠️ حدث خطأ أثناء معالجة طلبك.")
+            elif data.startswith('unfav_'):
+                await toggle_favorite(update, context, int(data.split('_')[1]), False)
+
+            elif data.startswith('content_page_'):
+                parts = data.split('_')
+                if len(parts) >= 4:
+                    content_id = int(parts[2])
+                    page = int(parts[3])
+                    await show_content_details(update, context, content_id, page)
+                else:
+                    logger.warning(f"تنسيق غير متوقع لـ content_page_: {data}")
+
+            elif data.startswith('content_'):
+                content_id = int(data.split('_')[1])
+                await show_content_details(update, context, content_id, 1)
+
+            elif data.startswith('ep_'):
+                episode_id = int(data.split('_')[1])
+                await show_episode_details(update, context, episode_id)
+
+            elif data.startswith('send_'):
+                await send_episode(update, context, int(data.split('_')[1]))
+
+            elif data.startswith('season_page_'):
+                parts = data.split('_')
+                if len(parts) >= 5:
+                    content_id = int(parts[2])
+                    season_num = int(parts[3])
+                    page = int(parts[4])
+                    await show_season_episodes(update, context, content_id, season_num, page)
+                else:
+                    logger.warning(f"تنسيق غير متوقع لـ season_page_: {data}")
+
+            elif data.startswith('season_'):
+                parts = data.split('_')
+                content_id = int(parts[1])
+                season_num = int(parts[2])
+                await show_season_episodes(update, context, content_id, season_num, 1)
+
+            else:
+                logger.warning(f"زر غير معروف: {data}")
+        except Exception as e:
+            if is_not_modified(e):
+                return
+            logger.error(f"خطأ في button_handler: {e}")
+            await query.edit_message_text("⚠️ حدث خطأ أثناء معالجة طلبك.")
+        finally:
+            HANDLER_LATENCY.labels(route_label(data)).observe(time.perf_counter() - started_at)
 
 async def test_db_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -804,37 +1197,20 @@ async def test_db_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text("❌ قاعدة البيانات غير متصلة.")
             return
 
-        with engine.connect() as conn:
-            series_count = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'series'")).scalar()
-            movies_count = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'movie'")).scalar()
-            series_ex = conn.execute(text("SELECT name FROM series WHERE type = 'series' ORDER BY id LIMIT 3")).fetchall()
-            movies_ex = conn.execute(text("SELECT name FROM series WHERE type = 'movie' ORDER BY id LIMIT 3")).fetchall()
-            channels = conn.execute(text("SELECT DISTINCT telegram_channel_id FROM episodes LIMIT 5")).fetchall()
-
-        series_names = [row[0] for row in series_ex] or ["لا يوجد"]
-        movies_names = [row[0] for row in movies_ex] or ["لا يوجد"]
-        channels_list = [row[0] for row in channels] or ["لا يوجد"]
-
-        # إحصائيات المسلسل 60
-        debug_info = ""
-        try:
-            seasons_60 = await get_seasons_stats(60)
-            if seasons_60:
-                debug_info = "\n\n📊 *تفاصيل المسلسل 60 (التفاح الحرام):*\n"
-                for s, cnt in seasons_60:
-                    debug_info += f"   الموسم {s}: {cnt} حلقة\n"
-        except:
-            pass
+        stats = await get_db_stats()
+        series_names = stats["series_names"] or ["لا يوجد"]
+        movies_names = stats["movies_names"] or ["لا يوجد"]
+        channels_list = stats["channels"] or ["لا يوجد"]
 
         reply = (
             f"✅ *اختبار قاعدة البيانات:*\n\n"
-            f"• عدد المسلسلات: {series_count}\n"
-            f"• عدد الأفلام: {movies_count}\n"
-            f"• عدد القنوات المختلفة: {len(channels_list)}\n\n"
+            f"• عدد المسلسلات: {stats['series_count']}\n"
+            f"• عدد الأفلام: {stats['movies_count']}\n"
+            f"• عدد القنوات المختلفة: {len(stats['channels'])}\n\n"
             f"📺 *أمثلة مسلسلات:*\n" + "\n".join(f"• {n}" for n in series_names) + "\n\n"
             f"🎬 *أمثلة أفلام:*\n" + "\n".join(f"• {n}" for n in movies_names) + "\n\n"
-            f"📡 *قنوات:*\n" + "\n".join(f"• {c}" for c in channels_list) +
-            debug_info
+            f"📡 *قنوات:*\n" + "\n".join(f"• {c}" for c in channels_list[:5]) + "\n\n" +
+            stats_age_text(stats)
         )
 
         keyboard = [
@@ -844,27 +1220,235 @@ async def test_db_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
         await query.edit_message_text(reply, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
+        if is_not_modified(e):
+            return
         logger.error(f"خطأ في test_db_button: {e}")
         await query.edit_message_text(f"❌ خطأ: {str(e)[:200]}")
 
 # ==============================
-# 7. الدالة الرئيسية
+# 7. أوامر المشرفين
 # ==============================
+def is_admin(update: Update):
+    user = update.effective_user
+    return user is not None and user.id in Config.ADMIN_IDS
+
+async def sql_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ملخص أثقل الاستعلامات والمعالجات المشتبه بنمط N+1: /sql_stats [reset]"""
+    try:
+        if not is_admin(update):
+            await update.message.reply_text("⛔ هذا الأمر للمشرفين فقط.")
+            return
+        if not engine:
+            await update.message.reply_text("❌ قاعدة البيانات غير متصلة.")
+            return
+
+        if context.args and context.args[0] == 'reset':
+            reset_stats(engine)
+            await update.message.reply_text("✅ تم تصفير إحصائيات الاستعلامات.")
+            return
+
+        # حفظ إحصائيات البوت الحالية أولاً لتظهر مع إحصائيات الـ Worker
+        flush_stats(engine, "bot")
+        statements, handlers = load_summary(engine)
+
+        msg = "📊 أثقل الاستعلامات (حسب الزمن الإجمالي):\n\n"
+        if not statements:
+            msg += "لا توجد بيانات بعد.\n"
+        for process, handler, statement, calls, total_ms, max_ms in statements:
+            msg += (
+                f"• [{process}] {handler}: {calls} مرة، {total_ms:.0f} ms إجمالي، "
+                f"{total_ms / max(calls, 1):.1f} ms متوسط، {max_ms:.0f} ms أقصى\n"
+                f"  {statement[:150]}\n"
+            )
+
+        msg += "\n⚠️ معالجات مشتبه بنمط N+1:\n\n"
+        if not handlers:
+            msg += "لا يوجد.\n"
+        for process, handler, updates, count, flagged, max_statements in handlers:
+            msg += (
+                f"• [{process}] {handler}: {flagged} من {updates} تحديث، "
+                f"متوسط {count / max(updates, 1):.1f} استعلام، أقصى {max_statements}\n"
+            )
+
+        # نص عادي بدون Markdown لأن نصوص SQL تحتوي على رموز التنسيق
+        await update.message.reply_text(msg[:4000])
+    except Exception as e:
+        logger.error(f"خطأ في sql_stats: {e}")
+        await update.message.reply_text(f"❌ حدث خطأ: {str(e)[:200]}")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تحليل أداء مسار لمدة محددة: /profile <المسار|worker.*> [ثواني] [نسبة العينة]"""
+    try:
+        if not is_admin(update):
+            await update.message.reply_text("⛔ هذا الأمر للمشرفين فقط.")
+            return
+        if not context.args:
+            await update.message.reply_text(
+                "📝 الاستخدام: /profile <المسار> [ثواني=30] [نسبة العينة=1]\n\n"
+                "أمثلة:\n"
+                "/profile content_ 60\n"
+                "/profile /find_series 30 0.5\n"
+                "/profile * 20  (كل معالجات البوت)\n"
+                "/profile worker.live 60  (معالج الرسائل الجديدة في الـ Worker)\n"
+                "/profile worker.* 60"
+            )
+            return
+
+        target = context.args[0]
+        seconds = int(context.args[1]) if len(context.args) > 1 else 30
+        sample_rate = float(context.args[2]) if len(context.args) > 2 else 1.0
+
+        if target.startswith("worker"):
+            if not engine:
+                await update.message.reply_text("❌ قاعدة البيانات غير متصلة.")
+                return
+            with engine.begin() as conn:
+                request_id = conn.execute(text("""
+                    INSERT INTO profile_requests (target, seconds, sample_rate)
+                    VALUES (:target, :seconds, :sample_rate) RETURNING id
+                """), {"target": target, "seconds": seconds, "sample_rate": sample_rate}).scalar()
+            await update.message.reply_text(f"⏳ تم إرسال طلب التحليل #{request_id} إلى الـ Worker ({target} لمدة {seconds} ثانية).")
+            context.application.create_task(reply_worker_profile(update, request_id, seconds))
+            return
+
+        session = PROFILER.start(target, seconds, sample_rate)
+        await update.message.reply_text(f"⏳ بدأ تحليل {target} لمدة {session.seconds} ثانية...")
+        context.application.create_task(reply_bot_profile(update, session))
+    except ValueError:
+        await update.message.reply_text("❌ المدة يجب أن تكون عدداً صحيحاً ونسبة العينة بين 0 و 1.")
+    except RuntimeError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+    except Exception as e:
+        logger.error(f"خطأ في profile: {e}")
+        await update.message.reply_text(f"❌ حدث خطأ: {str(e)[:200]}")
+
+async def reply_bot_profile(update: Update, session):
+    summary = await PROFILER.wait(session)
+    # نص عادي بدون Markdown لأن أسماء الدوال تحتوي على رموز التنسيق
+    await update.message.reply_text(summary[:4000])
+
+async def reply_worker_profile(update: Update, request_id, seconds):
+    """انتظار نتيجة الـ Worker (يستطلع جدول الطلبات كل بضع ثوانٍ)."""
+    deadline = time.monotonic() + seconds + 120
+    while time.monotonic() < deadline:
+        await asyncio.sleep(3)
+        with engine.connect() as conn:
+            row = conn.execute(text("""
+                SELECT status, result FROM profile_requests WHERE id = :id
+            """), {"id": request_id}).fetchone()
+        if row and row[0] in ('done', 'failed'):
+            await update.message.reply_text((row[1] or "⚠️ لا توجد نتيجة.")[:4000])
+            return
+    await update.message.reply_text(f"⌛ انتهت مهلة انتظار طلب التحليل #{request_id}؛ هل الـ Worker يعمل؟")
+
+# ==============================
+# 8. الدالة الرئيسية
+# ==============================
+metrics_server = None
+
+# PTB يحجز مكاناً في حد التوازي قبل process_update، فلو كان هو الحد لحجز منتظرو محادثة واحدة
+# كل الأماكن؛ لذا يُعطى حداً لا يُبلغ ويُطبق CONCURRENT_UPDATES بعد وصول دور المحادثة
+PTB_CONCURRENT_UPDATES = 1 << 20
+
+class OrderedApplication(Application):
+    """معالجة متوازية بين المحادثات مع الحفاظ على ترتيب التحديثات داخل المحادثة الواحدة."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # chat_id -> [القفل، عدد التحديثات المنتظرة أو الجارية]
+        self._chat_locks = {}
+        # التحديثات التي تنتظر دورها في محادثتها لا تحجز مكاناً هنا
+        self._update_slots = asyncio.BoundedSemaphore(CONCURRENT_UPDATES)
+
+    async def process_update(self, update):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._update_slots:
+                return await super().process_update(update)
+
+        # asyncio.Lock يحافظ على ترتيب الانتظار (FIFO) فتُعالج تحديثات المحادثة بترتيب وصولها
+        entry = self._chat_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._update_slots:
+                return await super().process_update(update)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[chat.id]
+
+def instrumented(route, callback):
+    """قياس زمن المعالج ونسبة استعلاماته إليه، وإتاحته لأمر /profile."""
+    return track_latency(route)(tag_handler(route)(profiled(route)(callback)))
+
+def button_route(update: Update, context):
+    return route_label(update.callback_query.data)
+
+async def flush_sql_stats_periodically():
+    while True:
+        await asyncio.sleep(SQL_STATS_FLUSH_SECONDS)
+        try:
+            flush_stats(engine, "bot")
+        except Exception as e:
+            logger.warning(f"تعذر حفظ إحصائيات الاستعلامات: {e}")
+
+async def post_init(application: Application):
+    """تشغيل المهام الخلفية بعد تهيئة التطبيق (بدون انتظار قاعدة البيانات)."""
+    global app_ready
+    if engine:
+        connected, detail = await asyncio.to_thread(check_database)
+        if connected:
+            print("✅ تم الاتصال بقاعدة البيانات بنجاح.")
+        else:
+            print(f"⚠️ {detail} (ستتم إعادة المحاولة مع أول استعلام)")
+        asyncio.create_task(flush_sql_stats_periodically())
+        asyncio.create_task(refresh_db_stats_periodically())
+        # إرسال إشعارات الحلقات الجديدة لمتابعيها (طابور يكتبه الـ Worker)
+        asyncio.create_task(NotificationSender(engine, application.bot).run())
+        asyncio.create_task(latest_feed.listen(engine))
+    app_ready = True
+
 def main():
+    if not BOT_TOKEN:
+        print("❌ خطأ: BOT_TOKEN غير موجود في متغيرات البيئة!")
+        exit(1)
+    if not DATABASE_URL:
+        print("⚠️ تحذير: DATABASE_URL غير موجود. قد لا تعرض المحتويات.")
+
     try:
-        app = Application.builder().token(BOT_TOKEN).build()
-        app.add_handler(CommandHandler("start", start))
-        app.add_handler(CommandHandler("series", series_command))
-        app.add_handler(CommandHandler("movies", movies_command))
-        app.add_handler(CommandHandler("all", all_command))
-        app.add_handler(CommandHandler("test", test_db_command))
-        app.add_handler(CommandHandler("debug_series", debug_series_command))
-        app.add_handler(CommandHandler("find_series", find_series_command))
-        app.add_handler(CommandHandler("find_episode", find_episode_command))
-        app.add_handler(CallbackQueryHandler(button_handler))
+        global metrics_server
+        # الخادم يبقى يعمل عند إعادة تشغيل main() بعد خطأ
+        if METRICS_PORT and metrics_server is None:
+            metrics_server = start_metrics_server(METRICS_PORT, readiness)
+        init_database()
+
+        app = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .application_class(OrderedApplication)
+            .concurrent_updates(PTB_CONCURRENT_UPDATES)
+            .request(InstrumentedRequest(connection_pool_size=256))
+            .post_init(post_init)
+            .build()
+        )
+        app.add_handler(CommandHandler("start", instrumented("/start", start)))
+        app.add_handler(CommandHandler("series", instrumented("/series", series_command)))
+        app.add_handler(CommandHandler("movies", instrumented("/movies", movies_command)))
+        app.add_handler(CommandHandler("all", instrumented("/all", all_command)))
+        app.add_handler(CommandHandler("latest", instrumented("/latest", show_latest)))
+        app.add_handler(CommandHandler("favorites", instrumented("/favorites", show_favorites)))
+        app.add_handler(CommandHandler("test", instrumented("/test", test_db_command)))
+        app.add_handler(CommandHandler("debug_series", instrumented("/debug_series", debug_series_command)))
+        app.add_handler(CommandHandler("find_series", instrumented("/find_series", find_series_command)))
+        app.add_handler(CommandHandler("find_episode", instrumented("/find_episode", find_episode_command)))
+        app.add_handler(CommandHandler("sql_stats", instrumented("/sql_stats", sql_stats_command)))
+        app.add_handler(CommandHandler("profile", profile_command))
+        app.add_handler(CallbackQueryHandler(profiled(button_route)(button_handler)))
 
         print("🤖 البوت يعمل...")
-        print(f"✅ قاعدة البيانات: {engine is not None}")
+        print(f"✅ قاعدة البيانات مُعدة: {engine is not None}")
+        print(f"✅ نسخة القراءة مُعدة: {read_engine is not None}")
+        print(f"✅ المعالجة المتوازية: حتى {CONCURRENT_UPDATES} تحديث")
         app.run_polling(poll_interval=1.0, timeout=30, drop_pending_updates=True)
     except Exception as e:
         print(f"❌ خطأ فادح: {e}")
@@ -0,0 +1,174 @@
+import re
+import logging
+import unicodedata
+
+# ==============================
+# تحليل نصوص رسائل القنوات (بدون أي اعتماد على Telethon أو قاعدة البيانات)
+# ==============================
+logger = logging.getLogger("caption_parser")
+
+def clean_name(name):
+    """تنظيف الاسم من كلمات 'مسلسل' و'فيلم' والأرقام في النهاية."""
+    if not name:
+        return name
+    
+    # إزالة كلمات "مسلسل" و"فيلم" من البداية
+    name = re.sub(r'^(مسلسل\s+|فيلم\s+)', '', name, flags=re.IGNORECASE)
+    
+    # إزالة كلمات "مسلسل" و"فيلم" من أي مكان (إذا كانت منفصلة)
+    name = re.sub(r'\s+(مسلسل|فيلم)\s+', ' ', name, flags=re.IGNORECASE)
+    
+    # تنظيف المسافات الزائدة
+    name = re.sub(r'\s+', ' ', name).strip()
+    
+    return name
+
+# تشكيل وحروف قرآنية ومد (ـ) لا تغير الاسم
+_ARABIC_MARKS = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+# أشكال حروف تُكتب بالتبادل في عناوين القنوات، والأرقام العربية الهندية
+_ARABIC_VARIANTS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه",
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},
+})
+
+def canonical_key(name):
+    """مفتاح موحد للاسم حتى لا تنشئ فروق الإملاء والمسافات وعلامات الترقيم محتويات مكررة."""
+    if not name:
+        return name
+    key = unicodedata.normalize("NFKC", name)
+    key = _ARABIC_MARKS.sub('', key).translate(_ARABIC_VARIANTS).casefold()
+    key = re.sub(r'[\W_]+', ' ', key).strip()
+    # اسم من علامات ترقيم فقط يبقى كما هو بدلاً من مفتاح فارغ
+    return key or name.strip().casefold()
+
+def extract_numbers_from_name(name):
+    """استخراج الأرقام من الاسم (مثل 13 من 'يوم-13')"""
+    match = re.search(r'[-_]?(\d+)$', name)
+    if match:
+        return int(match.group(1))
+    return None
+
+def parse_content_info(message_text):
+    """تحليل نص الرسالة لاستخراج المعلومات."""
+    if not message_text:
+        return None, None, None, None
+    
+    text_cleaned = message_text.strip()
+    
+    # 1. البحث عن نمط الأفلام
+    film_pattern_dash = r'^فيلم\s+(.+?)[-_](\d+)$'
+    match = re.search(film_pattern_dash, text_cleaned, re.IGNORECASE)
+    if match:
+        content_type = 'movie'
+        raw_name = match.group(1).strip()
+        season_num = int(match.group(2))
+        episode_num = 1
+        clean_name_text = clean_name(raw_name)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    film_pattern_space = r'^فيلم\s+(.+?)\s+(\d+)$'
+    match = re.search(film_pattern_space, text_cleaned, re.IGNORECASE)
+    if match:
+        content_type = 'movie'
+        raw_name = match.group(1).strip()
+        season_num = int(match.group(2))
+        episode_num = 1
+        clean_name_text = clean_name(raw_name)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    film_pattern_name_only = r'^فيلم\s+(.+)$'
+    match = re.search(film_pattern_name_only, text_cleaned, re.IGNORECASE)
+    if match:
+        content_type = 'movie'
+        raw_name = match.group(1).strip()
+        extracted_num = extract_numbers_from_name(raw_name)
+        if extracted_num:
+            raw_name = re.sub(r'[-_]?\d+$', '', raw_name).strip()
+            season_num = extracted_num
+        else:
+            season_num = 1
+        episode_num = 1
+        clean_name_text = clean_name(raw_name)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    # 2. البحث عن نمط المسلسل مع الموسم
+    series_season_pattern = r'^(.*?)\s+الموسم\s+(\d+)\s+الحلقة\s+(\d+)$'
+    match = re.search(series_season_pattern, text_cleaned)
+    if match:
+        content_type = 'series'
+        raw_name = match.group(1).strip()
+        season_num = int(match.group(2))
+        episode_num = int(match.group(3))
+        clean_name_text = clean_name(raw_name)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    # 3. البحث عن نمط المسلسل بدون موسم
+    series_episode_pattern = r'^(.*?)\s+الحلقة\s+(\d+)$'
+    match = re.search(series_episode_pattern, text_cleaned)
+    if match:
+        content_type = 'series'
+        raw_name = match.group(1).strip()
+        season_num = 1
+        episode_num = int(match.group(2))
+        clean_name_text = clean_name(raw_name)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    # 4. البحث عن نمط بسيط
+    simple_pattern = r'^(.*?[^\d\s])\s+(\d+)$'
+    match = re.search(simple_pattern, text_cleaned)
+    if match:
+        raw_name = match.group(1).strip()
+        
+        if 'فيلم' in raw_name.lower():
+            content_type = 'movie'
+            season_num = int(match.group(2))
+            episode_num = 1
+        else:
+            content_type = 'series'
+            season_num = 1
+            episode_num = int(match.group(2))
+        
+        clean_name_text = clean_name(raw_name)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    # 5. نمط المسلسل العربي
+    arabic_series_pattern = r'^مسلسل\s+(.*?)\s+الموسم\s+(\d+)\s+الحلقة\s+(\d+)$'
+    match = re.search(arabic_series_pattern, text_cleaned, re.IGNORECASE)
+    if match:
+        content_type = 'series'
+        raw_name = match.group(1).strip()
+        season_num = int(match.group(2))
+        episode_num = int(match.group(3))
+        clean_name_text = clean_name(raw_name)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    # 6. نمط المسلسل العربي بدون موسم
+    arabic_series_simple = r'^مسلسل\s+(.*?)\s+الحلقة\s+(\d+)$'
+    match = re.search(arabic_series_simple, text_cleaned, re.IGNORECASE)
+    if match:
+        content_type = 'series'
+        raw_name = match.group(1).strip()
+        season_num = 1
+        episode_num = int(match.group(2))
+        clean_name_text = clean_name(raw_name)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    logger.debug("⚠️ لم يتم التعرف على النمط للنص: %s", text_cleaned)
+    
+    # محاولة أخيرة: إذا كان النص يحتوي على "فيلم" في البداية
+    if text_cleaned.lower().startswith('فيلم'):
+        content_type = 'movie'
+        raw_name = text_cleaned[4:].strip()
+        extracted_num = extract_numbers_from_name(raw_name)
+        if extracted_num:
+            raw_name = re.sub(r'[-_]?\d+$', '', raw_name).strip()
+            season_num = extracted_num
+        else:
+            season_num = 1
+        episode_num = 1
+        clean_name_text = clean_name(raw_name)
+        logger.debug("⚠️ معالجة كفيلم افتراضي: %s", clean_name_text)
+        return clean_name_text, content_type, season_num, episode_num
+    
+    return None, None, None, None
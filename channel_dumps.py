@@ -0,0 +1,99 @@
+import json
+
+# ==============================
+# قراءة تصديرات القنوات بشكل متدفق (ذاكرة محدودة مهما كان حجم الملف)
+# ==============================
+# حجم القطعة المقروءة من الملف في كل مرة
+CHUNK_SIZE = 1 << 16
+
+def iter_dump(path):
+    """يُرجع (channel, message_id, text) لكل رسالة نصية؛ channel من الملف إن وجد وإلا None.
+    الصيغة تُحدد تلقائياً: ملف JSON من Telegram Desktop (result.json) أو JSON lines.
+    في تصدير Telegram Desktop تكون channel المعرف الرقمي (int) لأن الملف لا يتضمن اسم المستخدم."""
+    with open(path, encoding="utf-8") as f:
+        head = f.read(1)
+        while head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == "{" and not _is_jsonl(f):
+            yield from _iter_desktop_export(f)
+        else:
+            yield from _iter_jsonl(f)
+
+def _is_jsonl(f):
+    # في JSON lines يكون السطر الأول كائناً كاملاً
+    first_line = f.readline()
+    f.seek(0)
+    try:
+        record = json.loads(first_line)
+    except ValueError:
+        return False
+    # تصدير Telegram Desktop مضغوط في سطر واحد
+    return not (isinstance(record, dict) and "messages" in record)
+
+def _iter_jsonl(f):
+    """كل سطر: {"id": 123, "text": "...", "channel": "@name"} (channel اختياري، ويقبل message بدل text)."""
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"سطر غير صالح {line_number}: {e}") from None
+        text = record.get("text", record.get("message"))
+        if record.get("id") and text:
+            yield record.get("channel"), int(record["id"]), _flatten_text(text)
+
+def _iter_desktop_export(f):
+    """تصدير Telegram Desktop: رأس صغير (name, type, id) ثم مصفوفة messages تُقرأ رسالةً رسالة."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    marker = '"messages"'
+    while True:
+        index = buffer.find(marker)
+        if index != -1:
+            bracket = buffer.find("[", index + len(marker))
+            if bracket != -1:
+                break
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            raise ValueError("لم يتم العثور على مصفوفة messages في ملف التصدير")
+        buffer += chunk
+
+    # الرأس يسبق الرسائل في ملفات Telegram Desktop، فنكمله إلى JSON صالح
+    header = json.loads(buffer[:bracket + 1] + "]}")
+    channel = int(header["id"]) if header.get("id") else None
+    buffer = buffer[bracket + 1:]
+    position = 0
+
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ","):
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        message = None
+        if position < len(buffer):
+            try:
+                message, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                pass
+        if message is None:
+            # الرسالة لم تُقرأ كاملة بعد: نحذف ما عولج ونقرأ القطعة التالية
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                raise ValueError("انتهى ملف التصدير قبل اكتمال مصفوفة messages") from None
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if message.get("type", "message") != "message":
+            continue
+        text = _flatten_text(message.get("text", ""))
+        if text:
+            yield channel, int(message["id"]), text
+
+def _flatten_text(text):
+    # Telegram Desktop يقسم النص المنسق إلى أجزاء: نصوص عادية و {"type": "bold", "text": "..."}
+    if isinstance(text, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+    return text
@@ -0,0 +1,85 @@
+import os
+import math
+import random
+import socket
+import logging
+from sqlalchemy import text
+
+# ==============================
+# توزيع القنوات على عدة نسخ من الـ Worker عبر جدول عقود الملكية (leases)
+# ==============================
+# معرف هذه النسخة (يجب أن يكون فريداً لكل نسخة)
+WORKER_ID = os.environ.get("WORKER_ID", "") or f"{socket.gethostname()}-{os.getpid()}"
+# مدة صلاحية العقد بدون تجديد؛ بعدها تستطيع نسخة أخرى أخذ القناة
+LEASE_TTL_SECONDS = int(os.environ.get("LEASE_TTL_SECONDS", "30"))
+# الفاصل الزمني لتجديد العقود وإعادة التوزيع
+LEASE_HEARTBEAT_SECONDS = int(os.environ.get("LEASE_HEARTBEAT_SECONDS", "10"))
+
+logger = logging.getLogger("channel_leases")
+
+class ChannelLeaseManager:
+    """كل نسخة تجدد عقودها وتأخذ حصتها العادلة من القنوات (عدد القنوات ÷ عدد النسخ الحية)
+    وتتخلى عن الزائد حتى تحصل النسخ الجديدة على نصيبها. القناة التي يتوقف مالكها تنتقل بعد LEASE_TTL_SECONDS."""
+
+    def __init__(self, engine, channels, worker_id=WORKER_ID, ttl=LEASE_TTL_SECONDS):
+        self.engine = engine
+        # القنوات التي تستطيع هذه النسخة مراقبتها (حساب Telegram الخاص بها عضو فيها)
+        self.channels = list(channels)
+        self.worker_id = worker_id
+        self.ttl = ttl
+
+    def heartbeat(self):
+        """تجديد العقود وإعادة التوزيع في معاملة واحدة؛ يُرجع مجموعة القنوات المملوكة الآن."""
+        params = {"me": self.worker_id, "ttl": self.ttl}
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO worker_heartbeats (worker_id, heartbeat_at) VALUES (:me, NOW())
+                ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = NOW()
+            """), params)
+            conn.execute(text("""
+                DELETE FROM worker_heartbeats WHERE heartbeat_at < NOW() - make_interval(secs => :ttl * 10)
+            """), params)
+            owned = {row[0] for row in conn.execute(text("""
+                UPDATE channel_leases SET heartbeat_at = NOW()
+                WHERE worker_id = :me
+                RETURNING channel
+            """), params)}
+            live_workers = conn.execute(text("""
+                SELECT COUNT(*) FROM worker_heartbeats
+                WHERE heartbeat_at >= NOW() - make_interval(secs => :ttl)
+            """), params).scalar()
+
+            # قنوات لم تعد في قائمة هذه النسخة (تغيرت CHANNELS)
+            stale = owned - set(self.channels)
+            target = math.ceil(len(self.channels) / max(live_workers, 1))
+            excess = sorted(owned - stale)[target:]
+            released = stale | set(excess)
+            if released:
+                conn.execute(text("""
+                    DELETE FROM channel_leases WHERE worker_id = :me AND channel = ANY(:channels)
+                """), {**params, "channels": list(released)})
+                owned -= released
+
+            candidates = [channel for channel in self.channels if channel not in owned]
+            random.shuffle(candidates)
+            for channel in candidates:
+                if len(owned) >= target:
+                    break
+                claimed = conn.execute(text("""
+                    INSERT INTO channel_leases (channel, worker_id, heartbeat_at, acquired_at)
+                    VALUES (:channel, :me, NOW(), NOW())
+                    ON CONFLICT (channel) DO UPDATE
+                    SET worker_id = EXCLUDED.worker_id, heartbeat_at = NOW(), acquired_at = NOW()
+                    WHERE channel_leases.heartbeat_at < NOW() - make_interval(secs => :ttl)
+                    RETURNING channel
+                """), {**params, "channel": channel}).fetchone()
+                if claimed:
+                    owned.add(channel)
+        return owned
+
+    def release_all(self):
+        """التخلي عن كل القنوات عند الإيقاف حتى تأخذها النسخ الأخرى فوراً بدلاً من انتظار انتهاء العقد."""
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM channel_leases WHERE worker_id = :me"), {"me": self.worker_id})
+            conn.execute(text("DELETE FROM worker_heartbeats WHERE worker_id = :me"), {"me": self.worker_id})
+        logger.info(f"🔓 تم التخلي عن عقود القنوات ({self.worker_id})")
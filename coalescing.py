@@ -0,0 +1,66 @@
+import os
+import time
+import asyncio
+import functools
+from metrics import COALESCED_CALLS, DEBOUNCED_TAPS
+from profiling import profile_call
+
+# ==============================
+# 1. دمج الاستعلامات المتطابقة الجارية (Single-flight)
+# ==============================
+class SingleFlight:
+    """الطلبات المتطابقة التي تصل أثناء تنفيذ استعلام تنتظر نتيجته بدلاً من تنفيذه مجدداً."""
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key, func, *args):
+        future = self._inflight.get(key)
+        if future is None:
+            # الاستعلامات متزامنة (SQLAlchemy)، لذا تُنفذ في خيط حتى لا تعطل حلقة الأحداث
+            future = asyncio.ensure_future(asyncio.to_thread(profile_call, func, *args))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            COALESCED_CALLS.labels(key[0]).inc()
+        # إلغاء أحد المنتظرين لا يلغي الاستعلام على الباقين
+        return await asyncio.shield(future)
+
+_flights = SingleFlight()
+
+def coalesced(func):
+    """تحويل دالة استعلام متزامنة إلى دالة غير متزامنة تُدمج استدعاءاتها المتطابقة المتزامنة."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = (func.__name__,) + args + tuple(sorted(kwargs.items()))
+        return await _flights.do(key, functools.partial(func, *args, **kwargs))
+    return wrapper
+
+# ==============================
+# 2. تجاهل الضغطات المكررة لنفس الزر
+# ==============================
+# النافذة (بالثواني) التي تُتجاهل خلالها نفس بيانات الزر من نفس المستخدم (0 = معطل)
+TAP_DEBOUNCE_SECONDS = float(os.environ.get("TAP_DEBOUNCE_SECONDS", "1.0"))
+
+class TapDebouncer:
+    def __init__(self, window):
+        self.window = window
+        self._last_taps = {}
+
+    def is_duplicate(self, user_id, data):
+        """هل ضغط المستخدم نفس الزر خلال النافذة؟ (يسجل الضغطة إن لم تكن مكررة)"""
+        if self.window <= 0:
+            return False
+        now = time.monotonic()
+        key = (user_id, data)
+        last = self._last_taps.get(key)
+        if last is not None and now - last < self.window:
+            DEBOUNCED_TAPS.inc()
+            return True
+        self._last_taps[key] = now
+        if len(self._last_taps) > 10000:
+            # إزالة الضغطات القديمة حتى لا يكبر القاموس بلا حد
+            self._last_taps = {k: t for k, t in self._last_taps.items() if now - t < self.window}
+        return False
+
+tap_debouncer = TapDebouncer(TAP_DEBOUNCE_SECONDS)
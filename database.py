@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -21,6 +21,7 @@ class Series(Base):
     
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False, unique=True)  # هذا العمود موجود
+    canonical_key = Column(String(255))  # المفتاح الموحد للاسم (caption_parser.canonical_key)
     created_at = Column(DateTime, default=datetime.utcnow)   # هذا موجود
     # احذف الأعمدة التالية إذا كانت موجودة في كودك:
     # description = Column(Text)
@@ -46,7 +47,7 @@ class UserFavorite(Base):
     __tablename__ = 'user_favorites'
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
     series_id = Column(Integer, nullable=False)
     added_at = Column(DateTime, default=datetime.utcnow)
 
@@ -76,5 +77,5 @@ class DatabaseManager:
     def close(self):
         self.session.close()
 
-# تهيئة قاعدة البيانات عند الاستيراد
-init_db()
+# لا تُنشأ الجداول عند الاستيراد؛ استدعِ init_db() صراحةً عند الحاجة
+# (الجداول الفعلية يُنشئها الـ Worker عبر schema.ensure_schema)
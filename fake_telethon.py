@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timedelta
+from telethon import events, types
+from telethon.utils import get_peer_id
+
+# ==============================
+# عميل Telethon وهمي لإعادة تشغيل قنوات اصطناعية بدون اتصال بـ Telegram
+# ==============================
+class FakeChannel(types.Channel):
+    """كيان قناة حقيقي من Telethon (حتى تعمل get_peer_id ومعرفات الأحداث مثل -100...)."""
+
+    def __init__(self, channel_id, title, username=None, access_hash=0):
+        super().__init__(
+            id=channel_id, title=title, photo=types.ChatPhotoEmpty(), date=None,
+            username=username, access_hash=access_hash
+        )
+
+class FakeMessage:
+    def __init__(self, message_id, text, chat, date=None, media=None):
+        self.id = message_id
+        self.text = text
+        self.message = text
+        self.raw_text = text
+        self.chat = chat
+        self.chat_id = get_peer_id(chat)
+        self.date = date or datetime.utcnow()
+        self.media = media
+
+class FakeNewMessageEvent:
+    def __init__(self, message):
+        self.message = message
+        self.chat = message.chat
+        self.chat_id = message.chat_id
+
+class FakeMessageDeletedEvent:
+    def __init__(self, channel, deleted_ids):
+        self.chat = channel
+        self.chat_id = get_peer_id(channel) if channel else None
+        self.deleted_ids = list(deleted_ids)
+
+class FakeTelegramClient:
+    """يحاكي واجهات Telethon التي يستخدمها الـ Worker: iter_messages و get_messages و get_entity وتوزيع الأحداث."""
+
+    def __init__(self):
+        # channel_id -> {"channel": FakeChannel, "messages": {id: FakeMessage}}
+        self.channels = {}
+        self.handlers = []
+        self.calls = {"iter_messages": 0, "get_messages": 0, "get_entity": 0}
+        self.me = types.User(id=777000, access_hash=0, bot=False)
+        self._disconnected = asyncio.Event()
+        self._connected = False
+
+    # ---- بناء القنوات الاصطناعية ----
+    def add_channel(self, channel, captions, start_id=1):
+        """إضافة قناة برسائل متتالية المعرفات (captions قابلة للتكرار بأي حجم)."""
+        messages = {}
+        base_date = datetime.utcnow() - timedelta(days=365)
+        for offset, caption in enumerate(captions):
+            message_id = start_id + offset
+            messages[message_id] = FakeMessage(message_id, caption, channel, base_date + timedelta(minutes=offset))
+        self.channels[channel.id] = {"channel": channel, "messages": messages}
+        return channel
+
+    def post_message(self, channel, caption):
+        """نشر رسالة جديدة في القناة (بدون توزيع حدث)."""
+        messages = self.channels[channel.id]["messages"]
+        message_id = max(messages, default=0) + 1
+        message = FakeMessage(message_id, caption, channel)
+        messages[message_id] = message
+        return message
+
+    def delete_messages(self, channel, message_ids):
+        messages = self.channels[channel.id]["messages"]
+        for message_id in message_ids:
+            messages.pop(message_id, None)
+
+    def _resolve(self, entity):
+        if isinstance(entity, types.Channel):
+            return self.channels[entity.id]
+        for entry in self.channels.values():
+            channel = entry["channel"]
+            if entity in (channel.id, channel.username, f"@{channel.username}", channel.title) or \
+                    (isinstance(entity, str) and channel.username and entity.rstrip('/').endswith(f"/{channel.username}")):
+                return entry
+        raise ValueError(f"Cannot find any entity corresponding to \"{entity}\"")
+
+    # ---- الاتصال ----
+    async def start(self, *args, **kwargs):
+        self._connected = True
+        self._disconnected.clear()
+        return self
+
+    async def connect(self):
+        self._connected = True
+        self._disconnected.clear()
+
+    def is_connected(self):
+        return self._connected
+
+    async def disconnect(self):
+        self._connected = False
+        self._disconnected.set()
+
+    async def run_until_disconnected(self):
+        await self._disconnected.wait()
+
+    # ---- واجهات القراءة ----
+    async def get_me(self, input_peer=False):
+        return types.InputPeerUser(self.me.id, self.me.access_hash) if input_peer else self.me
+
+    async def get_entity(self, entity):
+        self.calls["get_entity"] += 1
+        return self._resolve(entity)["channel"]
+
+    async def get_input_entity(self, entity):
+        return await self.get_entity(entity)
+
+    async def iter_messages(self, entity, limit=None, min_id=0, max_id=0, reverse=False, ids=None, **kwargs):
+        self.calls["iter_messages"] += 1
+        messages = self._resolve(entity)["messages"]
+        if ids is not None:
+            for message_id in (ids if isinstance(ids, list) else [ids]):
+                yield messages.get(message_id)
+            return
+        message_ids = sorted(
+            (message_id for message_id in messages
+             if message_id > min_id and (not max_id or message_id < max_id)),
+            reverse=not reverse
+        )
+        if limit is not None:
+            # مثل Telethon: الأحدث أولاً، أو الأقدم أولاً بدءاً من min_id عند reverse
+            message_ids = message_ids[:limit]
+        for index, message_id in enumerate(message_ids):
+            if index and index % 100 == 0:
+                # إفساح المجال لحلقة الأحداث كما تفعل الصفحات الحقيقية
+                await asyncio.sleep(0)
+            yield messages[message_id]
+
+    async def get_messages(self, entity, limit=None, ids=None, **kwargs):
+        self.calls["get_messages"] += 1
+        if ids is not None and not isinstance(ids, list):
+            return self._resolve(entity)["messages"].get(ids)
+        return [message async for message in self.iter_messages(entity, limit=limit, ids=ids, **kwargs)]
+
+    # ---- الأحداث ----
+    def on(self, event_builder):
+        def decorator(callback):
+            self.handlers.append((event_builder, callback))
+            return callback
+        return decorator
+
+    def add_event_handler(self, callback, event_builder):
+        self.handlers.append((event_builder, callback))
+
+    def _matches(self, event_builder, channel):
+        chats = getattr(event_builder, "chats", None)
+        if not chats:
+            return True
+        return any(getattr(chat, "id", chat) == channel.id for chat in chats)
+
+    async def dispatch_new_message(self, message):
+        """توزيع رسالة جديدة على معالجات NewMessage المسجلة."""
+        event = FakeNewMessageEvent(message)
+        for event_builder, callback in self.handlers:
+            if isinstance(event_builder, events.NewMessage) and self._matches(event_builder, message.chat):
+                await callback(event)
+
+    async def dispatch_deleted(self, channel, message_ids):
+        """حذف رسائل وتوزيع حدث MessageDeleted."""
+        self.delete_messages(channel, message_ids)
+        event = FakeMessageDeletedEvent(channel, message_ids)
+        for event_builder, callback in self.handlers:
+            if isinstance(event_builder, events.MessageDeleted):
+                await callback(event)
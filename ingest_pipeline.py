@@ -0,0 +1,97 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from caption_parser import parse_content_info
+
+# ==============================
+# استيراد على مراحل: جلب ← تحليل في عمليات منفصلة ← كتابة (بطوابير محدودة بينها)
+# ==============================
+# عدد عمليات التحليل (1 = التحليل داخل حلقة الأحداث بدون عمليات إضافية)
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# عدد الدفعات المنتظرة بين كل مرحلتين (يحد الذاكرة ويبطئ الجلب عندما تتأخر الكتابة)
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "4"))
+
+_pool = None
+
+def _parse_pool():
+    # spawn بدلاً من fork لأن العملية الرئيسية فيها خيوط (مجمع الاتصالات و asyncio.to_thread)
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def parse_chunk(chunk):
+    """chunk: قائمة (channel_id, message_id, text).
+    يُرجع (rows بصيغة save_episodes_batch، unparsed بصيغة save_unparsed_batch، آخر رسالة لكل قناة)."""
+    rows = []
+    unparsed = []
+    last_ids = {}
+    for channel_id, message_id, message_text in chunk:
+        last_ids[channel_id] = max(last_ids.get(channel_id, 0), message_id)
+        if not message_text:
+            continue
+        try:
+            name, content_type, season_num, episode_num = parse_content_info(message_text)
+        except Exception:
+            name = None
+        if name and content_type and episode_num:
+            rows.append((name, content_type, season_num, episode_num, message_id, channel_id))
+        else:
+            unparsed.append((channel_id, message_id, message_text))
+    return rows, unparsed, last_ids
+
+async def run_pipeline(chunks, write, chunk_size):
+    """chunks: مولد غير متزامن لدفعات الرسائل (مرحلة الجلب).
+    write(rows, unparsed, last_ids): دالة متزامنة تُنفذ في خيط بترتيب الدفعات الأصلي،
+    حتى لا تتجاوز نقطة التقدم دفعة لم تُكتب بعد."""
+    parsers = max(1, PARSE_WORKERS)
+    fetched = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    parsed = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    async def fetch_stage():
+        sequence = 0
+        async for chunk in chunks:
+            await fetched.put((sequence, chunk))
+            sequence += 1
+        for _ in range(parsers):
+            await fetched.put(None)
+
+    async def parse_stage():
+        loop = asyncio.get_running_loop()
+        while (item := await fetched.get()) is not None:
+            sequence, chunk = item
+            # العمليات تُستخدم فقط عندما يسبق الجلبُ التحليلَ (مثل قراءة ملف من القرص)؛
+            # جلب Telegram أبطأ من التحليل بكثير، ونقل الدفعات الصغيرة لعملية أخرى أغلى من تحليلها
+            if PARSE_WORKERS > 1 and len(chunk) >= chunk_size and not fetched.empty():
+                result = await loop.run_in_executor(_parse_pool(), parse_chunk, chunk)
+            else:
+                result = parse_chunk(chunk)
+            await parsed.put((sequence, result))
+        await parsed.put(None)
+
+    async def write_stage():
+        pending = {}
+        next_sequence = 0
+        finished = 0
+        while finished < parsers:
+            item = await parsed.get()
+            if item is None:
+                finished += 1
+                continue
+            pending[item[0]] = item[1]
+            while next_sequence in pending:
+                await asyncio.to_thread(write, *pending.pop(next_sequence))
+                next_sequence += 1
+
+    tasks = [
+        asyncio.create_task(fetch_stage()),
+        *(asyncio.create_task(parse_stage()) for _ in range(parsers)),
+        asyncio.create_task(write_stage()),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # فشل أي مرحلة يوقف الباقي بدلاً من انتظار طابور لن يُملأ
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,98 @@
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+from sqlalchemy import text
+
+# ==============================
+# آخر الإضافات في الذاكرة (يغذيها الـ Worker عبر LISTEN/NOTIFY)
+# ==============================
+# عدد الحلقات المحفوظة في الذاكرة
+LATEST_FEED_SIZE = int(os.environ.get("LATEST_FEED_SIZE", "50"))
+# قناة الإشعارات التي يرسل عليها الـ Worker كل حلقة جديدة
+NEW_EPISODE_CHANNEL = "new_episode"
+
+logger = logging.getLogger("latest_feed")
+
+class LatestFeed:
+    """حلقة دائرية محدودة الحجم؛ العرض يقرأ منها فقط ولا يلمس جدول episodes."""
+
+    def __init__(self, size=LATEST_FEED_SIZE):
+        self.items = deque(maxlen=size)
+        self._ids = set()
+
+    def load(self, engine):
+        """تعبئة أولية من قاعدة البيانات (تستخدم فهرس added_at) عند التشغيل وبعد انقطاع الاستماع."""
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT e.id, e.series_id, s.name, s.type, e.season, e.episode_number
+                FROM episodes e JOIN series s ON s.id = e.series_id
+                ORDER BY e.added_at DESC, e.id DESC
+                LIMIT :limit
+            """), {"limit": self.items.maxlen}).fetchall()
+        self.items.clear()
+        self._ids.clear()
+        for row in reversed(rows):
+            self.add(dict(zip(("episode_id", "series_id", "name", "type", "season", "episode_number"), row)))
+
+    def add(self, item):
+        if item["episode_id"] in self._ids:
+            return
+        if len(self.items) == self.items.maxlen:
+            self._ids.discard(self.items[0]["episode_id"])
+        self.items.append(item)
+        self._ids.add(item["episode_id"])
+
+    def latest(self, limit=20):
+        return list(reversed(self.items))[:limit]
+
+    async def listen(self, engine):
+        """الاستماع لقناة new_episode على القاعدة الرئيسية (نسخ القراءة لا تنقل الإشعارات)."""
+        delay = 1
+        while True:
+            raw = None
+            try:
+                raw = await asyncio.to_thread(engine.raw_connection)
+                dbapi_connection = raw.driver_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NEW_EPISODE_CHANNEL}")
+                # ما أُضيف أثناء الانقطاع لم يصل كإشعار، لذا نعيد التعبئة بعد بدء الاستماع
+                await asyncio.to_thread(self.load, engine)
+                logger.info(f"📰 الاستماع لقناة {NEW_EPISODE_CHANNEL} ({len(self.items)} حلقة في الذاكرة)")
+                delay = 1
+                await self._consume(dbapi_connection)
+            except Exception as e:
+                logger.warning(f"⚠️ انقطع الاستماع لآخر الإضافات، إعادة المحاولة بعد {delay} ثانية: {e}")
+            finally:
+                if raw is not None:
+                    try:
+                        raw.invalidate()
+                    except Exception:
+                        pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def _consume(self, dbapi_connection):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(dbapi_connection.fileno(), ready.set)
+        try:
+            while True:
+                # انتظار مع مهلة لاكتشاف انقطاع الاتصال الصامت
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout=60)
+                except asyncio.TimeoutError:
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                ready.clear()
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    try:
+                        self.add(json.loads(notify.payload))
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"⚠️ إشعار غير صالح على {NEW_EPISODE_CHANNEL}: {e}")
+        finally:
+            loop.remove_reader(dbapi_connection.fileno())
@@ -0,0 +1,81 @@
+import os
+import logging
+from sqlalchemy import text
+
+# ==============================
+# انتخاب نسخة قائدة واحدة من الـ Worker عبر قفل استشاري في Postgres
+# ==============================
+# مفتاح القفل (يجب أن يكون نفسه في كل النسخ التي تراقب نفس القنوات)
+LEADER_LOCK_KEY = int(os.environ.get("LEADER_LOCK_KEY", "7240413"))
+# الفاصل الزمني لمحاولة أخذ القيادة في النسخ الاحتياطية والتحقق منها في القائدة
+LEADER_RETRY_SECONDS = int(os.environ.get("LEADER_RETRY_SECONDS", "3"))
+
+logger = logging.getLogger("leader_election")
+
+class AdvisoryLeader:
+    """القفل مرتبط بجلسة الاتصال: يبقى الاتصال مفتوحاً طوال القيادة، وعند توقف القائدة
+    يحرره Postgres فوراً مع انتهاء الجلسة فتأخذه نسخة احتياطية في المحاولة التالية."""
+
+    def __init__(self, engine, key=LEADER_LOCK_KEY):
+        self.engine = engine
+        self.key = key
+        self._connection = None
+
+    @property
+    def is_leader(self):
+        return self._connection is not None
+
+    def try_acquire(self):
+        if self._connection is not None:
+            return True
+        connection = self.engine.connect()
+        try:
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        logger.info(f"👑 أصبحت هذه النسخة القائدة (القفل {self.key})")
+        return True
+
+    def check(self):
+        """التحقق من أن الجلسة التي تملك القفل ما زالت حية؛ يُرجع False ويتخلى عن القيادة إن انقطعت."""
+        if self._connection is None:
+            return False
+        try:
+            held = self._connection.execute(text("""
+                SELECT EXISTS (
+                    SELECT 1 FROM pg_locks
+                    WHERE locktype = 'advisory' AND pid = pg_backend_pid() AND granted
+                )
+            """)).scalar()
+            self._connection.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ انقطع اتصال قفل القيادة: {e}")
+            held = False
+        if not held:
+            self._drop()
+        return held
+
+    def release(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            self._connection.commit()
+            logger.info("🔓 تم التخلي عن القيادة")
+        finally:
+            self._drop()
+
+    def _drop(self):
+        # لا نعيد الاتصال إلى المجمع لأن القفل مرتبط بجلسته
+        connection, self._connection = self._connection, None
+        try:
+            connection.invalidate()
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,219 @@
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime
+from collections import defaultdict
+
+from telegram import Update, CallbackQuery, Message, Chat, User
+from sqlalchemy import text
+from schema import ensure_schema
+import bot
+
+# ==============================
+# 1. بديل Telegram API
+# ==============================
+class StubBot:
+    """يستقبل كل استدعاءات Bot API ويحاكي زمن الشبكة بدون أي اتصال حقيقي."""
+    def __init__(self, api_latency):
+        self.api_latency = api_latency
+        self.username = "load_test_bot"
+        self.calls = defaultdict(int)
+
+    async def _call(self, method):
+        self.calls[method] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        return True
+
+    async def answer_callback_query(self, *args, **kwargs):
+        return await self._call("answerCallbackQuery")
+
+    async def edit_message_text(self, *args, **kwargs):
+        return await self._call("editMessageText")
+
+    async def send_message(self, *args, **kwargs):
+        return await self._call("sendMessage")
+
+    async def copy_message(self, *args, **kwargs):
+        return await self._call("copyMessage")
+
+class FakeContext:
+    """بديل خفيف لـ CallbackContext (المعالجات تستخدم args و bot فقط)."""
+    def __init__(self, stub_bot, args=None):
+        self.bot = stub_bot
+        self.args = args or []
+        self.user_data = {}
+        self.chat_data = {}
+
+_update_ids = iter(range(1, sys.maxsize))
+
+def make_user(user_id):
+    return User(id=user_id, first_name=f"user{user_id}", is_bot=False)
+
+def make_message(stub_bot, user, text_value=None):
+    chat = Chat(id=user.id, type=Chat.PRIVATE)
+    message = Message(
+        message_id=next(_update_ids), date=datetime.utcnow(), chat=chat,
+        from_user=user, text=text_value
+    )
+    message.set_bot(stub_bot)
+    return message
+
+def make_command_update(stub_bot, user, command):
+    message = make_message(stub_bot, user, command)
+    update = Update(update_id=next(_update_ids), message=message)
+    update.set_bot(stub_bot)
+    return update
+
+def make_callback_update(stub_bot, user, data):
+    query = CallbackQuery(
+        id=str(next(_update_ids)), from_user=user, chat_instance="load-test",
+        message=make_message(stub_bot, user), data=data
+    )
+    query.set_bot(stub_bot)
+    update = Update(update_id=next(_update_ids), callback_query=query)
+    update.set_bot(stub_bot)
+    return update
+
+# ==============================
+# 2. تجهيز البيانات
+# ==============================
+def seed_database(engine, series_count, episodes_per_series):
+    """إضافة محتوى تجريبي (يمكن تكراره بأمان)."""
+    ensure_schema(engine)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO series (name, type)
+            SELECT 'محتوى تجريبي ' || g, CASE WHEN g % 5 = 0 THEN 'movie' ELSE 'series' END
+            FROM generate_series(1, :count) g
+            ON CONFLICT DO NOTHING
+        """), {"count": series_count})
+        conn.execute(text("""
+            INSERT INTO episodes (series_id, season, episode_number, telegram_message_id, telegram_channel_id)
+            SELECT s.id, 1 + (e - 1) / 30, 1 + (e - 1) % 30, s.id * 10000 + e, '@load_test'
+            FROM series s CROSS JOIN generate_series(1, :episodes) e
+            WHERE s.name LIKE 'محتوى تجريبي %'
+            ON CONFLICT DO NOTHING
+        """), {"episodes": episodes_per_series})
+    print(f"🌱 تم تجهيز {series_count} محتوى × {episodes_per_series} حلقة.")
+
+def load_targets(engine):
+    """عينة من المعرفات الحقيقية لتوليد أزرار صالحة."""
+    with engine.connect() as conn:
+        series = conn.execute(text("SELECT id FROM series ORDER BY random() LIMIT 500")).fetchall()
+        seasons = conn.execute(text("""
+            SELECT DISTINCT series_id, season FROM episodes ORDER BY series_id LIMIT 2000
+        """)).fetchall()
+        episodes = conn.execute(text("""
+            SELECT id, telegram_message_id FROM episodes ORDER BY random() LIMIT 2000
+        """)).fetchall()
+        names = conn.execute(text("SELECT name FROM series ORDER BY random() LIMIT 200")).fetchall()
+    if not series or not episodes:
+        raise RuntimeError("قاعدة البيانات فارغة؛ استخدم --seed لإضافة محتوى تجريبي.")
+    return {
+        "series": [row[0] for row in series],
+        "seasons": [(row[0], row[1]) for row in seasons],
+        "episodes": [row[0] for row in episodes],
+        "messages": [row[1] for row in episodes],
+        "words": [word for row in names for word in row[0].split()][:500],
+    }
+
+# ==============================
+# 3. المسارات وتوليد الحمل
+# ==============================
+def pick_request(rng, stub_bot, user, targets):
+    """اختيار طلب عشوائي بتوزيع يشبه رحلة المستخدم: (المسار، دالة التنفيذ)."""
+    roll = rng.random()
+    if roll < 0.15:
+        update = make_callback_update(stub_bot, user, rng.choice(["series_list", "movies_list", "all_content"]))
+        return "button:list", lambda: bot.button_handler(update, FakeContext(stub_bot))
+    if roll < 0.40:
+        update = make_callback_update(stub_bot, user, f"content_{rng.choice(targets['series'])}")
+        return "button:content_", lambda: bot.button_handler(update, FakeContext(stub_bot))
+    if roll < 0.60 and targets["seasons"]:
+        series_id, season = rng.choice(targets["seasons"])
+        update = make_callback_update(stub_bot, user, f"season_{series_id}_{season}")
+        return "button:season_", lambda: bot.button_handler(update, FakeContext(stub_bot))
+    if roll < 0.80:
+        update = make_callback_update(stub_bot, user, f"ep_{rng.choice(targets['episodes'])}")
+        return "button:ep_", lambda: bot.button_handler(update, FakeContext(stub_bot))
+    if roll < 0.88:
+        update = make_command_update(stub_bot, user, "/series")
+        return "show_content", lambda: bot.show_content(update, FakeContext(stub_bot), 'series')
+    if roll < 0.95:
+        word = rng.choice(targets["words"]) if targets["words"] else "محتوى"
+        update = make_command_update(stub_bot, user, f"/find_series {word}")
+        return "/find_series", lambda: bot.find_series_command(update, FakeContext(stub_bot, [word]))
+    msg_id = str(rng.choice(targets["messages"]))
+    update = make_command_update(stub_bot, user, f"/find_episode {msg_id}")
+    return "/find_episode", lambda: bot.find_episode_command(update, FakeContext(stub_bot, [msg_id]))
+
+async def virtual_user(user_id, requests_count, stub_bot, targets, latencies, seed):
+    rng = random.Random(seed + user_id)
+    user = make_user(user_id)
+    for _ in range(requests_count):
+        route, run = pick_request(rng, stub_bot, user, targets)
+        start = time.perf_counter()
+        await run()
+        latencies[route].append(time.perf_counter() - start)
+
+def percentile(sorted_values, fraction):
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def report(latencies, elapsed, stub_bot):
+    total = sum(len(values) for values in latencies.values())
+    print("\n" + "=" * 72)
+    print(f"📊 {total} طلب في {elapsed:.2f} ثانية = {total / elapsed:,.1f} طلب/ثانية")
+    print("=" * 72)
+    print(f"{'المسار':<18}{'العدد':>8}{'طلب/ث':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route in sorted(latencies):
+        values = sorted(latencies[route])
+        print(
+            f"{route:<18}{len(values):>8}{len(values) / elapsed:>10.1f}"
+            f"{percentile(values, 0.50) * 1000:>10.1f}"
+            f"{percentile(values, 0.95) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}"
+        )
+    print(f"\n📡 استدعاءات Telegram API المحاكاة: {dict(stub_bot.calls)}")
+
+async def run_load(users, requests_per_user, api_latency, seed):
+    targets = load_targets(bot.engine)
+    stub_bot = StubBot(api_latency)
+    latencies = defaultdict(list)
+    print(f"🚀 {users} مستخدم متزامن × {requests_per_user} طلب (زمن API محاكى {api_latency * 1000:.0f} ms)...")
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        virtual_user(user_id, requests_per_user, stub_bot, targets, latencies, seed)
+        for user_id in range(1, users + 1)
+    ))
+    report(latencies, time.perf_counter() - start, stub_bot)
+
+# ==============================
+# 4. نقطة دخول البرنامج
+# ==============================
+def main():
+    parser = argparse.ArgumentParser(description="اختبار حمل البوت بمستخدمين متزامنين (Telegram API مُستبدل)")
+    parser.add_argument("--users", type=int, default=50, help="عدد المستخدمين المتزامنين")
+    parser.add_argument("--requests", type=int, default=40, help="عدد الطلبات لكل مستخدم")
+    parser.add_argument("--api-latency-ms", type=float, default=30, help="زمن استدعاء Telegram API المحاكى")
+    parser.add_argument("--seed", action="store_true", help="إضافة محتوى تجريبي قبل الاختبار")
+    parser.add_argument("--seed-series", type=int, default=500)
+    parser.add_argument("--seed-episodes", type=int, default=60)
+    parser.add_argument("--random-seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    bot.init_database()
+    if bot.engine is None:
+        print("❌ DATABASE_URL غير صالح؛ اختبار الحمل يحتاج قاعدة بيانات محلية.")
+        sys.exit(1)
+    if args.seed:
+        seed_database(bot.engine, args.seed_series, args.seed_episodes)
+
+    asyncio.run(run_load(args.users, args.requests, args.api_latency_ms / 1000, args.random_seed))
+
+if __name__ == "__main__":
+    main()
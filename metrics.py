@@ -0,0 +1,137 @@
+import re
+import time
+import threading
+import functools
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import event
+
+logger = logging.getLogger("metrics")
+
+# ==============================
+# 1. تعريف المقاييس المشتركة بين البوت والـ Worker
+# ==============================
+HANDLER_LATENCY = Histogram(
+    "bot_handler_latency_seconds", "زمن تنفيذ معالجات البوت حسب المسار", ["route"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_latency_seconds", "زمن تنفيذ استعلامات قاعدة البيانات", ["engine"]
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections", "عدد الاتصالات المستخدمة حالياً من المجمع", ["engine"]
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size", "الحجم الأساسي لمجمع الاتصالات", ["engine"]
+)
+TELEGRAM_API_LATENCY = Histogram(
+    "telegram_api_latency_seconds", "زمن استدعاءات Telegram API حسب الطريقة", ["method"]
+)
+INGESTED_MESSAGES = Counter(
+    "worker_ingested_messages_total", "الرسائل التي عالجها الـ Worker حسب النتيجة", ["result"]
+)
+PARSE_FAILURES = Counter(
+    "worker_parse_failures_total", "الرسائل التي لم يتم التعرف على نمطها"
+)
+WORKER_QUEUE_DEPTH = Gauge(
+    "worker_queue_depth", "عدد الرسائل بانتظار المعالجة في الـ Worker", ["stage"]
+)
+COALESCED_CALLS = Counter(
+    "bot_coalesced_calls_total", "استعلامات تم دمجها مع استعلام مطابق جارٍ بدلاً من تنفيذها", ["query"]
+)
+DEBOUNCED_TAPS = Counter(
+    "bot_debounced_taps_total", "ضغطات أزرار مكررة تم تجاهلها"
+)
+NOTIFICATIONS_SENT = Counter(
+    "bot_notifications_total", "إشعارات الحلقات الجديدة حسب النتيجة", ["result"]
+)
+
+# المسارات المعروفة لأزرار البوت (لتجنب تضخم عدد التسميات بسبب المعرفات)
+KNOWN_ROUTES = {
+    "home", "test_db", "all_content", "series_list", "movies_list", "page_info", "page",
+    "content_page", "content", "ep", "season_page", "season", "fav", "unfav", "favorites", "latest", "send",
+}
+
+def route_label(callback_data):
+    """تحويل بيانات الزر إلى تسمية مسار ثابتة (مثل content_123 → content_)."""
+    if not callback_data:
+        return "unknown"
+    route = re.sub(r"_-?\d+", "", callback_data)
+    if route not in KNOWN_ROUTES:
+        return "other"
+    return f"{route}_" if route != callback_data else route
+
+# ==============================
+# 2. أدوات القياس
+# ==============================
+def track_latency(route):
+    """مُزخرف يسجل زمن تنفيذ معالج غير متزامن تحت المسار المحدد."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                HANDLER_LATENCY.labels(route).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def instrument_engine(engine, name):
+    """ربط أحداث SQLAlchemy لقياس زمن الاستعلامات وتشبع مجمع الاتصالات."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start_time = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start_time", None)
+        if start is not None:
+            DB_QUERY_LATENCY.labels(name).observe(time.perf_counter() - start)
+
+    pool = engine.pool
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CHECKED_OUT.labels(name).set_function(pool.checkedout)
+    if hasattr(pool, "size"):
+        DB_POOL_SIZE.labels(name).set_function(pool.size)
+
+# ==============================
+# 3. خادم HTTP لنقطة /metrics
+# ==============================
+class MetricsHandler(BaseHTTPRequestHandler):
+    # دالة الجاهزية للعملية: () -> (جاهز، وصف)
+    readiness = None
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._reply(200, generate_latest(), CONTENT_TYPE_LATEST)
+        elif path == "/ready":
+            check = type(self).readiness
+            ready, detail = check() if check else (True, "ok")
+            self._reply(200 if ready else 503, detail.encode("utf-8"), "text/plain; charset=utf-8")
+        elif path == "/live":
+            self._reply(200, b"ok", "text/plain; charset=utf-8")
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def _reply(self, status, output, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(output)))
+        self.end_headers()
+        self.wfile.write(output)
+
+    def log_message(self, format, *args):
+        # عدم إغراق السجلات بطلبات Prometheus
+        pass
+
+def start_metrics_server(port, readiness=None):
+    """تشغيل خادم /metrics و /ready و /live في خيط خلفي."""
+    handler = type("ProcessMetricsHandler", (MetricsHandler,), {"readiness": staticmethod(readiness) if readiness else None})
+    server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"📈 نقطة المقاييس تعمل على المنفذ {port} (/metrics، /ready، /live)")
+    return server
@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import logging
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from sqlalchemy import text
+from metrics import NOTIFICATIONS_SENT
+
+# ==============================
+# 1. الإعدادات
+# ==============================
+# حد الإرسال العام (Telegram يسمح بحوالي 30 رسالة/ثانية؛ نترك هامشاً لردود البوت العادية)
+NOTIFY_RATE_PER_SECOND = float(os.environ.get("NOTIFY_RATE_PER_SECOND", "25"))
+# الفاصل الزمني لفحص طابور الإشعارات عندما يكون فارغاً
+NOTIFY_POLL_SECONDS = int(os.environ.get("NOTIFY_POLL_SECONDS", "5"))
+# عدد المتابعين الذين يُجلبون من قاعدة البيانات في كل صفحة
+NOTIFY_PAGE_SIZE = int(os.environ.get("NOTIFY_PAGE_SIZE", "500"))
+
+logger = logging.getLogger("notifications")
+
+# ==============================
+# 2. محدد معدل الإرسال
+# ==============================
+class TokenBucket:
+    """دلو رموز مشترك لكل الإرسالات؛ القفل يخدم المنتظرين بترتيب وصولهم."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# ==============================
+# 3. إرسال إشعارات الحلقات الجديدة
+# ==============================
+def format_notification(series_id, episodes):
+    """رسالة واحدة لكل مجموعة حلقات جديدة من نفس المحتوى (نص عادي لأن الأسماء قد تحتوي رموز Markdown)."""
+    _, _, _, name, content_type = episodes[0]
+    if content_type == 'series':
+        labels = [f"الموسم {season} الحلقة {episode_num}" for _, season, episode_num, _, _ in episodes]
+    else:
+        labels = [f"الجزء {season}" for _, season, _, _, _ in episodes]
+
+    if len(episodes) == 1:
+        message_text = f"🔔 جديد في {name}: {labels[0]}"
+        keyboard = [[InlineKeyboardButton("▶️ مشاهدة", callback_data=f"ep_{episodes[0][0]}")]]
+    else:
+        shown = "\n".join(f"• {label}" for label in labels[:10])
+        more = f"\n• و{len(labels) - 10} أخرى" if len(labels) > 10 else ""
+        message_text = f"🔔 {len(episodes)} إضافات جديدة في {name}:\n{shown}{more}"
+        keyboard = []
+    keyboard.append([
+        InlineKeyboardButton("📺 عرض المحتوى", callback_data=f"content_{series_id}"),
+        InlineKeyboardButton("🔕 إلغاء المتابعة", callback_data=f"unfav_{series_id}"),
+    ])
+    return message_text, InlineKeyboardMarkup(keyboard)
+
+class NotificationSender:
+    """يقرأ طابور notification_outbox الذي يكتبه الـ Worker ويرسل لمتابعي كل محتوى على صفحات.
+    يُحفظ آخر مستخدم وصله الإشعار بعد كل دفعة، فلا يُعاد الإرسال بعد إعادة التشغيل إلا لدفعة واحدة على الأكثر."""
+
+    def __init__(self, engine, bot, rate=NOTIFY_RATE_PER_SECOND):
+        self.engine = engine
+        self.bot = bot
+        self.limiter = TokenBucket(rate)
+        self.batch_size = max(1, int(rate))
+
+    async def run(self):
+        while True:
+            try:
+                groups = await asyncio.to_thread(self._pending_groups)
+                for series_id, user_cursor, outbox_ids, episode_ids in groups:
+                    await self._deliver(series_id, user_cursor, outbox_ids, episode_ids)
+            except Exception as e:
+                groups = None
+                logger.error(f"❌ خطأ في إرسال الإشعارات: {e}")
+            if not groups:
+                await asyncio.sleep(NOTIFY_POLL_SECONDS)
+
+    # ---- قاعدة البيانات (تُنفذ في خيط حتى لا تعطل حلقة الأحداث) ----
+    def _pending_groups(self):
+        """الحلقات المعلقة مجمعة حسب المحتوى ونقطة التقدم (حلقات نفس الدفعة تُرسل في رسالة واحدة)."""
+        with self.engine.connect() as conn:
+            return conn.execute(text("""
+                SELECT series_id, user_cursor, array_agg(id ORDER BY id), array_agg(episode_id ORDER BY id)
+                FROM (SELECT * FROM notification_outbox ORDER BY id LIMIT 200) pending
+                GROUP BY series_id, user_cursor
+                ORDER BY MIN(id)
+            """)).fetchall()
+
+    def _load_episodes(self, episode_ids):
+        with self.engine.connect() as conn:
+            return conn.execute(text("""
+                SELECT e.id, e.season, e.episode_number, s.name, s.type
+                FROM episodes e JOIN series s ON s.id = e.series_id
+                WHERE e.id = ANY(:ids)
+                ORDER BY e.season, e.episode_number
+            """), {"ids": list(episode_ids)}).fetchall()
+
+    def _subscribers_page(self, series_id, after_user):
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.execute(text("""
+                SELECT user_id FROM user_favorites
+                WHERE series_id = :series_id AND user_id > :after
+                ORDER BY user_id
+                LIMIT :limit
+            """), {"series_id": series_id, "after": after_user, "limit": NOTIFY_PAGE_SIZE})]
+
+    def _save_progress(self, outbox_ids, user_cursor, unreachable):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE notification_outbox SET user_cursor = :cursor WHERE id = ANY(:ids)
+            """), {"cursor": user_cursor, "ids": list(outbox_ids)})
+            if unreachable:
+                # المستخدمون الذين حظروا البوت لا يستقبلون أي إشعار لاحق
+                conn.execute(text("DELETE FROM user_favorites WHERE user_id = ANY(:users)"), {"users": unreachable})
+
+    def _complete(self, outbox_ids):
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM notification_outbox WHERE id = ANY(:ids)"), {"ids": list(outbox_ids)})
+
+    # ---- الإرسال ----
+    async def _deliver(self, series_id, user_cursor, outbox_ids, episode_ids):
+        episodes = await asyncio.to_thread(self._load_episodes, episode_ids)
+        if episodes:
+            message_text, reply_markup = format_notification(series_id, episodes)
+            sent = 0
+            while True:
+                users = await asyncio.to_thread(self._subscribers_page, series_id, user_cursor)
+                if not users:
+                    break
+                for start in range(0, len(users), self.batch_size):
+                    batch = users[start:start + self.batch_size]
+                    results = await asyncio.gather(*(
+                        self._send(user_id, message_text, reply_markup) for user_id in batch
+                    ))
+                    unreachable = [user_id for user_id, result in zip(batch, results) if result == "unreachable"]
+                    sent += results.count("sent")
+                    user_cursor = batch[-1]
+                    await asyncio.to_thread(self._save_progress, outbox_ids, user_cursor, unreachable)
+            logger.info(f"🔔 تم إرسال إشعار {episodes[0][3]} إلى {sent} متابع ({len(episodes)} حلقة)")
+        # الحلقات المحذوفة قبل الإرسال تُزال من الطابور بدون إشعار
+        await asyncio.to_thread(self._complete, outbox_ids)
+
+    async def _send(self, user_id, message_text, reply_markup):
+        for attempt in range(3):
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id=user_id, text=message_text, reply_markup=reply_markup)
+                NOTIFICATIONS_SENT.labels("sent").inc()
+                return "sent"
+            except RetryAfter as e:
+                # تجاوزنا الحد رغم المحدد (ردود البوت العادية تشترك في نفس الحد)
+                await asyncio.sleep(e.retry_after)
+            except Forbidden as e:
+                # حظر البوت أو حذف الحساب: تُلغى متابعاته
+                logger.debug("تعذر إرسال إشعار إلى %s: %s", user_id, e)
+                NOTIFICATIONS_SENT.labels("unreachable").inc()
+                return "unreachable"
+            except BadRequest as e:
+                # خطأ في الرسالة نفسها (مثل الطول أو الأزرار): لا تفيد إعادة المحاولة ولا يعني أن المستخدم حظر البوت
+                logger.warning(f"⚠️ رُفض إشعار إلى {user_id}: {e}")
+                break
+            except TelegramError as e:
+                logger.warning(f"⚠️ فشل إرسال إشعار إلى {user_id}: {e}")
+                await asyncio.sleep(1)
+        NOTIFICATIONS_SENT.labels("failed").inc()
+        return "failed"
@@ -0,0 +1,148 @@
+import os
+import time
+import types
+import pstats
+import random
+import asyncio
+import cProfile
+import threading
+import functools
+import contextvars
+
+# ==============================
+# تحليل أداء المعالجات عند الطلب (cProfile لكل طلب مطابق فقط)
+# ==============================
+# أقصى مدة لجلسة تحليل واحدة بالثواني
+PROFILE_MAX_SECONDS = int(os.environ.get("PROFILE_MAX_SECONDS", "300"))
+
+# الجلسة التي تحلل الخطوة الجارية (تنتقل مع asyncio.to_thread لأنها تنسخ السياق)
+_active_session = contextvars.ContextVar("profiling_session", default=None)
+
+class ProfileSession:
+    def __init__(self, target, seconds, sample_rate):
+        self.target = target
+        self.seconds = seconds
+        self.sample_rate = sample_rate
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + seconds
+        self.profile = cProfile.Profile()
+        self.requests = 0
+        self.busy = False
+        # ملفات التحليل للاستعلامات التي نفذها المعالج في خيوط أخرى (asyncio.to_thread)
+        self.thread_profiles = []
+        self._lock = threading.Lock()
+
+    def matches(self, route):
+        """الهدف إما مسار محدد أو بادئة تنتهي بـ * (مثل worker.* أو *)."""
+        if time.monotonic() >= self.deadline:
+            return False
+        if self.target.endswith("*"):
+            return route.startswith(self.target[:-1])
+        return route == self.target
+
+class HandlerProfiler:
+    """جلسة واحدة فعالة في كل عملية؛ يُفعَّل cProfile فقط أثناء تنفيذ خطوات المعالج المطابق
+    وليس أثناء انتظاره، حتى لا تختلط المعالجات الأخرى التي تعمل في نفس حلقة الأحداث."""
+
+    def __init__(self):
+        self.session = None
+
+    def start(self, target, seconds, sample_rate=1.0):
+        if self.session is not None and time.monotonic() < self.session.deadline:
+            raise RuntimeError(f"توجد جلسة تحليل فعالة للهدف {self.session.target}")
+        seconds = max(1, min(int(seconds), PROFILE_MAX_SECONDS))
+        sample_rate = max(0.01, min(float(sample_rate), 1.0))
+        self.session = ProfileSession(target, seconds, sample_rate)
+        return self.session
+
+    def finish(self, session, limit=20):
+        """إنهاء الجلسة وإرجاع ملخص مرتب بأثقل الدوال."""
+        if self.session is session:
+            self.session = None
+        return summarize(session, limit)
+
+    async def wait(self, session, limit=20):
+        await asyncio.sleep(max(0, session.deadline - time.monotonic()))
+        return self.finish(session, limit)
+
+    async def run(self, route, coro):
+        session = self.session
+        if session is None or session.busy or not session.matches(route) \
+                or random.random() >= session.sample_rate:
+            return await coro
+        session.requests += 1
+        return await _profiled(coro, session)
+
+@types.coroutine
+def _profiled(coro, session):
+    """تشغيل الـ coroutine خطوة بخطوة مع تفعيل المحلل حول كل خطوة فقط."""
+    value, error = None, None
+    while True:
+        session.busy = True
+        token = _active_session.set(session)
+        session.profile.enable()
+        try:
+            if error is not None:
+                yielded = coro.throw(error)
+            else:
+                yielded = coro.send(value)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            session.profile.disable()
+            _active_session.reset(token)
+            session.busy = False
+        try:
+            value, error = (yield yielded), None
+        except BaseException as e:
+            value, error = None, e
+
+def profile_call(func, *args):
+    """تنفيذ دالة متزامنة في خيط آخر وإضافة تحليلها لجلسة المعالج الذي استدعاها (إن وجدت)."""
+    session = _active_session.get()
+    if session is None:
+        return func(*args)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args)
+    finally:
+        with session._lock:
+            session.thread_profiles.append(profile)
+
+def summarize(session, limit=20):
+    header = (
+        f"🔬 تحليل {session.target}: {session.requests} طلب خلال {session.seconds} ثانية "
+        f"(نسبة العينة {session.sample_rate:.0%})\n\n"
+    )
+    if not session.requests:
+        return header + "لم يصل أي طلب مطابق خلال الجلسة."
+
+    stats = pstats.Stats(session.profile)
+    with session._lock:
+        for profile in session.thread_profiles:
+            stats.add(profile)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+    lines = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in rows:
+        if filename == __file__:
+            continue
+        location = f"{os.path.basename(filename)}:{line}" if filename != "~" else "built-in"
+        lines.append(
+            f"• {function} ({location}): {tottime * 1000:.1f} ms ذاتي، "
+            f"{cumtime * 1000:.1f} ms تراكمي، {calls} استدعاء"
+        )
+        if len(lines) >= limit:
+            break
+    return header + f"إجمالي {stats.total_tt * 1000:.0f} ms، أثقل الدوال (حسب الزمن الذاتي):\n" + "\n".join(lines)
+
+PROFILER = HandlerProfiler()
+
+def profiled(route):
+    """مُزخرف يمرر المعالج عبر جلسة التحليل الفعالة؛ route نص أو دالة تستخرج المسار من المعاملات."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            name = route(*args, **kwargs) if callable(route) else route
+            return await PROFILER.run(name, func(*args, **kwargs))
+        return wrapper
+    return decorator
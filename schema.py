@@ -0,0 +1,257 @@
+import logging
+from sqlalchemy import text
+
+logger = logging.getLogger("schema")
+
+# ==============================
+# إنشاء الجداول والفهارس المشتركة بين الـ Worker وأدوات الصيانة
+# ==============================
+def ensure_schema(engine):
+    """إنشاء الجداول إذا لم تكن موجودة وتعديل القيود."""
+    try:
+        with engine.begin() as conn:
+            # إنشاء جدول series إذا لم يكن موجوداً
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS series (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    type VARCHAR(10) DEFAULT 'series',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            # إنشاء جدول episodes إذا لم يكن موجوداً
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS episodes (
+                    id SERIAL PRIMARY KEY,
+                    series_id INTEGER REFERENCES series(id),
+                    season INTEGER DEFAULT 1,
+                    episode_number INTEGER NOT NULL,
+                    telegram_message_id INTEGER NOT NULL,
+                    telegram_channel_id VARCHAR(255),
+                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+
+            # إزالة القيد الفريد القديم على telegram_message_id إذا كان موجوداً (لأنه سيتعارض مع الجديد)
+            # نستخدم كتلة try/except لأن القيد قد لا يكون موجوداً
+            try:
+                conn.execute(text("ALTER TABLE episodes DROP CONSTRAINT IF EXISTS episodes_telegram_message_id_key"))
+                logger.info("✅ تم إزالة القيد الفريد القديم على telegram_message_id.")
+            except Exception as e:
+                logger.warning(f"⚠️ ملاحظة أثناء إزالة القيد: {e}")
+
+            # إضافة قيد فريد جديد على (telegram_channel_id, telegram_message_id)
+            conn.execute(text("""
+                ALTER TABLE episodes
+                ADD CONSTRAINT unique_channel_message UNIQUE (telegram_channel_id, telegram_message_id)
+            """))
+            logger.info("✅ تم إضافة القيد الفريد (telegram_channel_id, telegram_message_id).")
+
+            # إنشاء الفهارس الأخرى
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_series_name_type ON series(name, type)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_episodes_channel_id ON episodes(telegram_channel_id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_episodes_series_season ON episodes(series_id, season, episode_number)"))
+
+        logger.info("✅ تم التحقق من هياكل الجداول والفهارس وتحديث القيود.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء تعديل الجداول: {e}")
+        # قد يكون القيد موجوداً بالفعل، نواصل التشغيل
+
+    # جدول نقاط التقدم: آخر رسالة تمت معالجتها في كل قناة
+    # (في معاملة منفصلة لأن إضافة القيد أعلاه تفشل عند كل تشغيل بعد الأول)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS channel_checkpoints (
+                    telegram_channel_id VARCHAR(255) PRIMARY KEY,
+                    last_message_id INTEGER NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            # تعبئة أولية من الحلقات الموجودة (مرة واحدة فقط عندما يكون الجدول فارغاً)
+            conn.execute(text("""
+                INSERT INTO channel_checkpoints (telegram_channel_id, last_message_id)
+                SELECT telegram_channel_id, MAX(telegram_message_id)
+                FROM episodes
+                WHERE telegram_channel_id IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM channel_checkpoints)
+                GROUP BY telegram_channel_id
+            """))
+        logger.info("✅ تم التحقق من جدول نقاط التقدم channel_checkpoints.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إنشاء جدول نقاط التقدم: {e}")
+
+    # جداول إحصائيات الاستعلامات (sql_monitor) المشتركة بين البوت والـ Worker
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS sql_statement_stats (
+                    process VARCHAR(64) NOT NULL,
+                    handler VARCHAR(128) NOT NULL,
+                    statement TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    total_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    max_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (process, handler, statement)
+                )
+            """))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS sql_handler_stats (
+                    process VARCHAR(64) NOT NULL,
+                    handler VARCHAR(128) NOT NULL,
+                    updates INTEGER NOT NULL DEFAULT 0,
+                    statements INTEGER NOT NULL DEFAULT 0,
+                    flagged INTEGER NOT NULL DEFAULT 0,
+                    max_statements INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (process, handler)
+                )
+            """))
+        logger.info("✅ تم التحقق من جداول إحصائيات الاستعلامات.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إنشاء جداول إحصائيات الاستعلامات: {e}")
+
+    # طلبات تحليل الأداء التي يرسلها البوت (/profile worker...) ويستلمها الـ Worker
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS profile_requests (
+                    id SERIAL PRIMARY KEY,
+                    target VARCHAR(128) NOT NULL,
+                    seconds INTEGER NOT NULL,
+                    sample_rate DOUBLE PRECISION NOT NULL DEFAULT 1,
+                    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                    result TEXT,
+                    requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """))
+        logger.info("✅ تم التحقق من جدول طلبات التحليل profile_requests.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إنشاء جدول طلبات التحليل: {e}")
+
+    # المفضلة وطابور إشعارات الحلقات الجديدة (يكتبه الـ Worker ويرسله البوت)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS user_favorites (
+                    id SERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    series_id INTEGER NOT NULL,
+                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            # معرفات مستخدمي Telegram تتجاوز نطاق INTEGER (الجدول قد يكون أُنشئ من database.py)
+            conn.execute(text("ALTER TABLE user_favorites ALTER COLUMN user_id TYPE BIGINT"))
+            # البحث عن المتابعين حسب المسلسل (مرتبين بالمستخدم لتقسيم الإرسال على صفحات)
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_user_favorites_series_user ON user_favorites(series_id, user_id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_user_favorites_user ON user_favorites(user_id)"))
+            # user_cursor: آخر مستخدم تم إرسال الإشعار إليه (حتى لا يُعاد الإرسال بعد إعادة التشغيل)
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS notification_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    series_id INTEGER NOT NULL,
+                    episode_id INTEGER NOT NULL,
+                    user_cursor BIGINT NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+        logger.info("✅ تم التحقق من جداول المفضلة والإشعارات.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إنشاء جداول المفضلة والإشعارات: {e}")
+
+    # فهرس آخر الإضافات (تعبئة قائمة /latest عند تشغيل البوت)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_episodes_added_at ON episodes(added_at DESC)"))
+        logger.info("✅ تم التحقق من فهرس idx_episodes_added_at.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إنشاء فهرس آخر الإضافات: {e}")
+
+    # عقود ملكية القنوات بين نسخ الـ Worker (CHANNEL_SHARDING)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS channel_leases (
+                    channel VARCHAR(255) PRIMARY KEY,
+                    worker_id VARCHAR(255) NOT NULL,
+                    heartbeat_at TIMESTAMP NOT NULL,
+                    acquired_at TIMESTAMP NOT NULL
+                )
+            """))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS worker_heartbeats (
+                    worker_id VARCHAR(255) PRIMARY KEY,
+                    heartbeat_at TIMESTAMP NOT NULL
+                )
+            """))
+        logger.info("✅ تم التحقق من جداول توزيع القنوات channel_leases.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إنشاء جداول توزيع القنوات: {e}")
+
+    # ذاكرة كيانات القنوات المحلولة (لكل حساب Telegram لأن access_hash يختلف بين الحسابات)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS channel_entities (
+                    account_id BIGINT NOT NULL,
+                    channel_input VARCHAR(255) NOT NULL,
+                    channel_id BIGINT NOT NULL,
+                    access_hash BIGINT NOT NULL,
+                    username VARCHAR(255),
+                    title TEXT,
+                    resolved_at TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (account_id, channel_input)
+                )
+            """))
+        logger.info("✅ تم التحقق من جدول ذاكرة القنوات channel_entities.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إنشاء جدول ذاكرة القنوات: {e}")
+
+    # الرسائل التي لم يتعرف عليها المحلل (تُعاد معالجتها بعد إصلاحه عبر worker.py reparse)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS unparsed_messages (
+                    telegram_channel_id VARCHAR(255) NOT NULL,
+                    telegram_message_id INTEGER NOT NULL,
+                    caption TEXT NOT NULL,
+                    failed_at TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (telegram_channel_id, telegram_message_id)
+                )
+            """))
+        logger.info("✅ تم التحقق من جدول الرسائل غير المحللة unparsed_messages.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إنشاء جدول الرسائل غير المحللة: {e}")
+
+    # المفتاح الموحد لأسماء المحتوى (يُحسب في caption_parser.canonical_key ويملؤه worker.py merge-series)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE series ADD COLUMN IF NOT EXISTS canonical_key VARCHAR(255)"))
+        logger.info("✅ تم التحقق من عمود المفتاح الموحد canonical_key.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إضافة عمود المفتاح الموحد: {e}")
+    # يفشل إنشاء الفهرس إذا بقيت مفاتيح مكررة؛ merge-series يدمجها ثم ينشئه
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_series_type_canonical_key ON series(type, canonical_key)"))
+    except Exception as e:
+        logger.warning(f"⚠️ تعذر إنشاء الفهرس الفريد للمفتاح الموحد (شغّل worker.py merge-series): {e}")
+
+    # مؤشر استيراد التاريخ منفصل عن نقطة التقدم (التي تُعبأ من آخر حلقة)، حتى يستورد IMPORT_HISTORY القناة كاملة
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE channel_checkpoints ADD COLUMN IF NOT EXISTS history_message_id INTEGER"))
+            conn.execute(text("ALTER TABLE channel_checkpoints ADD COLUMN IF NOT EXISTS history_completed_at TIMESTAMP"))
+        logger.info("✅ تم التحقق من مؤشر استيراد التاريخ history_message_id.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إضافة مؤشر استيراد التاريخ: {e}")
+
+    # عمودا مرجع الوسائط من نسخة سابقة: معرفات جلسة العامل لا يقبلها Bot API، والبوت يرسل الحلقات بالنسخ من القناة
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE episodes DROP COLUMN IF EXISTS media_type, DROP COLUMN IF EXISTS media_file_id"))
+        logger.info("✅ تم التحقق من إزالة عمودي media_type و media_file_id.")
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ أثناء إزالة عمودي مرجع الوسائط: {e}")
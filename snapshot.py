@@ -0,0 +1,175 @@
+import os
+import io
+import sys
+import json
+import zipfile
+import logging
+import argparse
+from datetime import datetime
+from sqlalchemy import create_engine
+from schema import ensure_schema
+from structured_logging import setup_logging
+
+logger = logging.getLogger("snapshot")
+
+# ==============================
+# 1. الجداول المشمولة في اللقطة (بالترتيب المطلوب للتحميل)
+# ==============================
+# الصيغة 2: جدول episodes بدون عمودي media_type و media_file_id
+SNAPSHOT_FORMAT = 2
+# اللقطات بالصيغة 1 قد تحمل العمودين المحذوفين، فتُحمّل أعمدتها المعروفة فقط
+SUPPORTED_FORMATS = {1, 2}
+SNAPSHOT_TABLES = [
+    ("series", ["id", "name", "type", "canonical_key", "created_at"]),
+    ("episodes", ["id", "series_id", "season", "episode_number",
+                  "telegram_message_id", "telegram_channel_id", "added_at"]),
+    ("channel_checkpoints", ["telegram_channel_id", "last_message_id", "updated_at",
+                             "history_message_id", "history_completed_at"]),
+    # نقاط التقدم تتجاوز الرسائل الفاشلة، فبدونها لا يمكن استعادتها بعد إصلاح المحلل
+    ("unparsed_messages", ["telegram_channel_id", "telegram_message_id", "caption", "failed_at"]),
+]
+SERIAL_TABLES = ["series", "episodes"]
+
+# ==============================
+# 2. التصدير باستخدام COPY
+# ==============================
+def export_snapshot(engine, path):
+    """تصدير المسلسلات والحلقات ونقاط التقدم والرسائل غير المحللة إلى ملف zip مضغوط (ملف CSV لكل جدول)."""
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        # لقطة متسقة لجميع الجداول حتى لو كان الـ Worker يكتب أثناء التصدير
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "created_at": datetime.utcnow().isoformat(),
+            "tables": {},
+        }
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for table, columns in SNAPSHOT_TABLES:
+                column_list = ", ".join(columns)
+                with zf.open(f"{table}.csv", "w") as member:
+                    stream = io.TextIOWrapper(member, encoding="utf-8", newline="")
+                    cursor.copy_expert(
+                        f"COPY {table} ({column_list}) TO STDOUT WITH (FORMAT csv, HEADER true)",
+                        stream
+                    )
+                    stream.flush()
+                    stream.detach()
+                manifest["tables"][table] = {"columns": columns, "rows": cursor.rowcount}
+                logger.info(f"✅ تم تصدير {table}: {cursor.rowcount} صف")
+            zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+        raw.rollback()
+    finally:
+        raw.close()
+
+    logger.info(f"📦 تم حفظ اللقطة في {path}")
+    return manifest
+
+# ==============================
+# 3. التحميل السريع باستخدام COPY
+# ==============================
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def copy_table(cursor, table, snapshot_columns, columns, stream):
+    """COPY مباشرة إلى الجدول، أو عبر جدول مؤقت إذا حملت اللقطة أعمدة لم تعد موجودة
+    (مثل media_type و media_file_id في لقطات الصيغة 1) ثم نسخ الأعمدة المعروفة فقط."""
+    dropped = [column for column in snapshot_columns if column not in columns]
+    if not dropped:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(snapshot_columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+            stream
+        )
+        return
+
+    logger.warning(f"⚠️ تجاهل أعمدة لم تعد موجودة في {table}: {', '.join(dropped)}")
+    staging = f"snapshot_staging_{table}"
+    cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table}) ON COMMIT DROP")
+    for column in dropped:
+        cursor.execute(f"ALTER TABLE {staging} ADD COLUMN {quote_identifier(column)} TEXT")
+    cursor.copy_expert(
+        f"COPY {staging} ({', '.join(map(quote_identifier, snapshot_columns))}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+        stream
+    )
+    # آخر عبارة هي الإدراج حتى يبقى cursor.rowcount عدد الصفوف المحملة
+    kept = ", ".join(column for column in snapshot_columns if column in columns)
+    cursor.execute(f"INSERT INTO {table} ({kept}) SELECT {kept} FROM {staging}")
+
+def load_snapshot(engine, path, replace=False):
+    """تحميل لقطة الفهرس دفعة واحدة في معاملة واحدة، ثم ضبط العدادات التسلسلية."""
+    ensure_schema(engine)
+    known_tables = {table for table, _ in SNAPSHOT_TABLES}
+
+    with zipfile.ZipFile(path) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        if manifest.get("format") not in SUPPORTED_FORMATS:
+            raise ValueError(f"صيغة لقطة غير مدعومة: {manifest.get('format')}")
+
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            if replace:
+                cursor.execute("TRUNCATE unparsed_messages, channel_checkpoints, episodes, series RESTART IDENTITY")
+            else:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM series) OR EXISTS (SELECT 1 FROM episodes)")
+                if cursor.fetchone()[0]:
+                    raise RuntimeError("قاعدة البيانات ليست فارغة، استخدم --replace لاستبدال المحتوى.")
+
+            for table, columns in SNAPSHOT_TABLES:
+                info = manifest["tables"].get(table)
+                if not info or table not in known_tables:
+                    continue
+                # نستخدم أعمدة اللقطة نفسها حتى تبقى اللقطات القديمة قابلة للتحميل
+                with zf.open(f"{table}.csv") as member:
+                    stream = io.TextIOWrapper(member, encoding="utf-8", newline="")
+                    copy_table(cursor, table, info["columns"], columns, stream)
+                logger.info(f"✅ تم تحميل {table}: {cursor.rowcount} صف")
+
+            for table in SERIAL_TABLES:
+                cursor.execute(f"""
+                    SELECT setval(pg_get_serial_sequence('{table}', 'id'),
+                                  COALESCE(MAX(id), 0) + 1, false)
+                    FROM {table}
+                """)
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+    logger.info(f"🚀 تم تحميل اللقطة {path}. سيستأنف الـ Worker المراقبة من نقاط التقدم المخزنة.")
+    return manifest
+
+# ==============================
+# 4. نقطة دخول البرنامج
+# ==============================
+def main():
+    parser = argparse.ArgumentParser(description="تصدير/تحميل لقطة فهرس المسلسلات والأفلام")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="تصدير اللقطة إلى ملف")
+    export_parser.add_argument("path")
+    load_parser = subparsers.add_parser("load", help="تحميل اللقطة من ملف")
+    load_parser.add_argument("path")
+    load_parser.add_argument("--replace", action="store_true", help="حذف المحتوى الحالي قبل التحميل")
+    args = parser.parse_args()
+    # الأداة تعمل وحدها، فنظهر سجلاتها نصاً مقروءاً (داخل الـ Worker يتبع إعداد السجلات الخاص به)
+    setup_logging(json_output=False)
+
+    database_url = os.environ.get("DATABASE_URL", "")
+    if not database_url:
+        logger.error("❌ خطأ: DATABASE_URL غير موجود في متغيرات البيئة!")
+        sys.exit(1)
+    if database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+    engine = create_engine(database_url)
+
+    if args.command == "export":
+        export_snapshot(engine, args.path)
+    else:
+        load_snapshot(engine, args.path, replace=args.replace)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import re
+import time
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from sqlalchemy import event, text
+
+# ==============================
+# 1. الإعدادات
+# ==============================
+# حد الاستعلام البطيء بالمللي ثانية (يُسجل مع المعاملات)
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+# عدد الاستعلامات في التحديث الواحد الذي يُعتبر بعده المعالج مشتبهاً بنمط N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "5"))
+
+logger = logging.getLogger("sql_monitor")
+
+# المعالج الحالي وعداد استعلاماته (يُنسخان تلقائياً لكل مهمة asyncio)
+_current_handler = contextvars.ContextVar("sql_monitor_handler", default="-")
+_current_counter = contextvars.ContextVar("sql_monitor_counter", default=None)
+
+_lock = threading.Lock()
+# (handler, statement) -> [calls, total_ms, max_ms]
+statement_stats = {}
+# handler -> [updates, statements, flagged_updates, max_statements]
+handler_stats = {}
+
+# ==============================
+# 2. ربط أحداث المحرك
+# ==============================
+def _normalize(statement):
+    return re.sub(r"\s+", " ", statement).strip()[:300]
+
+def instrument_engine(engine):
+    """قياس زمن كل استعلام ونسبته للمعالج الذي نفذه."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._sql_monitor_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_sql_monitor_start", None)
+        if start is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        handler = _current_handler.get()
+        counter = _current_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+        key = (handler, _normalize(statement))
+        with _lock:
+            stats = statement_stats.setdefault(key, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed_ms
+            stats[2] = max(stats[2], elapsed_ms)
+
+        if elapsed_ms >= SLOW_QUERY_MS:
+            logger.warning(
+                f"استعلام بطيء ({elapsed_ms:.1f} ms) في {handler}: {key[1]} | params={str(parameters)[:500]}"
+            )
+
+# ==============================
+# 3. نسبة الاستعلامات للمعالجات
+# ==============================
+def _record_update(handler, statements):
+    flagged = statements > N_PLUS_ONE_THRESHOLD
+    with _lock:
+        stats = handler_stats.setdefault(handler, [0, 0, 0, 0])
+        stats[0] += 1
+        stats[1] += statements
+        stats[2] += 1 if flagged else 0
+        stats[3] = max(stats[3], statements)
+    if flagged:
+        logger.warning(f"⚠️ نمط N+1 محتمل: المعالج {handler} نفذ {statements} استعلاماً في تحديث واحد")
+
+@contextmanager
+def handler_scope(name):
+    """نسبة كل الاستعلامات المنفذة داخل هذه الكتلة للمعالج name كتحديث واحد."""
+    counter = [0]
+    handler_token = _current_handler.set(name)
+    counter_token = _current_counter.set(counter)
+    try:
+        yield
+    finally:
+        _current_handler.reset(handler_token)
+        _current_counter.reset(counter_token)
+        _record_update(name, counter[0])
+
+def tag_handler(name):
+    """مُزخرف لمعالج غير متزامن يعمل داخل handler_scope."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with handler_scope(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ==============================
+# 4. حفظ الإحصائيات وعرضها
+# ==============================
+def flush_stats(engine, process):
+    """حفظ الإحصائيات التراكمية لهذه العملية في قاعدة البيانات (تستبدل القيم السابقة)."""
+    with _lock:
+        statements = [
+            {"process": process, "handler": handler, "statement": statement,
+             "calls": calls, "total_ms": total_ms, "max_ms": max_ms}
+            for (handler, statement), (calls, total_ms, max_ms) in statement_stats.items()
+        ]
+        handlers = [
+            {"process": process, "handler": handler, "updates": updates, "statements": count,
+             "flagged": flagged, "max_statements": max_statements}
+            for handler, (updates, count, flagged, max_statements) in handler_stats.items()
+        ]
+    if not statements and not handlers:
+        return
+
+    with handler_scope("sql_monitor"):
+        with engine.begin() as conn:
+            if statements:
+                conn.execute(text("""
+                    INSERT INTO sql_statement_stats (process, handler, statement, calls, total_ms, max_ms, updated_at)
+                    VALUES (:process, :handler, :statement, :calls, :total_ms, :max_ms, CURRENT_TIMESTAMP)
+                    ON CONFLICT (process, handler, statement) DO UPDATE
+                    SET calls = EXCLUDED.calls, total_ms = EXCLUDED.total_ms,
+                        max_ms = EXCLUDED.max_ms, updated_at = CURRENT_TIMESTAMP
+                """), statements)
+            if handlers:
+                conn.execute(text("""
+                    INSERT INTO sql_handler_stats (process, handler, updates, statements, flagged, max_statements, updated_at)
+                    VALUES (:process, :handler, :updates, :statements, :flagged, :max_statements, CURRENT_TIMESTAMP)
+                    ON CONFLICT (process, handler) DO UPDATE
+                    SET updates = EXCLUDED.updates, statements = EXCLUDED.statements,
+                        flagged = EXCLUDED.flagged, max_statements = EXCLUDED.max_statements,
+                        updated_at = CURRENT_TIMESTAMP
+                """), handlers)
+
+def load_summary(engine, limit=10):
+    """أثقل الاستعلامات (حسب الزمن الإجمالي) والمعالجات المشتبه بها من جميع العمليات."""
+    with engine.connect() as conn:
+        statements = conn.execute(text("""
+            SELECT process, handler, statement, calls, total_ms, max_ms
+            FROM sql_statement_stats
+            ORDER BY total_ms DESC
+            LIMIT :limit
+        """), {"limit": limit}).fetchall()
+        handlers = conn.execute(text("""
+            SELECT process, handler, updates, statements, flagged, max_statements
+            FROM sql_handler_stats
+            WHERE flagged > 0
+            ORDER BY flagged DESC, max_statements DESC
+            LIMIT :limit
+        """), {"limit": limit}).fetchall()
+    return statements, handlers
+
+def reset_stats(engine=None):
+    """تصفير الإحصائيات في الذاكرة (وفي قاعدة البيانات إذا مُرر المحرك)."""
+    with _lock:
+        statement_stats.clear()
+        handler_stats.clear()
+    if engine is not None:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM sql_statement_stats"))
+            conn.execute(text("DELETE FROM sql_handler_stats"))
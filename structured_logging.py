@@ -0,0 +1,52 @@
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# ==============================
+# سجلات منظمة (JSON) تُكتب من خيط خلفي حتى لا تعطل حلقة الأحداث
+# ==============================
+class JsonFormatter(logging.Formatter):
+    """سطر JSON لكل سجل؛ الحقول الإضافية تُمرر عبر extra={"fields": {...}}."""
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class InProcessQueueHandler(QueueHandler):
+    """الطابور داخل نفس العملية: ندمج المعاملات في النص مبكراً ونترك exc_info للمنسق في خيط الكتابة."""
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def setup_logging(level="INFO", json_output=True):
+    """توجيه كل السجلات عبر طابور إلى خيط يكتب على stdout؛ السجلات تحت المستوى المحدد لا تُنشأ أصلاً."""
+    handler = logging.StreamHandler(sys.stdout)
+    if json_output:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers = [InProcessQueueHandler(log_queue)]
+    root.setLevel(level)
+    listener.start()
+    # تفريغ الطابور قبل الخروج
+    atexit.register(listener.stop)
+    return listener
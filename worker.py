@@ -1,15 +1,34 @@
 import os
+import json
 import asyncio
-import re
+import argparse
 import sys
+import time
+import logging
 from datetime import datetime
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, types
+from telethon.errors import ChannelInvalidError, ChannelPrivateError
 from telethon.sessions import StringSession
+from telethon.utils import get_peer_id
 from telethon.tl.types import Message, Channel
 from telethon.tl.functions.channels import GetFullChannelRequest
 from telethon.tl.functions.messages import ImportChatInviteRequest
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
+from schema import ensure_schema
+from caption_parser import canonical_key, parse_content_info
+from snapshot import load_snapshot
+from channel_dumps import iter_dump
+from ingest_pipeline import run_pipeline
+from metrics import (
+    INGESTED_MESSAGES, PARSE_FAILURES, TELEGRAM_API_LATENCY, WORKER_QUEUE_DEPTH,
+    instrument_engine, start_metrics_server
+)
+from sql_monitor import flush_stats, handler_scope, instrument_engine as instrument_sql
+from structured_logging import setup_logging
+from profiling import PROFILER, profiled
+from channel_leases import ChannelLeaseManager, LEASE_HEARTBEAT_SECONDS, WORKER_ID
+from leader_election import AdvisoryLeader, LEADER_RETRY_SECONDS
 
 # ==============================
 # 1. إعدادات التهيئة من متغيرات البيئة
@@ -22,11 +41,27 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "")
 STRING_SESSION = os.environ.get("STRING_SESSION", "")
 IMPORT_HISTORY = os.environ.get("IMPORT_HISTORY", "false").lower() == "true"
 CHECK_DELETED_MESSAGES = os.environ.get("CHECK_DELETED_MESSAGES", "true").lower() == "true"
+# ملف لقطة الفهرس (اختياري) لتهيئة نشر جديد بدون إعادة استيراد القنوات
+BOOTSTRAP_SNAPSHOT = os.environ.get("BOOTSTRAP_SNAPSHOT", "")
+# منفذ نقطة /metrics لـ Prometheus (0 = معطلة)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# الفاصل الزمني لحفظ إحصائيات الاستعلامات في قاعدة البيانات
+SQL_STATS_FLUSH_SECONDS = int(os.environ.get("SQL_STATS_FLUSH_SECONDS", "60"))
+# مستوى السجلات (DEBUG يعرض سطراً لكل رسالة) وصيغتها (json أو text)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+# عدد الرسائل في كل دفعة كتابة أثناء استيراد التاريخ
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "200"))
+# الفاصل الزمني للتحقق من طلبات تحليل الأداء المرسلة من البوت (/profile worker...)
+PROFILE_POLL_SECONDS = int(os.environ.get("PROFILE_POLL_SECONDS", "5"))
+# توزيع القنوات على عدة نسخ من الـ Worker (كل نسخة يمكن أن تستخدم STRING_SESSION مختلفة)
+CHANNEL_SHARDING = os.environ.get("CHANNEL_SHARDING", "false").lower() == "true"
+# الفاصل الزمني لتعويض الرسائل الفائتة من نقاط التقدم (بعد انقطاع الاتصال أو تحديثات ضائعة؛ 0 = عند التشغيل فقط)
+CATCH_UP_SECONDS = int(os.environ.get("CATCH_UP_SECONDS", "60"))
+# بدون التوزيع: نسخة قائدة واحدة تعالج كل القنوات والباقي احتياطية جاهزة (قفل استشاري في Postgres)
+LEADER_ELECTION = os.environ.get("LEADER_ELECTION", "true").lower() == "true"
 
-# تحقق من وجود المتغيرات الأساسية
-if not all([API_ID, API_HASH, DATABASE_URL, STRING_SESSION]):
-    print("❌ خطأ: واحد أو أكثر من المتغيرات التالية مفقود: API_ID, API_HASH, DATABASE_URL, STRING_SESSION")
-    sys.exit(1)
+logger = logging.getLogger("worker")
 
 # إصلاح رابط قاعدة البيانات
 if DATABASE_URL.startswith("postgres://"):
@@ -36,218 +71,53 @@ if DATABASE_URL.startswith("postgres://"):
 CHANNEL_LIST = [chan.strip() for chan in CHANNELS.split(',') if chan.strip()]
 
 # ==============================
-# 2. إعداد الاتصال بقاعدة البيانات
+# 2. إعداد الاتصال بقاعدة البيانات (عند التشغيل وليس عند الاستيراد)
 # ==============================
-try:
-    engine = create_engine(DATABASE_URL)
-    with engine.connect() as conn:
-        conn.execute(text("SELECT 1"))
-    print("✅ تم الاتصال بقاعدة البيانات بنجاح.")
-except Exception as e:
-    print(f"❌ فشل الاتصال بقاعدة البيانات: {e}")
-    sys.exit(1)
+engine = None
+# يصبح True بعد الاتصال بـ Telegram وتسجيل معالجات القنوات (نقطة /ready)
+worker_ready = False
+# معرف حساب Telegram لهذه النسخة (مفتاح ذاكرة القنوات channel_entities)
+account_id = None
 
-# ==============================
-# 3. إنشاء الجداول إذا لم تكن موجودة وتعديل القيود
-# ==============================
-try:
-    with engine.begin() as conn:
-        # إنشاء جدول series إذا لم يكن موجوداً
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS series (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                type VARCHAR(10) DEFAULT 'series',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """))
-        # إنشاء جدول episodes إذا لم يكن موجوداً
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS episodes (
-                id SERIAL PRIMARY KEY,
-                series_id INTEGER REFERENCES series(id),
-                season INTEGER DEFAULT 1,
-                episode_number INTEGER NOT NULL,
-                telegram_message_id INTEGER NOT NULL,
-                telegram_channel_id VARCHAR(255),
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """))
-        
-        # إزالة القيد الفريد القديم على telegram_message_id إذا كان موجوداً (لأنه سيتعارض مع الجديد)
-        # نستخدم كتلة try/except لأن القيد قد لا يكون موجوداً
-        try:
-            conn.execute(text("ALTER TABLE episodes DROP CONSTRAINT IF EXISTS episodes_telegram_message_id_key"))
-            print("✅ تم إزالة القيد الفريد القديم على telegram_message_id.")
-        except Exception as e:
-            print(f"⚠️ ملاحظة أثناء إزالة القيد: {e}")
-        
-        # إضافة قيد فريد جديد على (telegram_channel_id, telegram_message_id)
-        conn.execute(text("""
-            ALTER TABLE episodes 
-            ADD CONSTRAINT unique_channel_message UNIQUE (telegram_channel_id, telegram_message_id)
-        """))
-        print("✅ تم إضافة القيد الفريد (telegram_channel_id, telegram_message_id).")
-        
-        # إنشاء الفهارس الأخرى
-        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_series_name_type ON series(name, type)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_episodes_channel_id ON episodes(telegram_channel_id)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_episodes_series_season ON episodes(series_id, season, episode_number)"))
-        
-    print("✅ تم التحقق من هياكل الجداول والفهارس وتحديث القيود.")
-except Exception as e:
-    print(f"⚠️ خطأ أثناء تعديل الجداول: {e}")
-    # قد يكون القيد موجوداً بالفعل، نواصل التشغيل
+def init_database():
+    """الاتصال بقاعدة البيانات وإنشاء الجداول والفهارس إذا لم تكن موجودة."""
+    global engine
+    if engine is not None:
+        return engine
+    try:
+        engine = create_engine(DATABASE_URL)
+        instrument_engine(engine, "primary")
+        instrument_sql(engine)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        logger.info("✅ تم الاتصال بقاعدة البيانات بنجاح.")
+    except Exception as e:
+        logger.error(f"❌ فشل الاتصال بقاعدة البيانات: {e}")
+        sys.exit(1)
+
+    # ==============================
+    # 3. إنشاء الجداول إذا لم تكن موجودة وتعديل القيود
+    # ==============================
+    ensure_schema(engine)
+    return engine
+
+def readiness():
+    if worker_ready:
+        return True, "ok"
+    return False, "الـ Worker قيد التهيئة أو غير متصل بـ Telegram"
 
 # ==============================
 # 4. دوال المساعدة (التحليل والحفظ والحذف)
 # ==============================
-def clean_name(name):
-    """تنظيف الاسم من كلمات 'مسلسل' و'فيلم' والأرقام في النهاية."""
-    if not name:
-        return name
-    
-    # إزالة كلمات "مسلسل" و"فيلم" من البداية
-    name = re.sub(r'^(مسلسل\s+|فيلم\s+)', '', name, flags=re.IGNORECASE)
-    
-    # إزالة كلمات "مسلسل" و"فيلم" من أي مكان (إذا كانت منفصلة)
-    name = re.sub(r'\s+(مسلسل|فيلم)\s+', ' ', name, flags=re.IGNORECASE)
-    
-    # تنظيف المسافات الزائدة
-    name = re.sub(r'\s+', ' ', name).strip()
-    
-    return name
-
-def extract_numbers_from_name(name):
-    """استخراج الأرقام من الاسم (مثل 13 من 'يوم-13')"""
-    match = re.search(r'[-_]?(\d+)$', name)
-    if match:
-        return int(match.group(1))
-    return None
-
-def parse_content_info(message_text):
-    """تحليل نص الرسالة لاستخراج المعلومات."""
-    if not message_text:
-        return None, None, None, None
-    
-    text_cleaned = message_text.strip()
-    
-    # 1. البحث عن نمط الأفلام
-    film_pattern_dash = r'^فيلم\s+(.+?)[-_](\d+)$'
-    match = re.search(film_pattern_dash, text_cleaned, re.IGNORECASE)
-    if match:
-        content_type = 'movie'
-        raw_name = match.group(1).strip()
-        season_num = int(match.group(2))
-        episode_num = 1
-        clean_name_text = clean_name(raw_name)
-        return clean_name_text, content_type, season_num, episode_num
-    
-    film_pattern_space = r'^فيلم\s+(.+?)\s+(\d+)$'
-    match = re.search(film_pattern_space, text_cleaned, re.IGNORECASE)
-    if match:
-        content_type = 'movie'
-        raw_name = match.group(1).strip()
-        season_num = int(match.group(2))
-        episode_num = 1
-        clean_name_text = clean_name(raw_name)
-        return clean_name_text, content_type, season_num, episode_num
-    
-    film_pattern_name_only = r'^فيلم\s+(.+)$'
-    match = re.search(film_pattern_name_only, text_cleaned, re.IGNORECASE)
-    if match:
-        content_type = 'movie'
-        raw_name = match.group(1).strip()
-        extracted_num = extract_numbers_from_name(raw_name)
-        if extracted_num:
-            raw_name = re.sub(r'[-_]?\d+$', '', raw_name).strip()
-            season_num = extracted_num
-        else:
-            season_num = 1
-        episode_num = 1
-        clean_name_text = clean_name(raw_name)
-        return clean_name_text, content_type, season_num, episode_num
-    
-    # 2. البحث عن نمط المسلسل مع الموسم
-    series_season_pattern = r'^(.*?)\s+الموسم\s+(\d+)\s+الحلقة\s+(\d+)$'
-    match = re.search(series_season_pattern, text_cleaned)
-    if match:
-        content_type = 'series'
-        raw_name = match.group(1).strip()
-        season_num = int(match.group(2))
-        episode_num = int(match.group(3))
-        clean_name_text = clean_name(raw_name)
-        return clean_name_text, content_type, season_num, episode_num
-    
-    # 3. البحث عن نمط المسلسل بدون موسم
-    series_episode_pattern = r'^(.*?)\s+الحلقة\s+(\d+)$'
-    match = re.search(series_episode_pattern, text_cleaned)
-    if match:
-        content_type = 'series'
-        raw_name = match.group(1).strip()
-        season_num = 1
-        episode_num = int(match.group(2))
-        clean_name_text = clean_name(raw_name)
-        return clean_name_text, content_type, season_num, episode_num
-    
-    # 4. البحث عن نمط بسيط
-    simple_pattern = r'^(.*?[^\d\s])\s+(\d+)$'
-    match = re.search(simple_pattern, text_cleaned)
-    if match:
-        raw_name = match.group(1).strip()
-        
-        if 'فيلم' in raw_name.lower():
-            content_type = 'movie'
-            season_num = int(match.group(2))
-            episode_num = 1
-        else:
-            content_type = 'series'
-            season_num = 1
-            episode_num = int(match.group(2))
-        
-        clean_name_text = clean_name(raw_name)
-        return clean_name_text, content_type, season_num, episode_num
-    
-    # 5. نمط المسلسل العربي
-    arabic_series_pattern = r'^مسلسل\s+(.*?)\s+الموسم\s+(\d+)\s+الحلقة\s+(\d+)$'
-    match = re.search(arabic_series_pattern, text_cleaned, re.IGNORECASE)
-    if match:
-        content_type = 'series'
-        raw_name = match.group(1).strip()
-        season_num = int(match.group(2))
-        episode_num = int(match.group(3))
-        clean_name_text = clean_name(raw_name)
-        return clean_name_text, content_type, season_num, episode_num
-    
-    # 6. نمط المسلسل العربي بدون موسم
-    arabic_series_simple = r'^مسلسل\s+(.*?)\s+الحلقة\s+(\d+)$'
-    match = re.search(arabic_series_simple, text_cleaned, re.IGNORECASE)
-    if match:
-        content_type = 'series'
-        raw_name = match.group(1).strip()
-        season_num = 1
-        episode_num = int(match.group(2))
-        clean_name_text = clean_name(raw_name)
-        return clean_name_text, content_type, season_num, episode_num
-    
-    print(f"⚠️ لم يتم التعرف على النمط للنص: {text_cleaned}")
-    
-    # محاولة أخيرة: إذا كان النص يحتوي على "فيلم" في البداية
-    if text_cleaned.lower().startswith('فيلم'):
-        content_type = 'movie'
-        raw_name = text_cleaned[4:].strip()
-        extracted_num = extract_numbers_from_name(raw_name)
-        if extracted_num:
-            raw_name = re.sub(r'[-_]?\d+$', '', raw_name).strip()
-            season_num = extracted_num
-        else:
-            season_num = 1
-        episode_num = 1
-        clean_name_text = clean_name(raw_name)
-        print(f"   ⚠️ معالجة كفيلم افتراضي: {clean_name_text}")
-        return clean_name_text, content_type, season_num, episode_num
-    
-    return None, None, None, None
+class InstrumentedTelegramClient(TelegramClient):
+    """عميل Telethon يقيس زمن كل طلب يُرسل إلى Telegram API."""
+    async def __call__(self, request, *args, **kwargs):
+        method = type(request).__name__ if not isinstance(request, list) else "batch"
+        start = time.perf_counter()
+        try:
+            return await super().__call__(request, *args, **kwargs)
+        finally:
+            TELEGRAM_API_LATENCY.labels(method).observe(time.perf_counter() - start)
 
 async def get_channel_entity(client, channel_input):
     """الحصول على كيان القناة مع معالجة أخطاء الانضمام."""
@@ -256,68 +126,142 @@ async def get_channel_entity(client, channel_input):
         channel = await client.get_entity(channel_input)
         return channel
     except Exception as e:
-        print(f"⚠️ لم نتمكن من الوصول للقناة {channel_input}: {e}")
+        logger.warning(f"⚠️ لم نتمكن من الوصول للقناة {channel_input}: {e}")
         
         # إذا كان رابط دعوة، حاول الانضمام
         if isinstance(channel_input, str) and channel_input.startswith('https://t.me/+'):
             try:
                 # استخراج الهاش من الرابط
                 invite_hash = channel_input.split('+')[-1]
-                print(f"🔄 محاولة الانضمام للقناة عبر رابط الدعوة: {invite_hash}")
+                logger.info(f"🔄 محاولة الانضمام للقناة عبر رابط الدعوة: {invite_hash}")
                 
                 # الانضمام للقناة
                 await client(ImportChatInviteRequest(invite_hash))
-                print(f"✅ تم الانضمام للقناة بنجاح")
+                logger.info(f"✅ تم الانضمام للقناة بنجاح")
                 
                 # المحاولة مرة أخرى
                 return await client.get_entity(channel_input)
             except Exception as join_error:
-                print(f"❌ فشل الانضمام: {join_error}")
+                logger.error(f"❌ فشل الانضمام: {join_error}")
                 return None
         return None
 
+# أخطاء تعني أن الكيان المخزن لم يعد صالحاً (غادر الحساب القناة أو تغير access_hash)
+STALE_ENTITY_ERRORS = (ValueError, ChannelInvalidError, ChannelPrivateError)
+
+def load_cached_channels(account_id):
+    """الكيانات المحلولة سابقاً لهذا الحساب: channel_input -> Channel (بدون أي اتصال بـ Telegram)."""
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT channel_input, channel_id, access_hash, username, title
+            FROM channel_entities WHERE account_id = :account_id
+        """), {"account_id": account_id}).fetchall()
+    return {
+        channel_input: types.Channel(
+            id=channel_id, title=title, photo=types.ChatPhotoEmpty(), date=None,
+            username=username, access_hash=access_hash, broadcast=True
+        )
+        for channel_input, channel_id, access_hash, username, title in rows
+    }
+
+def cache_channel(account_id, channel_input, channel):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO channel_entities (account_id, channel_input, channel_id, access_hash, username, title, resolved_at)
+            VALUES (:account_id, :channel_input, :channel_id, :access_hash, :username, :title, NOW())
+            ON CONFLICT (account_id, channel_input) DO UPDATE
+            SET channel_id = EXCLUDED.channel_id, access_hash = EXCLUDED.access_hash,
+                username = EXCLUDED.username, title = EXCLUDED.title, resolved_at = NOW()
+        """), {
+            "account_id": account_id, "channel_input": channel_input, "channel_id": channel.id,
+            "access_hash": channel.access_hash, "username": channel.username, "title": channel.title,
+        })
+
+def forget_channel(channel):
+    """حذف الكيان من ذاكرة حساب هذه النسخة بعد فشل استخدامه، فيُحل من جديد عند التشغيل التالي.
+    كيانات الحسابات الأخرى لنفس القناة تبقى (access_hash خاص بكل حساب)."""
+    if account_id is None:
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM channel_entities WHERE account_id = :account_id AND channel_id = :channel_id"),
+                {"account_id": account_id, "channel_id": channel.id}
+            )
+        logger.warning(f"⚠️ تم حذف كيان القناة {channel.title} من الذاكرة وسيُحل من جديد عند التشغيل التالي.")
+    except Exception as e:
+        logger.warning(f"⚠️ تعذر حذف كيان القناة من الذاكرة: {e}")
+
+async def resolve_channels(client, channel_inputs):
+    """حل القنوات من ذاكرة قاعدة البيانات، والاتصال بـ Telegram (get_entity / الانضمام) للجديدة فقط."""
+    global account_id
+    account_id = (await client.get_me(input_peer=True)).user_id
+    try:
+        cached = await asyncio.to_thread(load_cached_channels, account_id)
+    except Exception as e:
+        logger.warning(f"⚠️ تعذر قراءة ذاكرة القنوات: {e}")
+        cached = {}
+
+    channels_by_input = {}
+    for channel_input in channel_inputs:
+        channel = cached.get(channel_input)
+        if channel is not None:
+            channels_by_input[channel_input] = channel
+            logger.info(f"✅ تمت إضافة القناة من الذاكرة: {channel.title}")
+            continue
+        try:
+            channel = await get_channel_entity(client, channel_input)
+            if channel:
+                channels_by_input[channel_input] = channel
+                logger.info(f"✅ تمت إضافة القناة: {channel.title}")
+                try:
+                    await asyncio.to_thread(cache_channel, account_id, channel_input, channel)
+                except Exception as e:
+                    logger.warning(f"⚠️ تعذر حفظ كيان القناة {channel_input}: {e}")
+            else:
+                logger.error(f"❌ فشل إضافة القناة: {channel_input}")
+        except Exception as e:
+            logger.error(f"❌ خطأ في إضافة القناة {channel_input}: {e}")
+    return channels_by_input
+
 def save_to_database(name, content_type, season_num, episode_num, telegram_msg_id, channel_id, series_id=None):
     """حفظ المحتوى في قاعدة البيانات مع التحقق من نجاح الإدراج باستخدام المفتاح المركب (channel, message)."""
     try:
         with engine.begin() as conn:
-            # البحث عن المسلسل/الفيلم بنفس الاسم والنوع
+            # البحث عن المسلسل/الفيلم بالمفتاح الموحد والنوع (أو بالاسم نفسه لمحتوى لم يُحسب مفتاحه بعد)
             if not series_id:
-                result = conn.execute(
-                    text("""
-                        SELECT id FROM series 
-                        WHERE name = :name AND type = :type
-                    """),
-                    {"name": name, "type": content_type}
-                ).fetchone()
+                series_lookup = text("""
+                    SELECT id FROM series
+                    WHERE type = :type AND (canonical_key = :key OR (canonical_key IS NULL AND name = :name))
+                    ORDER BY canonical_key IS NULL, id
+                    LIMIT 1
+                """)
+                series_params = {"name": name, "type": content_type, "key": canonical_key(name)}
+                result = conn.execute(series_lookup, series_params).fetchone()
                 
                 if not result:
-                    # إضافة مسلسل/فيلم جديد
-                    conn.execute(
-                        text("""
-                            INSERT INTO series (name, type) 
-                            VALUES (:name, :type)
-                        """),
-                        {"name": name, "type": content_type}
-                    )
-                    # جلب الـ ID الجديد
+                    # إضافة مسلسل/فيلم جديد (قد تضيفه عملية أخرى في نفس اللحظة)
                     result = conn.execute(
                         text("""
-                            SELECT id FROM series 
-                            WHERE name = :name AND type = :type
+                            INSERT INTO series (name, type, canonical_key)
+                            VALUES (:name, :type, :key)
+                            ON CONFLICT DO NOTHING
+                            RETURNING id
                         """),
-                        {"name": name, "type": content_type}
-                    ).fetchone()
+                        series_params
+                    ).fetchone() or conn.execute(series_lookup, series_params).fetchone()
                 
                 series_id = result[0]
             
             # إضافة الحلقة/الجزء مع معرف القناة
             # استخدام ON CONFLICT على (telegram_channel_id, telegram_message_id) لأنه المفتاح الفريد الصحيح
-            result = conn.execute(
+            episode = conn.execute(
                 text("""
                     INSERT INTO episodes (series_id, season, episode_number, 
                            telegram_message_id, telegram_channel_id)
                     VALUES (:sid, :season, :ep_num, :msg_id, :channel)
                     ON CONFLICT (telegram_channel_id, telegram_message_id) DO NOTHING
+                    RETURNING id
                 """),
                 {
                     "sid": series_id,
@@ -326,28 +270,268 @@ def save_to_database(name, content_type, season_num, episode_num, telegram_msg_i
                     "msg_id": telegram_msg_id,
                     "channel": channel_id
                 }
-            )
+            ).fetchone()
             
-            # التحقق من نجاح الإدراج (rowcount سيكون 1 إذا تم الإدراج، 0 إذا كان موجودًا مسبقًا)
-            if result.rowcount == 0:
-                print(f"⏭️ الحلقة موجودة مسبقاً: {name} - الموسم {season_num} الحلقة {episode_num} (msg_id: {telegram_msg_id}, channel: {channel_id})")
+            # لا تُقدم نقطة التقدم هنا: الرسائل المباشرة قد تصل بعد فجوة لم تُعوض بعد،
+            # والتعويض الدوري (catch_up_channel) هو من يقدمها بعد جلب كل ما قبلها
+            
+            # التحقق من نجاح الإدراج (لا يُرجع RETURNING صفاً إذا كانت الحلقة موجودة مسبقاً)
+            if episode is None:
+                INGESTED_MESSAGES.labels("duplicate").inc()
+                logger.debug("⏭️ الحلقة موجودة مسبقاً: %s - الموسم %s الحلقة %s (msg_id: %s, channel: %s)", name, season_num, episode_num, telegram_msg_id, channel_id)
                 return False  # لم تتم الإضافة (موجودة مسبقاً)
             
+            # إشعار متابعي المسلسل (يرسله البوت)؛ في نفس المعاملة حتى لا تضيع الإشعارات
+            _enqueue_notification(conn, series_id, episode[0])
+            # تغذية قائمة "آخر الإضافات" في البوت (يُسلَّم عند نجاح المعاملة فقط)
+            _publish_new_episode(conn, episode[0], series_id, name, content_type, season_num, episode_num)
+            
+        INGESTED_MESSAGES.labels("inserted").inc()
         type_arabic = "مسلسل" if content_type == 'series' else "فيلم"
         if content_type == 'movie':
-            print(f"✅ تمت إضافة {type_arabic}: {name} - الجزء {season_num} من {channel_id}")
+            logger.info(f"✅ تمت إضافة {type_arabic}: {name} - الجزء {season_num} من {channel_id}")
         else:
-            print(f"✅ تمت إضافة {type_arabic}: {name} - الموسم {season_num} الحلقة {episode_num} من {channel_id}")
+            logger.info(f"✅ تمت إضافة {type_arabic}: {name} - الموسم {season_num} الحلقة {episode_num} من {channel_id}")
         return True
         
     except SQLAlchemyError as e:
-        print(f"❌ خطأ في قاعدة البيانات: {e}")
+        INGESTED_MESSAGES.labels("error").inc()
+        logger.error(f"❌ خطأ في قاعدة البيانات: {e}")
+        return False
+
+def save_episodes_batch(rows, notify=False):
+    """حفظ دفعة من الحلقات بعدد ثابت من الاستعلامات مهما كان حجمها.
+
+    rows: قائمة (name, content_type, season_num, episode_num, telegram_msg_id, channel_id).
+    notify: إشعار المتابعين وتغذية "آخر الإضافات" بالحلقات المضافة (للتعويض وليس لاستيراد التاريخ).
+    تعيد عدد الحلقات المضافة فعلاً (المكررة تُتجاهل عبر المفتاح المركب)، و None إذا فشلت الكتابة.
+    """
+    if not rows:
+        return 0
+    try:
+        with engine.begin() as conn:
+            # إضافة المسلسلات/الأفلام الجديدة دفعة واحدة ثم جلب معرفاتها (بالمفتاح الموحد والنوع)
+            row_keys = [(canonical_key(row[0]), row[1]) for row in rows]
+            series_names = {}
+            for row, key in zip(rows, row_keys):
+                series_names.setdefault(key, row[0])
+            conn.execute(
+                text("""
+                    INSERT INTO series (name, type, canonical_key)
+                    SELECT * FROM unnest(CAST(:names AS VARCHAR[]), CAST(:types AS VARCHAR[]), CAST(:keys AS VARCHAR[]))
+                    ON CONFLICT DO NOTHING
+                """),
+                {
+                    "names": list(series_names.values()),
+                    "types": [key[1] for key in series_names],
+                    "keys": [key[0] for key in series_names],
+                }
+            )
+            series_ids = {}
+            # المحتوى الذي لم يُحسب مفتاحه بعد (قبل تشغيل merge-series) يُطابق بالاسم نفسه
+            for series_id, name, content_type, key in conn.execute(
+                text("""
+                    SELECT id, name, type, canonical_key FROM series
+                    WHERE canonical_key = ANY(:keys) OR (canonical_key IS NULL AND name = ANY(:names))
+                    ORDER BY canonical_key IS NULL DESC, id DESC
+                """),
+                {"keys": [key[0] for key in series_names], "names": list(series_names.values())}
+            ):
+                series_ids[(key or canonical_key(name), content_type)] = series_id
+            
+            inserted = conn.execute(
+                text("""
+                    INSERT INTO episodes (series_id, season, episode_number,
+                           telegram_message_id, telegram_channel_id)
+                    SELECT * FROM unnest(CAST(:sids AS INTEGER[]), CAST(:seasons AS INTEGER[]),
+                                         CAST(:ep_nums AS INTEGER[]), CAST(:msg_ids AS INTEGER[]),
+                                         CAST(:channels AS VARCHAR[]))
+                    ON CONFLICT (telegram_channel_id, telegram_message_id) DO NOTHING
+                    RETURNING id, series_id, season, episode_number
+                """),
+                {
+                    "sids": [series_ids[key] for key in row_keys],
+                    "seasons": [row[2] for row in rows],
+                    "ep_nums": [row[3] for row in rows],
+                    "msg_ids": [row[4] for row in rows],
+                    "channels": [row[5] for row in rows],
+                }
+            ).fetchall()
+            
+            if notify and inserted:
+                # طابور الإشعارات وتغذية "آخر الإضافات" في استعلام واحد
+                series_keys_by_id = {
+                    series_id: (series_names[key], key[1]) for key, series_id in series_ids.items() if key in series_names
+                }
+                conn.execute(text("""
+                    WITH queued AS (
+                        INSERT INTO notification_outbox (series_id, episode_id)
+                        SELECT e.series_id, e.id FROM episodes e
+                        WHERE e.id = ANY(:ids)
+                          AND EXISTS (SELECT 1 FROM user_favorites f WHERE f.series_id = e.series_id)
+                        ORDER BY e.id
+                    )
+                    SELECT pg_notify('new_episode', payload) FROM unnest(CAST(:payloads AS TEXT[])) AS payload
+                """), {
+                    "ids": [row[0] for row in inserted],
+                    "payloads": [
+                        _new_episode_payload(episode_id, series_id, *series_keys_by_id[series_id], season_num, episode_num)
+                        for episode_id, series_id, season_num, episode_num in inserted
+                    ],
+                })
+        
+        INGESTED_MESSAGES.labels("inserted").inc(len(inserted))
+        INGESTED_MESSAGES.labels("duplicate").inc(len(rows) - len(inserted))
+        return len(inserted)
+        
+    except SQLAlchemyError as e:
+        INGESTED_MESSAGES.labels("error").inc(len(rows))
+        logger.error(f"❌ خطأ في قاعدة البيانات أثناء حفظ دفعة من {len(rows)} حلقة: {e}")
+        return None
+
+def save_unparsed_batch(rows):
+    """حفظ الرسائل التي لم يتعرف عليها المحلل (channel_id, message_id, caption) لإعادة تحليلها لاحقاً.
+    تعيد False إذا فشلت الكتابة."""
+    if not rows:
+        return True
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO unparsed_messages (telegram_channel_id, telegram_message_id, caption)
+                    SELECT * FROM unnest(CAST(:channels AS VARCHAR[]), CAST(:msg_ids AS INTEGER[]),
+                                         CAST(:captions AS TEXT[]))
+                    ON CONFLICT (telegram_channel_id, telegram_message_id) DO UPDATE
+                    SET caption = EXCLUDED.caption
+                """),
+                {
+                    "channels": [row[0] for row in rows],
+                    "msg_ids": [row[1] for row in rows],
+                    "captions": [row[2] for row in rows],
+                }
+            )
+    except SQLAlchemyError as e:
+        logger.error(f"❌ خطأ في حفظ {len(rows)} رسالة غير محللة: {e}")
         return False
+    return True
+
+def save_parsed_chunk(scope, rows, unparsed, last_ids, notify=False):
+    """كتابة دفعة خرجت من مرحلة التحليل: الحلقات ثم الرسائل غير المحللة ثم نقاط التقدم.
+    فشل الكتابة يوقف المسار برفع استثناء قبل تقديم نقطة التقدم، فتُعاد الدفعة في المحاولة التالية."""
+    with handler_scope(scope):
+        inserted = save_episodes_batch(rows, notify=notify)
+    if inserted is None:
+        raise RuntimeError(f"فشل حفظ دفعة من {len(rows)} حلقة؛ لم تُقدم نقطة التقدم")
+    PARSE_FAILURES.inc(len(unparsed))
+    if not save_unparsed_batch(unparsed):
+        raise RuntimeError(f"فشل حفظ {len(unparsed)} رسالة غير محللة؛ لم تُقدم نقطة التقدم")
+    for channel_id, message_id in last_ids.items():
+        update_checkpoint(channel_id, message_id)
+    return inserted
+
+def _enqueue_notification(conn, series_id, episode_id):
+    """إضافة الحلقة لطابور الإشعارات فقط إذا كان للمسلسل متابعون."""
+    conn.execute(text("""
+        INSERT INTO notification_outbox (series_id, episode_id)
+        SELECT :series_id, :episode_id
+        WHERE EXISTS (SELECT 1 FROM user_favorites WHERE series_id = :series_id)
+    """), {"series_id": series_id, "episode_id": episode_id})
+
+def _new_episode_payload(episode_id, series_id, name, content_type, season_num, episode_num):
+    return json.dumps({
+        "episode_id": episode_id, "series_id": series_id, "name": name, "type": content_type,
+        "season": season_num, "episode_number": episode_num,
+    }, ensure_ascii=False)
+
+def _publish_new_episode(conn, episode_id, series_id, name, content_type, season_num, episode_num):
+    payload = _new_episode_payload(episode_id, series_id, name, content_type, season_num, episode_num)
+    conn.execute(text("SELECT pg_notify('new_episode', :payload)"), {"payload": payload})
+
+def _advance_checkpoint(conn, channel_id, message_id):
+    """تحديث آخر رسالة معالجة للقناة (لا يرجع للخلف أبداً)."""
+    conn.execute(
+        text("""
+            INSERT INTO channel_checkpoints (telegram_channel_id, last_message_id, updated_at)
+            VALUES (:channel, :msg_id, CURRENT_TIMESTAMP)
+            ON CONFLICT (telegram_channel_id) DO UPDATE
+            SET last_message_id = GREATEST(channel_checkpoints.last_message_id, EXCLUDED.last_message_id),
+                updated_at = CURRENT_TIMESTAMP
+        """),
+        {"channel": channel_id, "msg_id": message_id}
+    )
+
+def update_checkpoint(channel_id, message_id):
+    """حفظ نقطة التقدم للقناة بعد معالجة دفعة من الرسائل."""
+    try:
+        with engine.begin() as conn:
+            _advance_checkpoint(conn, channel_id, message_id)
+    except SQLAlchemyError as e:
+        logger.error(f"❌ خطأ في حفظ نقطة التقدم للقناة {channel_id}: {e}")
+
+def get_checkpoint(channel_id):
+    """جلب آخر رسالة معالجة للقناة (0 إذا لم تُعالج القناة من قبل)."""
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text("SELECT last_message_id FROM channel_checkpoints WHERE telegram_channel_id = :channel"),
+                {"channel": channel_id}
+            ).scalar()
+            return result or 0
+    except SQLAlchemyError as e:
+        logger.error(f"❌ خطأ في جلب نقطة التقدم للقناة {channel_id}: {e}")
+        return 0
+
+def get_history_cursor(channel_id):
+    """(آخر رسالة وصل إليها استيراد التاريخ، هل اكتمل الاستيراد) للقناة."""
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                text("""
+                    SELECT history_message_id, history_completed_at IS NOT NULL
+                    FROM channel_checkpoints WHERE telegram_channel_id = :channel
+                """),
+                {"channel": channel_id}
+            ).fetchone()
+            return (row[0] or 0, row[1]) if row else (0, False)
+    except SQLAlchemyError as e:
+        logger.error(f"❌ خطأ في جلب مؤشر استيراد التاريخ للقناة {channel_id}: {e}")
+        return 0, False
+
+def update_history_cursor(channel_id, message_id, completed=False):
+    """تقديم مؤشر استيراد التاريخ (مستقل عن نقطة التقدم)، وتسجيل اكتماله عند الوصول لآخر القناة."""
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO channel_checkpoints (telegram_channel_id, last_message_id, history_message_id,
+                                                     history_completed_at)
+                    VALUES (:channel, 0, :msg_id, CASE WHEN :completed THEN CURRENT_TIMESTAMP END)
+                    ON CONFLICT (telegram_channel_id) DO UPDATE
+                    SET history_message_id = GREATEST(channel_checkpoints.history_message_id, EXCLUDED.history_message_id),
+                        history_completed_at = COALESCE(EXCLUDED.history_completed_at, channel_checkpoints.history_completed_at)
+                """),
+                {"channel": channel_id, "msg_id": message_id, "completed": completed}
+            )
+    except SQLAlchemyError as e:
+        logger.error(f"❌ خطأ في حفظ مؤشر استيراد التاريخ للقناة {channel_id}: {e}")
+
+def get_channel_key(chat):
+    """المعرف المخزن للقناة في قاعدة البيانات (@username أو المعرف الرقمي)."""
+    return f"@{chat.username}" if hasattr(chat, 'username') and chat.username else str(chat.id)
 
 def delete_from_database(message_id, channel_id=None):
     """حذف حلقة/جزء من قاعدة البيانات عند حذفها من القناة."""
     try:
         with engine.begin() as conn:
+            # الرسالة المحذوفة لا يجب أن تعود عند إعادة تحليل الرسائل غير المحللة
+            conn.execute(
+                text("""
+                    DELETE FROM unparsed_messages
+                    WHERE telegram_message_id = :msg_id AND (:channel IS NULL OR telegram_channel_id = :channel)
+                """),
+                {"msg_id": message_id, "channel": channel_id}
+            )
+            
             # البحث عن الحلقة المراد حذفها (نحتاج channel_id لتحديدها بدقة)
             if channel_id:
                 # إذا كان لدينا channel_id، نستخدمه مع message_id
@@ -373,7 +557,7 @@ def delete_from_database(message_id, channel_id=None):
                 ).fetchone()
             
             if not episode_result:
-                print(f"⚠️ لم يتم العثور على الحلقة {message_id} في قاعدة البيانات")
+                logger.debug("⚠️ لم يتم العثور على الحلقة %s في قاعدة البيانات", message_id)
                 return False
             
             episode_id, series_id, name, content_type, season, episode_num, channel_id = episode_result
@@ -398,26 +582,26 @@ def delete_from_database(message_id, channel_id=None):
                     text("DELETE FROM series WHERE id = :series_id"),
                     {"series_id": series_id}
                 )
-                print(f"🗑️ تم حذف {type_arabic}: {name} بالكامل من {channel_id} (لا توجد حلقات/أجزاء متبقية)")
+                logger.debug("🗑️ تم حذف %s: %s بالكامل من %s (لا توجد حلقات/أجزاء متبقية)", type_arabic, name, channel_id)
             else:
                 if content_type == 'movie':
-                    print(f"🗑️ تم حذف {type_arabic}: {name} - الجزء {season} من {channel_id}")
+                    logger.debug("🗑️ تم حذف %s: %s - الجزء %s من %s", type_arabic, name, season, channel_id)
                 else:
-                    print(f"🗑️ تم حذف {type_arabic}: {name} - الموسم {season} الحلقة {episode_num} من {channel_id}")
+                    logger.debug("🗑️ تم حذف %s: %s - الموسم %s الحلقة %s من %s", type_arabic, name, season, episode_num, channel_id)
             
             return True
             
     except SQLAlchemyError as e:
-        print(f"❌ خطأ في حذف من قاعدة البيانات: {e}")
+        logger.error(f"❌ خطأ في حذف من قاعدة البيانات: {e}")
         return False
 
 async def check_deleted_messages(client, channel):
     """التحقق من الرسائل المحذوفة في القناة."""
     channel_id = f"@{channel.username}" if hasattr(channel, 'username') and channel.username else str(channel.id)
-    print(f"\n🔍 التحقق من الرسائل المحذوفة في {channel.title}...")
+    logger.info(f"🔍 التحقق من الرسائل المحذوفة في {channel.title}...")
     
     try:
-        with engine.connect() as conn:
+        with handler_scope("worker.reconcile"), engine.connect() as conn:
             # جلب جميع معرفات الرسائل المخزنة في قاعدة البيانات لهذه القناة
             stored_messages = conn.execute(
                 text("""
@@ -431,180 +615,716 @@ async def check_deleted_messages(client, channel):
             stored_ids = [msg[0] for msg in stored_messages]
             
             if not stored_ids:
-                print(f"   لا توجد رسائل مخزنة للقناة {channel.title}")
+                logger.info(f"لا توجد رسائل مخزنة للقناة {channel.title}")
                 return
             
             # جلب معرفات الرسائل الحالية في القناة
-            current_ids = []
+            current_ids = set()
             async for message in client.iter_messages(channel, limit=1000):
-                current_ids.append(message.id)
+                current_ids.add(message.id)
+            
+            # الفحص يغطي آخر 1000 رسالة فقط؛ الحلقات الأقدم منها (من استيراد التاريخ) لم تُفحص فلا تُحذف
+            oldest_checked = min(current_ids) if len(current_ids) >= 1000 else 0
             
             # تحديد الرسائل المحذوفة (الموجودة في قاعدة البيانات ولكن ليس في القناة)
             deleted_ids = []
             for stored_id in stored_ids:
-                if stored_id not in current_ids:
+                if stored_id >= oldest_checked and stored_id not in current_ids:
                     deleted_ids.append(stored_id)
             
             if deleted_ids:
-                print(f"   تم العثور على {len(deleted_ids)} رسالة محذوفة في {channel.title}")
+                logger.info(f"تم العثور على {len(deleted_ids)} رسالة محذوفة في {channel.title}")
                 for msg_id in deleted_ids:
-                    print(f"   🗑️ معالجة الرسالة المحذوفة: {msg_id}")
+                    logger.debug("🗑️ معالجة الرسالة المحذوفة: %s", msg_id)
                     # نمرر channel_id لتحديد الحلقة بدقة
                     delete_from_database(msg_id, channel_id)
             else:
-                print(f"   ✅ لا توجد رسائل محذوفة في {channel.title}")
+                logger.info(f"✅ لا توجد رسائل محذوفة في {channel.title}")
                 
     except Exception as e:
-        print(f"❌ خطأ في التحقق من الرسائل المحذوفة في {channel.title}: {e}")
+        logger.error(f"❌ خطأ في التحقق من الرسائل المحذوفة في {channel.title}: {e}")
+        if isinstance(e, STALE_ENTITY_ERRORS):
+            forget_channel(channel)
 
 # ==============================
 # 5. استيراد المسلسلات القديمة
 # ==============================
 async def import_channel_history(client, channel):
-    """استيراد جميع الرسائل القديمة من القناة بأقدمها أولاً."""
-    print(f"\n" + "="*50)
-    print(f"📂 بدء استيراد المحتوى القديم من القناة: {channel.title}")
-    print("="*50)
+    """استيراد جميع رسائل القناة بأقدمها أولاً (صفحات متتالية بدون حد، كتابة على دفعات).
+    يستأنف من مؤشر استيراد التاريخ وليس من نقطة التقدم، فيستورد ما قبل أول حلقة مسجلة أيضاً."""
+    logger.info(f"📂 بدء استيراد المحتوى القديم من القناة: {channel.title}")
     
     imported_count = 0
     skipped_count = 0
     error_count = 0
     
     try:
-        # جمع جميع الرسائل أولاً
-        all_messages = []
-        async for message in client.iter_messages(channel, limit=1000):
-            all_messages.append(message)
+        # الاستئناف من مؤشر الاستيراد (بعد انقطاع استيراد سابق)
+        channel_key = get_channel_key(channel)
+        cursor, _ = get_history_cursor(channel_key)
+        if cursor:
+            logger.info(f"⏩ الاستئناف من الرسالة {cursor} في {channel.title}")
         
-        # عكس الترتيب للحصول على الأقدم أولاً
-        all_messages.reverse()
+        fetched_count = written_count = 0
+        last_id = cursor
         
-        print(f"📊 تم جمع {len(all_messages)} رسالة للاستيراد...")
+        async def chunks():
+            nonlocal fetched_count, last_id
+            chunk = []
+            async for message in client.iter_messages(channel, min_id=cursor, reverse=True):
+                fetched_count += 1
+                last_id = message.id
+                chunk.append((channel_key, message.id, message.text))
+                if len(chunk) >= IMPORT_BATCH_SIZE:
+                    WORKER_QUEUE_DEPTH.labels("import").set(fetched_count - written_count)
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
         
-        for message in all_messages:
-            if not message.text:
-                continue
-            
-            try:
-                name, content_type, season_num, episode_num = parse_content_info(message.text)
-                if name and content_type and episode_num:
-                    channel_id = f"@{message.chat.username}" if hasattr(message.chat, 'username') and message.chat.username else str(message.chat.id)
-                    if save_to_database(name, content_type, season_num, episode_num, message.id, channel_id):
-                        imported_count += 1
-                    else:
-                        skipped_count += 1
-                else:
-                    print(f"⚠️ لم يتم تحليل الرسالة: {message.text[:50]}...")
-                    error_count += 1
-            except Exception as e:
-                print(f"❌ خطأ في معالجة الرسالة {message.id}: {e}")
-                error_count += 1
+        def write(rows, unparsed, last_ids):
+            nonlocal imported_count, skipped_count, error_count, written_count
+            inserted = save_parsed_chunk("worker.import", rows, unparsed, last_ids)
+            if channel_key in last_ids:
+                update_history_cursor(channel_key, last_ids[channel_key])
+            written_count += len(rows) + len(unparsed)
+            imported_count += inserted
+            skipped_count += len(rows) - inserted
+            error_count += len(unparsed)
+            logger.info(
+                f"📦 دفعة استيراد من {channel.title}",
+                extra={"fields": {
+                    "channel": channel_key, "parsed": len(rows), "inserted": inserted,
+                    "skipped": len(rows) - inserted, "failed": len(unparsed),
+                    "last_message_id": last_ids.get(channel_key),
+                }}
+            )
         
-        print("="*50)
-        print(f"✅ اكتمل استيراد القناة {channel.title}!")
-        print(f"   - تم استيراد: {imported_count} عنصر جديد")
-        print(f"   - تم تخطي: {skipped_count} عنصر (موجود مسبقاً)")
-        print(f"   - فشل تحليل: {error_count} رسالة")
-        print("="*50)
+        await run_pipeline(chunks(), write, IMPORT_BATCH_SIZE)
+        WORKER_QUEUE_DEPTH.labels("import").set(0)
+        update_history_cursor(channel_key, last_id, completed=True)
+        
+        logger.info(
+            f"✅ اكتمل استيراد القناة {channel.title}!",
+            extra={"fields": {
+                "channel": channel_key, "fetched": fetched_count, "imported": imported_count,
+                "skipped": skipped_count, "failed": error_count,
+            }}
+        )
         
     except Exception as e:
-        print(f"❌ خطأ أثناء استيراد التاريخ من {channel.title}: {e}")
+        logger.exception(f"❌ خطأ أثناء استيراد التاريخ من {channel.title}: {e}")
+        if isinstance(e, STALE_ENTITY_ERRORS):
+            forget_channel(channel)
+
+async def flush_sql_stats_periodically():
+    """حفظ إحصائيات الاستعلامات في قاعدة البيانات كل SQL_STATS_FLUSH_SECONDS ثانية."""
+    while True:
+        await asyncio.sleep(SQL_STATS_FLUSH_SECONDS)
+        try:
+            # كل نسخة تحفظ إحصائياتها في صفوفها حتى لا تستبدل النسخ صفوف بعضها
+            flush_stats(engine, f"worker:{WORKER_ID}"[:64])
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر حفظ إحصائيات الاستعلامات: {e}")
+
+async def poll_profile_requests():
+    """تنفيذ طلبات التحليل المعلقة واحداً تلو الآخر وكتابة الملخص في جدول profile_requests."""
+    while True:
+        await asyncio.sleep(PROFILE_POLL_SECONDS)
+        request_id = None
+        try:
+            with engine.begin() as conn:
+                row = conn.execute(text("""
+                    UPDATE profile_requests SET status = 'running'
+                    WHERE id = (
+                        SELECT id FROM profile_requests
+                        WHERE status = 'pending' AND target LIKE 'worker%'
+                        ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, target, seconds, sample_rate
+                """)).fetchone()
+            if not row:
+                continue
+            request_id, target, seconds, sample_rate = row
+            logger.info(f"🔬 بدء تحليل {target} لمدة {seconds} ثانية (طلب #{request_id})")
+            session = PROFILER.start(target, seconds, sample_rate)
+            result, status = await PROFILER.wait(session), 'done'
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر تنفيذ طلب التحليل: {e}")
+            if request_id is None:
+                continue
+            result, status = f"❌ فشل التحليل في الـ Worker: {e}", 'failed'
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    UPDATE profile_requests SET status = :status, result = :result, finished_at = NOW()
+                    WHERE id = :id
+                """), {"status": status, "result": result, "id": request_id})
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر حفظ نتيجة التحليل #{request_id}: {e}")
+
+def bootstrap_from_snapshot(path):
+    """تحميل لقطة الفهرس إذا كانت قاعدة البيانات فارغة، ثم تكمل المراقبة من نقاط التقدم المخزنة."""
+    try:
+        with engine.connect() as conn:
+            has_episodes = conn.execute(text("SELECT EXISTS (SELECT 1 FROM episodes)")).scalar()
+        if has_episodes:
+            logger.warning("⚠️ قاعدة البيانات ليست فارغة، تم تجاهل BOOTSTRAP_SNAPSHOT.")
+            return
+        load_snapshot(engine, path)
+    except Exception as e:
+        logger.error(f"❌ فشل تحميل لقطة الفهرس {path}: {e}")
+
+async def catch_up_channel(client, channel):
+    """جلب الرسائل بعد نقطة التقدم فقط (الأقدم أولاً، بدون حد) وكتابتها عبر مسار الدفعات.
+    الزمن يتناسب مع حجم الفجوة: بدون رسائل جديدة يكلف طلباً واحداً.
+    نقطة التقدم لا يقدمها إلا هذا المسار والاستيراد، فهي تعني أن كل ما قبلها كُتب فعلاً."""
+    channel_key = get_channel_key(channel)
+    checkpoint = get_checkpoint(channel_key)
+    if not checkpoint:
+        # قناة بدون نقطة تقدم ولا استيراد: المراقبة تبدأ من آخر رسالة حالية
+        try:
+            latest = await client.get_messages(channel, limit=1)
+        except Exception as e:
+            logger.error(f"❌ تعذر جلب آخر رسالة في {channel.title}: {e}")
+            if isinstance(e, STALE_ENTITY_ERRORS):
+                forget_channel(channel)
+            return 0
+        if latest:
+            update_checkpoint(channel_key, latest[0].id)
+        return 0
+    
+    fetched = inserted = 0
+    last_id = checkpoint
+    
+    async def chunks():
+        nonlocal fetched, last_id
+        chunk = []
+        async for message in client.iter_messages(channel, min_id=checkpoint, reverse=True):
+            fetched += 1
+            last_id = message.id
+            chunk.append((channel_key, message.id, message.text))
+            if len(chunk) >= IMPORT_BATCH_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    def write(rows, unparsed, last_ids):
+        nonlocal inserted
+        inserted += save_parsed_chunk("worker.catch_up", rows, unparsed, last_ids, notify=True)
+    
+    try:
+        await run_pipeline(chunks(), write, IMPORT_BATCH_SIZE)
+    except Exception as e:
+        logger.error(f"❌ خطأ أثناء تعويض الرسائل الفائتة في {channel.title}: {e}")
+        if isinstance(e, STALE_ENTITY_ERRORS):
+            forget_channel(channel)
+    
+    if fetched:
+        logger.info(
+            f"⏩ تم تعويض {fetched} رسالة فائتة في {channel.title}",
+            extra={"fields": {"channel": channel_key, "from": checkpoint, "to": last_id, "inserted": inserted}}
+        )
+    return inserted
+
+async def take_over_channel(client, channel):
+    """استيراد تاريخ القناة إذا كان مفعلاً ولم يكتمل من قبل، وإلا تعويض ما فاتها منذ نقطة التقدم،
+    ثم التحقق من الرسائل المحذوفة إذا كان مفعلاً."""
+    channel_key = get_channel_key(channel)
+    if IMPORT_HISTORY and not get_history_cursor(channel_key)[1]:
+        await import_channel_history(client, channel)
+    else:
+        await catch_up_channel(client, channel)
+    if CHECK_DELETED_MESSAGES:
+        await check_deleted_messages(client, channel)
+
+# مهام التعويض/الاستيراد الجارية لكل قناة (peer_id -> Task)
+channel_syncs = {}
+
+def start_channel_sync(client, channel, sync):
+    """تشغيل تعويض القناة أو استيرادها كمهمة منفصلة (واحدة لكل قناة) حتى لا يؤخر تجديد العقود والقيادة."""
+    peer = get_peer_id(channel)
+    task = channel_syncs.get(peer)
+    if task is not None and not task.done():
+        return task
+    task = asyncio.create_task(sync(client, channel))
+    channel_syncs[peer] = task
+
+    def finished(done_task):
+        if channel_syncs.get(peer) is done_task:
+            del channel_syncs[peer]
+        if not done_task.cancelled() and done_task.exception():
+            logger.error(f"❌ فشلت معالجة القناة {channel.title}: {done_task.exception()}")
+
+    task.add_done_callback(finished)
+    return task
+
+def stop_channel_syncs(peers=None):
+    """إيقاف مهام القنوات التي لم تعد هذه النسخة تملكها (كلها إذا لم تُحدد) حتى لا تعالجها نسختان."""
+    for peer in list(channel_syncs) if peers is None else peers:
+        task = channel_syncs.pop(peer, None)
+        if task is not None:
+            task.cancel()
+
+async def catch_up_periodically(client, channels, owned_peers):
+    """Telethon يعيد الاتصال داخلياً بدون إشعار، لذا نعوض الفجوات دورياً من نقاط التقدم،
+    ونعيد الاتصال بأنفسنا إذا توقف العميل عن المحاولة."""
+    while True:
+        await asyncio.sleep(CATCH_UP_SECONDS)
+        try:
+            if not client.is_connected():
+                logger.warning("⚠️ انقطع الاتصال بـ Telegram، إعادة الاتصال...")
+                await client.connect()
+            for channel in channels:
+                if get_peer_id(channel) in owned_peers:
+                    start_channel_sync(client, channel, catch_up_channel)
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر تعويض الرسائل الفائتة: {e}")
+
+async def maintain_channel_leases(client, manager, channels, owned_peers):
+    """تجديد العقود دورياً وتحديث مجموعة القنوات المملوكة التي تعالج المعالجات رسائلها فقط."""
+    renewed_at = time.monotonic()
+    while True:
+        try:
+            owned = await asyncio.to_thread(manager.heartbeat)
+            renewed_at = time.monotonic()
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر تجديد عقود القنوات: {e}")
+            # بعد انتهاء العقد قد تأخذ نسخة أخرى القنوات، فنتوقف عن معالجتها حتى لا تتكرر الكتابة
+            if time.monotonic() - renewed_at >= manager.ttl:
+                owned_peers.clear()
+                stop_channel_syncs()
+            await asyncio.sleep(LEASE_HEARTBEAT_SECONDS)
+            continue
+
+        wanted = {get_peer_id(channels[channel_input]): channel_input for channel_input in owned}
+        released = owned_peers - wanted.keys()
+        acquired = [peer for peer in wanted if peer not in owned_peers]
+        owned_peers.difference_update(released)
+        owned_peers.update(acquired)
+        stop_channel_syncs(released)
+        if released or acquired:
+            logger.info(
+                "🔁 تغيرت القنوات المملوكة لهذه النسخة",
+                extra={"fields": {
+                    "worker_id": manager.worker_id,
+                    "acquired": [wanted[peer] for peer in acquired],
+                    "released": len(released),
+                    "owned": sorted(wanted.values()),
+                }}
+            )
+        for peer in acquired:
+            start_channel_sync(client, channels[wanted[peer]], take_over_channel)
+        await asyncio.sleep(LEASE_HEARTBEAT_SECONDS)
+
+async def maintain_leadership(client, leader, channels, owned_peers):
+    """النسخة الاحتياطية تحاول أخذ القيادة دورياً، والقائدة تتحقق من أنها ما زالت تملك القفل."""
+    while True:
+        await asyncio.sleep(LEADER_RETRY_SECONDS)
+        try:
+            if leader.is_leader:
+                if not await asyncio.to_thread(leader.check):
+                    # قد تكون نسخة أخرى أخذت القيادة؛ نتوقف عن المعالجة حتى لا تتكرر الكتابة
+                    owned_peers.clear()
+                    stop_channel_syncs()
+                    logger.warning("⚠️ فقدت هذه النسخة القيادة، التحول إلى احتياطية.")
+                continue
+            if not await asyncio.to_thread(leader.try_acquire):
+                continue
+        except Exception as e:
+            logger.warning(f"⚠️ تعذر التحقق من القيادة: {e}")
+            continue
+
+        owned_peers.update(get_peer_id(channel) for channel in channels)
+        logger.info(
+            f"👑 النسخة {WORKER_ID} تتولى مراقبة القنوات",
+            extra={"fields": {"worker_id": WORKER_ID, "channels": len(channels)}}
+        )
+        for channel in channels:
+            start_channel_sync(client, channel, take_over_channel)
+
+def stored_channel_key(channel_id):
+    """المعرف المخزن (@username أو المعرف الرقمي) لقناة معروفة في ذاكرة القنوات؛ None إذا لم تُحل من قبل."""
+    with engine.connect() as conn:
+        row = conn.execute(text("""
+            SELECT username FROM channel_entities WHERE channel_id = :channel_id
+            ORDER BY username IS NULL, resolved_at DESC LIMIT 1
+        """), {"channel_id": channel_id}).fetchone()
+    if row is None:
+        return None
+    return f"@{row[0]}" if row[0] else str(channel_id)
+
+async def replay_dump(path, channel_key=None):
+    """إدخال تصدير قناة (JSON lines أو Telegram Desktop) عبر المحلل ومسار الدفعات بدون Telegram.
+    الملف يُقرأ رسالةً رسالة، فالذاكرة محدودة بحجم الطوابير مهما كان حجمه."""
+    started_at = time.perf_counter()
+    dump = iter_dump(path)
+    channels = set()
+    # المعرف الرقمي في تصدير Telegram Desktop -> المعرف المخزن للقناة
+    stored_keys = {}
+    read_count = imported_count = failed_count = 0
+    
+    def resolve_key(dump_channel):
+        if not isinstance(dump_channel, int):
+            return dump_channel
+        if dump_channel not in stored_keys:
+            key = stored_channel_key(dump_channel)
+            if key is None:
+                # القنوات العامة مخزنة باسم المستخدم، فلا يصح التخمين من المعرف الرقمي
+                raise ValueError(f"القناة {dump_channel} غير معروفة في ذاكرة القنوات؛ حدد القناة عبر --channel")
+            stored_keys[dump_channel] = key
+        return stored_keys[dump_channel]
+    
+    def next_chunk():
+        chunk = []
+        for dump_channel, message_id, message_text in dump:
+            key = channel_key or resolve_key(dump_channel)
+            if not key:
+                raise ValueError(f"الرسالة {message_id} بدون قناة؛ حدد القناة عبر --channel")
+            chunk.append((key, message_id, message_text))
+            if len(chunk) >= IMPORT_BATCH_SIZE:
+                break
+        return chunk
+    
+    async def chunks():
+        nonlocal read_count
+        # قراءة الملف في خيط حتى تعمل مراحل التحليل والكتابة بالتوازي معها
+        while chunk := await asyncio.to_thread(next_chunk):
+            read_count += len(chunk)
+            yield chunk
+    
+    def write(rows, unparsed, last_ids):
+        nonlocal imported_count, failed_count
+        imported_count += save_parsed_chunk("worker.replay", rows, unparsed, last_ids)
+        failed_count += len(unparsed)
+        channels.update(last_ids)
+    
+    await run_pipeline(chunks(), write, IMPORT_BATCH_SIZE)
+    
+    elapsed = time.perf_counter() - started_at
+    logger.info(
+        f"✅ اكتمل إدخال التصدير {path}",
+        extra={"fields": {
+            "channels": sorted(channels), "read": read_count, "imported": imported_count,
+            "skipped": read_count - failed_count - imported_count, "failed": failed_count,
+            "seconds": round(elapsed, 2),
+        }}
+    )
+    return imported_count
+
+def reparse_unparsed(page_size=1000):
+    """إعادة تشغيل المحلل الحالي على الرسائل غير المحللة فقط (بعد إصلاح المحلل) وإدخال ما تعرف عليه دفعةً واحدة.
+    التكلفة تتناسب مع عدد الرسائل الفاشلة وليس مع حجم القنوات."""
+    started_at = time.perf_counter()
+    after = ("", 0)
+    scanned_count = recovered_count = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT telegram_channel_id, telegram_message_id, caption FROM unparsed_messages
+                WHERE (telegram_channel_id, telegram_message_id) > (:channel, :msg_id)
+                ORDER BY telegram_channel_id, telegram_message_id
+                LIMIT :limit
+            """), {"channel": after[0], "msg_id": after[1], "limit": page_size}).fetchall()
+        if not rows:
+            break
+        after = (rows[-1][0], rows[-1][1])
+        scanned_count += len(rows)
+        
+        matched = []
+        for channel_id, message_id, caption in rows:
+            name, content_type, season_num, episode_num = parse_content_info(caption)
+            if name and content_type and episode_num:
+                matched.append((name, content_type, season_num, episode_num, message_id, channel_id))
+        if not matched:
+            continue
+        with handler_scope("worker.reparse"):
+            recovered_count += save_episodes_batch(matched) or 0
+        # الحذف فقط لما أصبح له حلقة فعلاً (فشل الكتابة يبقي الرسائل لمحاولة لاحقة)
+        with engine.begin() as conn:
+            conn.execute(text("""
+                DELETE FROM unparsed_messages u
+                USING episodes e, unnest(CAST(:channels AS VARCHAR[]), CAST(:msg_ids AS INTEGER[])) AS t(channel, msg_id)
+                WHERE u.telegram_channel_id = t.channel AND u.telegram_message_id = t.msg_id
+                  AND e.telegram_channel_id = t.channel AND e.telegram_message_id = t.msg_id
+            """), {"channels": [row[5] for row in matched], "msg_ids": [row[4] for row in matched]})
+    
+    logger.info(
+        "✅ اكتملت إعادة تحليل الرسائل غير المحللة",
+        extra={"fields": {
+            "scanned": scanned_count, "recovered": recovered_count,
+            "seconds": round(time.perf_counter() - started_at, 2),
+        }}
+    )
+    return recovered_count
+
+def merge_duplicate_series():
+    """دمج المحتويات التي لها نفس المفتاح الموحد والنوع في أقدمها وحساب المفاتيح لكل المحتوى (مهمة لمرة واحدة).
+    الحلقات والمفضلة وطابور الإشعارات تنتقل للمحتوى الباقي، ثم يُنشأ الفهرس الفريد.
+    حلقات المحتوى المدمج المكررة (نفس الموسم والحلقة موجودة في الباقي) تُحذف حتى لا تتكرر في القوائم والأعداد."""
+    with engine.begin() as conn:
+        # منع الـ Worker من إضافة محتوى أثناء الدمج (القراءة مستمرة)
+        conn.execute(text("LOCK TABLE series IN SHARE ROW EXCLUSIVE MODE"))
+        rows = conn.execute(text("SELECT id, name, type, canonical_key FROM series ORDER BY id")).fetchall()
+        
+        survivors = {}
+        merged = {}
+        keys = {}
+        for series_id, name, content_type, current_key in rows:
+            key = canonical_key(name)
+            survivor = survivors.setdefault((content_type, key), series_id)
+            if survivor != series_id:
+                merged[series_id] = survivor
+            elif current_key != key:
+                keys[series_id] = key
+        
+        duplicate_episodes = 0
+        if merged:
+            mapping = {"losers": list(merged), "survivors": list(merged.values())}
+            # حلقات الباقي تبقى كلها؛ من حلقات المدمج تبقى فقط التي لا تكرر حلقة قبلها في نفس المجموعة
+            duplicate_episodes = len(conn.execute(text("""
+                WITH m AS (
+                    SELECT * FROM unnest(CAST(:losers AS INTEGER[]), CAST(:survivors AS INTEGER[])) AS m(loser, survivor)
+                ), ranked AS (
+                    SELECT e.id, m.loser IS NOT NULL AS from_loser,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY COALESCE(m.survivor, e.series_id), e.season, e.episode_number
+                               ORDER BY m.loser IS NOT NULL, e.id
+                           ) AS position
+                    FROM episodes e
+                    LEFT JOIN m ON e.series_id = m.loser
+                    WHERE e.series_id = ANY(:losers) OR e.series_id = ANY(:survivors)
+                )
+                DELETE FROM episodes WHERE id IN (SELECT id FROM ranked WHERE from_loser AND position > 1)
+                RETURNING id
+            """), mapping).fetchall())
+            conn.execute(text("""
+                UPDATE episodes e SET series_id = m.survivor
+                FROM unnest(CAST(:losers AS INTEGER[]), CAST(:survivors AS INTEGER[])) AS m(loser, survivor)
+                WHERE e.series_id = m.loser
+            """), mapping)
+            conn.execute(text("""
+                INSERT INTO user_favorites (user_id, series_id, added_at)
+                SELECT f.user_id, m.survivor, f.added_at
+                FROM user_favorites f
+                JOIN unnest(CAST(:losers AS INTEGER[]), CAST(:survivors AS INTEGER[])) AS m(loser, survivor)
+                  ON f.series_id = m.loser
+                ON CONFLICT (series_id, user_id) DO NOTHING
+            """), mapping)
+            conn.execute(text("DELETE FROM user_favorites WHERE series_id = ANY(:losers)"), mapping)
+            conn.execute(text("""
+                UPDATE notification_outbox o SET series_id = m.survivor
+                FROM unnest(CAST(:losers AS INTEGER[]), CAST(:survivors AS INTEGER[])) AS m(loser, survivor)
+                WHERE o.series_id = m.loser
+            """), mapping)
+            conn.execute(text("DELETE FROM series WHERE id = ANY(:losers)"), mapping)
+        
+        if keys:
+            params = {"ids": list(keys), "keys": list(keys.values())}
+            # مسح المفاتيح القديمة أولاً حتى لا يتعارض تحديث صف مع مفتاح قديم في صف آخر
+            conn.execute(text("UPDATE series SET canonical_key = NULL WHERE id = ANY(:ids)"), params)
+            conn.execute(text("""
+                UPDATE series s SET canonical_key = t.key
+                FROM unnest(CAST(:ids AS INTEGER[]), CAST(:keys AS VARCHAR[])) AS t(id, key)
+                WHERE s.id = t.id
+            """), params)
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_series_type_canonical_key ON series(type, canonical_key)"))
+    
+    logger.info(
+        "✅ اكتمل دمج المحتويات المكررة",
+        extra={"fields": {
+            "series": len(rows), "merged": len(merged), "remaining": len(rows) - len(merged),
+            "keyed": len(keys), "duplicate_episodes": duplicate_episodes,
+        }}
+    )
+    return len(merged)
 
 # ==============================
 # 6. الدالة الرئيسية لمراقبة القنوات
 # ==============================
 async def monitor_channels():
     """الدالة الرئيسية لمراقبة عدة قنوات."""
-    print("="*50)
-    print(f"🔍 بدء مراقبة {len(CHANNEL_LIST)} قناة:")
-    for i, chan in enumerate(CHANNEL_LIST, 1):
-        print(f"   {i}. {chan}")
-    print("="*50)
+    global worker_ready
+    logger.info(f"🔍 بدء مراقبة {len(CHANNEL_LIST)} قناة", extra={"fields": {"channels": CHANNEL_LIST}})
+    
+    # تهيئة نشر جديد من لقطة الفهرس بدلاً من إعادة استيراد القنوات
+    if BOOTSTRAP_SNAPSHOT:
+        bootstrap_from_snapshot(BOOTSTRAP_SNAPSHOT)
     
-    client = TelegramClient(StringSession(STRING_SESSION), API_ID, API_HASH)
+    client = InstrumentedTelegramClient(StringSession(STRING_SESSION), API_ID, API_HASH)
+    lease_manager = None
+    leader = None
+    # المهام الدورية تُلغى عند الخروج حتى لا تستمر بعد انتهاء المراقبة
+    background_tasks = []
     
     try:
         await client.start()
-        print("✅ تم الاتصال بـ Telegram بنجاح.")
+        logger.info("✅ تم الاتصال بـ Telegram بنجاح.")
         
-        # الحصول على كيانات جميع القنوات
-        channel_entities = []
-        for channel_input in CHANNEL_LIST:
-            try:
-                channel = await get_channel_entity(client, channel_input)
-                if channel:
-                    channel_entities.append(channel)
-                    print(f"✅ تمت إضافة القناة: {channel.title}")
-                else:
-                    print(f"❌ فشل إضافة القناة: {channel_input}")
-            except Exception as e:
-                print(f"❌ خطأ في إضافة القناة {channel_input}: {e}")
+        # الحصول على كيانات جميع القنوات (من الذاكرة إن وجدت)
+        channels_by_input = await resolve_channels(client, CHANNEL_LIST)
         
+        channel_entities = list(channels_by_input.values())
         if not channel_entities:
-            print("❌ لم يتم العثور على أي قناة صالحة!")
+            logger.error("❌ لم يتم العثور على أي قناة صالحة!")
             return
         
-        # استيراد المحتوى القديم إذا كان مفعلاً
-        if IMPORT_HISTORY:
-            for channel in channel_entities:
-                await import_channel_history(client, channel)
+        # القنوات التي تعالج هذه النسخة رسائلها (حصتها من العقود، أو كلها إن كانت القائدة)
+        if CHANNEL_SHARDING:
+            # العقود على القنوات التي استطاع حساب هذه النسخة الوصول إليها فقط؛
+            # maintain_channel_leases يأخذ الحصة في أول تجديد ويبدأ معالجة القنوات المملوكة
+            lease_manager = ChannelLeaseManager(engine, channels_by_input)
+            owned_channels = []
+        elif LEADER_ELECTION:
+            leader = AdvisoryLeader(engine)
+            owned_channels = channel_entities if await asyncio.to_thread(leader.try_acquire) else []
+            if not owned_channels:
+                logger.info(
+                    f"💤 النسخة {WORKER_ID} احتياطية، تنتظر القيادة",
+                    extra={"fields": {"worker_id": WORKER_ID}}
+                )
         else:
-            print("⚠️ استيراد المحتوى القديم معطل.")
-        
-        # التحقق من الرسائل المحذوفة إذا كان مفعلاً
-        if CHECK_DELETED_MESSAGES:
-            for channel in channel_entities:
-                await check_deleted_messages(client, channel)
+            owned_channels = channel_entities
+        owned_peers = {get_peer_id(channel) for channel in owned_channels}
         
         # مراقبة الرسائل الجديدة من جميع القنوات
         @client.on(events.NewMessage(chats=channel_entities))
+        @profiled("worker.live")
         async def handler(event):
             message = event.message
-            if message.text:
+            if not message.text or event.chat_id not in owned_peers:
+                return
+            WORKER_QUEUE_DEPTH.labels("live").inc()
+            try:
                 channel_name = f"@{message.chat.username}" if hasattr(message.chat, 'username') and message.chat.username else message.chat.title
-                print(f"📥 رسالة جديدة من {channel_name}: {message.text[:50]}...")
+                logger.debug("📥 رسالة جديدة من %s: %s...", channel_name, message.text[:50])
                 
+                # إضافة معرف القناة في قاعدة البيانات
+                channel_id = f"@{message.chat.username}" if hasattr(message.chat, 'username') and message.chat.username else str(message.chat.id)
                 name, content_type, season_num, episode_num = parse_content_info(message.text)
                 if name and content_type and episode_num:
-                    type_arabic = "مسلسل" if content_type == 'series' else "فيلم"
-                    if content_type == 'movie':
-                        print(f"   تم التعرف على {type_arabic}: {name} - الجزء {season_num}")
-                    else:
-                        print(f"   تم التعرف على {type_arabic}: {name} - الموسم {season_num} الحلقة {episode_num}")
-                    
-                    # إضافة معرف القناة في قاعدة البيانات
-                    channel_id = f"@{message.chat.username}" if hasattr(message.chat, 'username') and message.chat.username else str(message.chat.id)
-                    save_to_database(name, content_type, season_num, episode_num, message.id, channel_id)
+                    logger.debug("تم التعرف على %s: %s - الموسم %s الحلقة %s", content_type, name, season_num, episode_num)
+                    with handler_scope("worker.live"):
+                        save_to_database(name, content_type, season_num, episode_num, message.id, channel_id)
+                else:
+                    PARSE_FAILURES.inc()
+                    logger.warning(f"⚠️ لم يتم تحليل الرسالة {message.id}: {message.text[:50]}")
+                    with handler_scope("worker.live"):
+                        save_unparsed_batch([(channel_id, message.id, message.text)])
+            finally:
+                WORKER_QUEUE_DEPTH.labels("live").dec()
         
         # مراقبة حذف الرسائل من جميع القنوات
         @client.on(events.MessageDeleted(chats=channel_entities))
+        @profiled("worker.delete")
         async def delete_handler(event):
+            if event.chat_id is not None and event.chat_id not in owned_peers:
+                return
             # لسنا متأكدين من القناة التي حدث فيها الحذف، لذا نستخدم الدالة القديمة (بدون channel_id)
             # ولكن يمكن تحسين ذلك إذا أمكن الحصول على القناة من الحدث
-            for msg_id in event.deleted_ids:
-                print(f"🗑️ تم حذف رسالة: {msg_id}")
-                # نمرر None للـ channel_id، وستبحث الدالة عن أي حلقة بهذا المعرف
-                delete_from_database(msg_id, None)
+            with handler_scope("worker.delete"):
+                for msg_id in event.deleted_ids:
+                    logger.debug("🗑️ تم حذف رسالة: %s", msg_id)
+                    # نمرر None للـ channel_id، وستبحث الدالة عن أي حلقة بهذا المعرف
+                    delete_from_database(msg_id, None)
+        
+        # تجديد العقود والقيادة يبدأ قبل أي تعويض طويل حتى لا تنتهي العقود أثناءه
+        if lease_manager is not None:
+            background_tasks.append(asyncio.create_task(
+                maintain_channel_leases(client, lease_manager, channels_by_input, owned_peers)
+            ))
+        if leader is not None:
+            background_tasks.append(asyncio.create_task(maintain_leadership(client, leader, channel_entities, owned_peers)))
         
-        print("\n🎯 جاهز لمراقبة القنوات:")
-        for i, chan in enumerate(channel_entities, 1):
-            print(f"   {i}. {chan.title}")
-        print("   (اضغط Ctrl+C في Railway لإيقاف المراقبة)\n")
+        # المعالجات مسجلة قبل التعويض حتى لا تضيع الرسائل التي تصل أثناءه
+        # تعويض الرسائل الفائتة منذ آخر تشغيل، واستيراد تاريخ القنوات الجديدة إذا كان مفعلاً (مهمة لكل قناة)
+        if not IMPORT_HISTORY:
+            logger.warning("⚠️ استيراد المحتوى القديم معطل.")
+        for channel in owned_channels:
+            start_channel_sync(client, channel, take_over_channel)
+        
+        # حفظ إحصائيات الاستعلامات دورياً ليعرضها أمر /sql_stats في البوت
+        background_tasks.append(asyncio.create_task(flush_sql_stats_periodically()))
+        # تنفيذ طلبات /profile worker... القادمة من البوت
+        background_tasks.append(asyncio.create_task(poll_profile_requests()))
+        if CATCH_UP_SECONDS > 0:
+            background_tasks.append(asyncio.create_task(catch_up_periodically(client, channel_entities, owned_peers)))
+        
+        logger.info(
+            "🎯 جاهز لمراقبة القنوات",
+            extra={"fields": {"channels": [chan.title for chan in channel_entities]}}
+        )
+        worker_ready = True
         
         await client.run_until_disconnected()
         
     except Exception as e:
-        print(f"❌ خطأ في تشغيل الـ Worker: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ خطأ في تشغيل الـ Worker: {e}")
     finally:
+        worker_ready = False
+        stop_channel_syncs()
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        if lease_manager is not None:
+            try:
+                lease_manager.release_all()
+            except Exception as e:
+                logger.warning(f"⚠️ تعذر التخلي عن عقود القنوات: {e}")
+        if leader is not None:
+            try:
+                leader.release()
+            except Exception as e:
+                logger.warning(f"⚠️ تعذر التخلي عن القيادة: {e}")
         await client.disconnect()
-        print("🛑 تم إيقاف مراقبة القنوات.")
+        logger.info("🛑 تم إيقاف مراقبة القنوات.")
 
 # ==============================
 # 7. نقطة دخول البرنامج
 # ==============================
-if __name__ == "__main__":
-    print("🚀 بدء تشغيل Worker لمراقبة قنوات المسلسلات والأفلام...")
-    print(f"📡 عدد القنوات المحددة: {len(CHANNEL_LIST)}")
+def main():
+    parser = argparse.ArgumentParser(description="Worker مراقبة قنوات المسلسلات والأفلام")
+    subparsers = parser.add_subparsers(dest="command")
+    replay_parser = subparsers.add_parser("replay", help="إدخال تصدير قناة من ملف بدون الاتصال بـ Telegram")
+    replay_parser.add_argument("path", help="ملف JSON lines أو result.json من Telegram Desktop")
+    replay_parser.add_argument("--channel", help="معرف القناة في قاعدة البيانات (مثل @ShoofFilm)؛ الافتراضي من الملف "
+                                                 "(لتصدير Telegram Desktop يُحول من ذاكرة القنوات)")
+    subparsers.add_parser("reparse", help="إعادة تحليل الرسائل غير المحللة بالمحلل الحالي")
+    subparsers.add_parser("merge-series", help="دمج المحتويات المكررة حسب المفتاح الموحد للاسم")
+    args = parser.parse_args()
+
+    setup_logging(LOG_LEVEL, json_output=LOG_FORMAT == "json")
+    if args.command is not None:
+        if not DATABASE_URL:
+            logger.error("❌ خطأ: DATABASE_URL غير موجود في متغيرات البيئة!")
+            sys.exit(1)
+        init_database()
+        if args.command == "reparse":
+            reparse_unparsed()
+            return
+        if args.command == "merge-series":
+            merge_duplicate_series()
+            return
+        try:
+            asyncio.run(replay_dump(args.path, args.channel))
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.error(f"❌ فشل إدخال التصدير {args.path}: {e}")
+            sys.exit(1)
+        return
+
+    # تحقق من وجود المتغيرات الأساسية
+    if not all([API_ID, API_HASH, DATABASE_URL, STRING_SESSION]):
+        logger.error("❌ خطأ: واحد أو أكثر من المتغيرات التالية مفقود: API_ID, API_HASH, DATABASE_URL, STRING_SESSION")
+        sys.exit(1)
+
+    logger.info("🚀 بدء تشغيل Worker لمراقبة قنوات المسلسلات والأفلام...")
+    logger.info(f"📡 عدد القنوات المحددة: {len(CHANNEL_LIST)}")
+    # الخادم يبدأ أولاً حتى تُرجع /ready حالة 503 أثناء التهيئة بدلاً من رفض الاتصال
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT, readiness)
+    init_database()
     asyncio.run(monitor_channels())
+
+if __name__ == "__main__":
+    main()